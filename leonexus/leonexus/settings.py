@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 from dotenv import load_dotenv
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 import dj_database_url
 import os
 
@@ -63,6 +64,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover the rest of the stack
+    "listings.instrumentation.InstrumentationMiddleware",
+    "listings.profiling.ProfilingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -77,7 +81,7 @@ MIDDLEWARE = [
 # REST Framework Configuration
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "listings.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
@@ -91,6 +95,22 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 20,
 }
 
+# JSON through orjson (listings.renderers / listings.parsers; requires the
+# `orjson` package, falls back to the stock encoder without it).
+# FAST_JSON=False restores DRF's JSONRenderer and JSONParser.
+FAST_JSON = config("FAST_JSON", default=True, cast=bool)
+JSON_RENDERER = "listings.renderers.ORJSONRenderer" if FAST_JSON else "rest_framework.renderers.JSONRenderer"
+JSON_PARSER = "listings.parsers.ORJSONParser" if FAST_JSON else "rest_framework.parsers.JSONParser"
+REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = [
+    JSON_RENDERER,
+    "rest_framework.renderers.BrowsableAPIRenderer",
+]
+REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"] = [
+    JSON_PARSER,
+    "rest_framework.parsers.FormParser",
+    "rest_framework.parsers.MultiPartParser",
+]
+
 ROOT_URLCONF = "leonexus.urls"
 
 TEMPLATES = [
@@ -114,9 +134,10 @@ WSGI_APPLICATION = "leonexus.wsgi.application"
 AUTH_USER_MODEL = "listings.User"
 
 # Custom Authentication Backend
+# It subclasses ModelBackend and already tries the username, so a plain
+# ModelBackend after it would only repeat the lookup for failed logins
 AUTHENTICATION_BACKENDS = [
     "listings.authentication.EmailOrUsernameModelBackend",
-    "django.contrib.auth.backends.ModelBackend",
 ]
 
 
@@ -125,8 +146,175 @@ AUTHENTICATION_BACKENDS = [
 
 
 # Database Configuration
+# Connections are kept open for DB_CONN_MAX_AGE seconds instead of being
+# opened for every request, and are checked before reuse when
+# DB_CONN_HEALTH_CHECKS is on (a dropped connection then costs a reconnect,
+# not a failed request). Under ASGI, where each request runs in a new thread
+# and so never reuses a persistent connection, set DB_POOL=True to use
+# psycopg 3's connection pool instead (PostgreSQL only; requires the
+# `psycopg[binary,pool]` package). DB_POOL_TIMEOUT is how long a request waits for
+# a free connection before failing; exhaustion shows up in /metrics.
+
+DB_CONN_MAX_AGE = config("DB_CONN_MAX_AGE", default=600, cast=int)
+DB_POOL = config("DB_POOL", default=False, cast=bool)
+
+DATABASES = {
+    "default": dj_database_url.parse(
+        config("DATABASE_URL"),
+        # Pooled connections are returned to the pool after each request
+        conn_max_age=0 if DB_POOL else DB_CONN_MAX_AGE,
+        conn_health_checks=config("DB_CONN_HEALTH_CHECKS", default=True, cast=bool),
+    )
+}
+
+if DB_POOL and DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    # Fail at startup, not on the first request, when only psycopg2 is installed
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            f"DB_POOL=True needs psycopg 3 and its pool ({e.name} is missing); "
+            'install "psycopg[binary,pool]" or unset DB_POOL'
+        ) from e
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": config("DB_POOL_MIN_SIZE", default=2, cast=int),
+        "max_size": config("DB_POOL_MAX_SIZE", default=10, cast=int),
+        "timeout": config("DB_POOL_TIMEOUT", default=10.0, cast=float),
+    }
+
+
+# Cache
+# A shared Redis cache (requires the `redis` package) when REDIS_URL is set,
+# otherwise a per-process local-memory cache
+
+REDIS_URL = config("REDIS_URL", default="")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "leonexus",
+        }
+    }
+# Always per process, whatever "default" is
+CACHES["local"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "leonexus-local",
+    "OPTIONS": {"MAX_ENTRIES": 5000},
+}
+
+# Seconds the /api/dealerships/stats/ snapshot is served from cache
+DEALERSHIP_STATS_CACHE_TTL = config("DEALERSHIP_STATS_CACHE_TTL", default=300, cast=int)
+
+# Seconds before a worker rebuilds its search suggestion index, so listings
+# changed through other workers show up (the index is first built when
+# leonexus.wsgi / leonexus.asgi load)
+SEARCH_SUGGESTIONS_MAX_AGE = config("SEARCH_SUGGESTIONS_MAX_AGE", default=300, cast=int)
+
+
+# Reviews embedded in a car's detail; the full list is paged at
+# /api/cars/<id>/reviews/
+CAR_DETAIL_REVIEWS = config("CAR_DETAIL_REVIEWS", default=5, cast=int)
+
+# A user's favorite car ids are loaded once per request, and only kept
+# across requests in FAVORITES_SHARED_CACHE, a CACHES alias every worker
+# sees (the Redis default cache when REDIS_URL is set): a per-process cache
+# would miss the invalidations made by the other workers
+FAVORITES_SHARED_CACHE = config("FAVORITES_SHARED_CACHE", default="default" if REDIS_URL else "") or None
+# Seconds they stay in that cache (dropped on every change)
+FAVORITES_CACHE_TTL = config("FAVORITES_CACHE_TTL", default=300, cast=int)
+
+
+# Token authentication cache (listings.authentication.TokenCache)
+# TOKEN_AUTH_SHARED_CACHE is a CACHES alias shared by the workers (the Redis
+# default cache when REDIS_URL is set), so logouts, token deletes and
+# deactivations take effect in every worker at once. Without one each worker
+# keeps its own entries, and a revocation only reaches the other workers
+# when their copies expire, so that TTL is kept short
+
+TOKEN_AUTH_SHARED_CACHE = config("TOKEN_AUTH_SHARED_CACHE", default="default" if REDIS_URL else "") or None
+TOKEN_AUTH_CACHE = {
+    "MAX_ENTRIES": config("TOKEN_AUTH_CACHE_MAX_ENTRIES", default=10000, cast=int),
+    "TTL": config("TOKEN_AUTH_CACHE_TTL", default=60 if TOKEN_AUTH_SHARED_CACHE else 5, cast=int),
+    "SHARED_CACHE": TOKEN_AUTH_SHARED_CACHE,
+}
+
+
+# Cached anonymous GET responses (listings.response_cache)
+# On by default only when REDIS_URL gives the workers a shared cache: the
+# per-process fallback only sees writes made by that process, so other
+# workers would keep serving stale responses. RESPONSE_CACHE_ALIAS=local
+# with RESPONSE_CACHE_ENABLED=True opts into that for a single worker
 
-DATABASES = {"default": dj_database_url.parse(config("DATABASE_URL"))}
+RESPONSE_CACHE = {
+    "ENABLED": config("RESPONSE_CACHE_ENABLED", default=bool(REDIS_URL), cast=bool),
+    "CACHE": config("RESPONSE_CACHE_ALIAS", default="default"),
+    "TTL": config("RESPONSE_CACHE_TTL", default=300, cast=int),
+}
+
+
+# Request instrumentation (listings.instrumentation): query counts and
+# DB/serializer/render times per request, aggregated per URL name.
+# Timing headers are added in DEBUG unless INSTRUMENTATION_HEADERS says
+# otherwise; views over their query_budget are logged.
+
+INSTRUMENTATION = {
+    "ENABLED": config("INSTRUMENTATION_ENABLED", default=True, cast=bool),
+    "HEADERS": config("INSTRUMENTATION_HEADERS", default=DEBUG, cast=bool),
+    "NAMESPACES": ["listings"],
+    "ENFORCE_BUDGETS": config("QUERY_BUDGETS_ENFORCED", default=False, cast=bool),
+}
+
+
+# Request profiling (listings.profiling): cProfile stats, sampled stacks and
+# SQL timings of single requests, written under PROFILING_DIR per URL name.
+# Off unless PROFILING_ENABLED; then PROFILING_SAMPLE_RATE of the requests to
+# PROFILING_VIEWS (comma-separated URL names, all if empty) are profiled, and
+# staff can ask for a profile of any request with an X-Profile header
+
+PROFILING = {
+    "ENABLED": config("PROFILING_ENABLED", default=False, cast=bool),
+    "SAMPLE_RATE": config("PROFILING_SAMPLE_RATE", default=0.0, cast=float),
+    "VIEWS": [name for name in config("PROFILING_VIEWS", default="").split(",") if name],
+    "OUTPUT_DIR": config("PROFILING_DIR", default=os.path.join(BASE_DIR, "profiles")),
+}
+
+
+# Prometheus metrics at /metrics (listings.metrics): request latency and
+# query histograms per listings URL name, cache, auth and upload timings.
+# With several worker processes point METRICS_DIR at a directory they share
+# (and empty it on restart); METRICS_TOKEN requires "Authorization: Bearer",
+# and without it /metrics is only served when DEBUG is on
+
+METRICS = {
+    "ENABLED": config("METRICS_ENABLED", default=True, cast=bool),
+    "MULTIPROCESS_DIR": config("METRICS_DIR", default="") or None,
+    "FLUSH_INTERVAL": config("METRICS_FLUSH_INTERVAL", default=5.0, cast=float),
+    "TOKEN": config("METRICS_TOKEN", default="") or None,
+}
+
+
+# Car image uploads (listings.uploads)
+# Uploaded files are staged under STAGING_DIR and pushed to STORAGE by a
+# background thread pool; CAR_IMAGE_UPLOAD_EAGER uploads inside the request
+
+CAR_IMAGE_UPLOADS = {
+    "STORAGE": config("CAR_IMAGE_STORAGE", default="listings.uploads.CloudinaryImageStorage"),
+    "STAGING_DIR": config("CAR_IMAGE_STAGING_DIR", default=os.path.join(BASE_DIR, "media", "staging")),
+    "WORKERS": config("CAR_IMAGE_UPLOAD_WORKERS", default=4, cast=int),
+    "MAX_ATTEMPTS": config("CAR_IMAGE_UPLOAD_MAX_ATTEMPTS", default=3, cast=int),
+    "RETRY_DELAY": config("CAR_IMAGE_UPLOAD_RETRY_DELAY", default=1.0, cast=float),
+    "EAGER": config("CAR_IMAGE_UPLOAD_EAGER", default=False, cast=bool),
+    "STAGED_FILE_MAX_AGE": config("CAR_IMAGE_STAGED_FILE_MAX_AGE", default=3600, cast=int),
+}
 
 
 # Password validation
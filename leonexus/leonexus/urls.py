@@ -18,7 +18,10 @@ from django.contrib import admin
 from django.urls import path
 from django.urls import path, include
 
+from listings.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('listings.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leonexus.settings')
 
 application = get_wsgi_application()
+
+from listings.suggestions import warm_suggestion_index  # noqa: E402
+
+warm_suggestion_index()
@@ -1,6 +1,19 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.cache import caches
+from django.db.models import BooleanField, ExpressionWrapper, Q, Value
+from django.db.models.functions import Upper
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import metrics
 
 User = get_user_model()
 
@@ -14,13 +27,19 @@ class EmailOrUsernameModelBackend(ModelBackend):
         if username is None or password is None:
             return None
         
-        try:
-            # Try to find user by username or email
-            user = User.objects.get(
-                Q(username=username) | Q(email=username)
-            )
-        except User.DoesNotExist:
-
+        start = time.perf_counter()
+        user = self.check_login(username, password)
+        metrics.observe(
+            metrics.login_duration,
+            time.perf_counter() - start,
+            outcome="success" if user is not None else "failure",
+        )
+        return user
+    
+    def check_login(self, username, password):
+        user = self.get_login_user(username)
+        if user is None:
+            # Run the hasher anyway so a miss takes as long as a hit
             User().set_password(password)
             return None
         
@@ -30,8 +49,154 @@ class EmailOrUsernameModelBackend(ModelBackend):
         
         return None
     
+    def get_login_user(self, username):
+        """
+        Resolve the login name with one query over the case-insensitive
+        email index and the unique username. An email match wins over a
+        username match; an email shared by several accounts matches none of
+        them, since there is no telling which one is meant.
+        """
+        # Profiles and token ride along so CustomAuthToken needs no more queries
+        users = User.objects.select_related("dealer_profile", "buyer_profile", "auth_token")
+        if "@" not in username:
+            return users.filter(username=username).first()
+
+        # Spelled out rather than email__iexact, which SQLite runs as an unindexed LIKE
+        email_match = Q(email_upper=Upper(Value(username)))
+        candidates = list(
+            users.alias(email_upper=Upper("email"))
+            .annotate(email_match=ExpressionWrapper(email_match, output_field=BooleanField()))
+            .filter(email_match | Q(username=username))
+            .order_by("pk")[:3]
+        )
+        by_email = [user for user in candidates if user.email_match]
+        if len(by_email) > 1:
+            return None
+        if by_email:
+            return by_email[0]
+        return next((user for user in candidates if user.username == username), None)
+    
     def get_user(self, user_id):
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
             return None
+
+
+class TokenCache:
+    """
+    Token key -> user field values, in a bounded per-process LRU and
+    optionally in a shared Django cache (``TOKEN_AUTH_CACHE["SHARED_CACHE"]``).
+    The password hash is never cached; cached users load it on first access.
+
+    Entries are dropped as soon as a token is deleted or its user is saved
+    (see listings.signals). The per-process LRU can only be cleared in the
+    worker that made the change, so when a shared cache is configured the
+    LRU is off unless ``LOCAL_TTL`` opts into short-lived local hits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def options(self):
+        options = {"MAX_ENTRIES": 10000, "TTL": 60, "LOCAL_TTL": None, "SHARED_CACHE": None}
+        options.update(getattr(settings, "TOKEN_AUTH_CACHE", {}))
+        if options["LOCAL_TTL"] is None:
+            options["LOCAL_TTL"] = 0 if options["SHARED_CACHE"] else options["TTL"]
+        return options
+
+    @staticmethod
+    def cache_key(key):
+        # Never put raw tokens into a shared cache
+        return "authtoken:v2:" + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        options = self.options
+        if options["LOCAL_TTL"]:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    values, expires = entry
+                    if expires > time.monotonic():
+                        self._entries.move_to_end(key)
+                        return self._build_user(values)
+                    del self._entries[key]
+
+        if options["SHARED_CACHE"]:
+            values = caches[options["SHARED_CACHE"]].get(self.cache_key(key))
+            if values is not None:
+                self._remember(key, values, options)
+                return self._build_user(values)
+        return None
+
+    def set(self, key, user):
+        options = self.options
+        values = tuple(getattr(user, name) for name in cached_user_fields())
+        if options["SHARED_CACHE"]:
+            caches[options["SHARED_CACHE"]].set(self.cache_key(key), values, options["TTL"])
+        self._remember(key, values, options)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        shared = self.options["SHARED_CACHE"]
+        if shared:
+            caches[shared].delete(self.cache_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, values, options):
+        if not options["LOCAL_TTL"]:
+            return
+        with self._lock:
+            self._entries[key] = (values, time.monotonic() + options["LOCAL_TTL"])
+            self._entries.move_to_end(key)
+            while len(self._entries) > options["MAX_ENTRIES"]:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _build_user(values):
+        # A fresh instance per request, so cached relations never leak
+        return User.from_db("default", cached_user_fields(), values)
+
+
+def cached_user_fields():
+    """Every concrete User column but the password hash, which stays deferred"""
+    return [field.attname for field in User._meta.concrete_fields if field.attname != "password"]
+
+
+token_cache = TokenCache()
+
+
+def invalidate_user_tokens(user_id):
+    """Drop the cached tokens of a user, e.g. after deactivation"""
+    for key in Token.objects.filter(user_id=user_id).values_list("key", flat=True):
+        token_cache.delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that serves repeat lookups from ``token_cache``
+    instead of querying authtoken_token joined to the user on every request.
+    """
+
+    def authenticate_credentials(self, key):
+        start = time.perf_counter()
+        user = token_cache.get(key)
+        if user is not None and user.is_active:
+            metrics.observe(metrics.token_auth_duration, time.perf_counter() - start, source="cache")
+            # Unsaved stand-in; only .key and .user are ever read from request.auth
+            return user, Token(key=key, user=user)
+
+        try:
+            user, token = super().authenticate_credentials(key)
+        except exceptions.AuthenticationFailed:
+            metrics.observe(metrics.token_auth_duration, time.perf_counter() - start, source="failed")
+            raise
+        token_cache.set(key, user)
+        metrics.observe(metrics.token_auth_duration, time.perf_counter() - start, source="database")
+        return user, token
@@ -0,0 +1,389 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+"""
+
+import random
+import time
+
+from django.db import transaction
+from django.db.models import Q
+
+MAKES = {
+    "Toyota": ["Corolla", "Land Cruiser", "Prado", "Hilux", "RAV4", "Harrier"],
+    "Nissan": ["X-Trail", "Note", "Navara", "Patrol", "Leaf"],
+    "Mazda": ["CX-5", "Demio", "Atenza", "BT-50"],
+    "Subaru": ["Forester", "Outback", "Impreza", "XV"],
+    "Mercedes-Benz": ["C200", "E250", "GLE", "G-Class"],
+    "BMW": ["X3", "X5", "320i", "520d"],
+    "Volkswagen": ["Golf", "Tiguan", "Polo", "Touareg"],
+    "Honda": ["Fit", "CR-V", "Vezel", "Civic"],
+    "Land Rover": ["Defender", "Discovery", "Range Rover Sport"],
+    "Mitsubishi": ["Outlander", "Pajero", "L200"],
+}
+LOCATIONS = [
+    "Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Thika",
+    "Nyeri", "Machakos", "Malindi", "Naivasha", "Kitale", "Meru",
+]
+CONDITIONS = ["New", "Foreign Used", "Locally Used"]
+SPECIALTIES = [
+    "SUVs", "Luxury", "Electric", "Hybrid", "Pickups", "Vans", "Imports",
+    "Financing", "Trade-ins", "Classic cars", "Sports cars", "Commercial",
+]
+DESCRIPTION_WORDS = [
+    "clean", "accident-free", "low", "mileage", "leather", "sunroof",
+    "navigation", "reverse", "camera", "alloy", "wheels", "service",
+    "history", "warranty", "spacious", "fuel", "efficient", "4WD",
+    "turbo", "cruise", "control", "bluetooth", "keyless", "entry",
+]
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Latency summary (in milliseconds) of a list of millisecond samples"""
+    return {
+        "runs": len(samples),
+        "mean_ms": sum(samples) / len(samples) if samples else 0.0,
+        "min_ms": min(samples, default=0.0),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples, default=0.0),
+    }
+
+
+def measure(func, repeat=20, warmup=2):
+    """Call ``func`` repeatedly and summarize its wall-clock latency"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def bench_dealer():
+    """Dealer that owns the synthetic benchmark listings"""
+    from .models import Dealer, User
+
+    user, _ = User.objects.get_or_create(
+        username="bench-dealer",
+        defaults={"email": "bench-dealer@example.com", "role": "DEALER"},
+    )
+    dealer, _ = Dealer.objects.get_or_create(
+        user=user,
+        defaults={"first_name": "Bench", "last_name": "Dealer", "phone": "0700000000"},
+    )
+    return dealer
+
+
+def seed_cars(count, seed=0, batch_size=5000):
+    """Insert ``count`` synthetic published cars and reindex search"""
+    from . import search
+    from .models import Car
+
+    rng = random.Random(seed)
+    dealer = bench_dealer()
+    makes = list(MAKES)
+    with transaction.atomic():
+        for start in range(0, count, batch_size):
+            cars = []
+            for _ in range(min(batch_size, count - start)):
+                make = rng.choice(makes)
+                model = rng.choice(MAKES[make])
+                year = rng.randint(2020, 2025)
+                location = rng.choice(LOCATIONS)
+                cars.append(Car(
+                    dealer=dealer,
+                    title=f"{year} {make} {model}",
+                    make=make,
+                    model=model,
+                    location=location,
+                    year=year,
+                    price=rng.randrange(800_000, 25_000_000, 5_000),
+                    mileage=rng.randrange(0, 150_000, 100),
+                    transmission=rng.choice(Car.TRANSMISSION_CHOICES)[0],
+                    fuel_type=rng.choice(Car.FUEL_CHOICES)[0],
+                    condition=rng.choice(CONDITIONS),
+                    description=" ".join(rng.choices(DESCRIPTION_WORDS, k=30)),
+                    published=True,
+                ))
+            Car.objects.bulk_create(cars)
+        search.rebuild_index()
+
+
+def seed_dealerships(count, seed=0, batch_size=2000):
+    """Insert ``count`` dealer users, dealers and dealerships"""
+    from .models import Dealer, Dealership, User
+
+    rng = random.Random(seed)
+    offset = User.objects.filter(username__startswith="bench-dealership-").count()
+    with transaction.atomic():
+        for start in range(offset, offset + count, batch_size):
+            stop = min(start + batch_size, offset + count)
+            users = User.objects.bulk_create(
+                User(
+                    username=f"bench-dealership-{index}",
+                    email=f"bench-dealership-{index}@example.com",
+                    password="!",
+                    role="DEALER",
+                )
+                for index in range(start, stop)
+            )
+            dealers = Dealer.objects.bulk_create(
+                Dealer(user=user, first_name="Bench", last_name=user.username, phone="0700000000")
+                for user in users
+            )
+            Dealership.objects.bulk_create(
+                Dealership(
+                    dealer=dealer,
+                    name=f"{dealer.last_name} Motors",
+                    specialties=rng.sample(SPECIALTIES, k=rng.randint(1, 4)),
+                    is_verified=rng.random() < 0.3,
+                    published=rng.random() < 0.8,
+                    total_cars=rng.randint(0, 200),
+                )
+                for dealer in dealers
+            )
+
+
+# Synthetic marketplace (seed_marketplace); every seeded user's username
+# starts with SEED_PREFIX so the data can be told apart and removed
+SEED_PREFIX = "seed-"
+CATEGORIES = ["SUV", "Sedan", "Hatchback", "Pickup", "Van", "Coupe", "Wagon", "Electric"]
+CARS_PER_DEALER = 40
+CARS_PER_BUYER = 5
+REVIEW_WEIGHTS = [30, 20, 15, 12, 10, 6, 4, 2, 1]  # by reviews per car, 0..8
+RATING_WEIGHTS = [5, 8, 17, 35, 35]  # by stars, 1..5
+FAVORITE_WEIGHTS = [25, 20, 15, 12, 10, 8, 5, 3, 2]  # by favorites per buyer, 0..8
+
+
+def seed_users(role, count, batch_size):
+    """bulk_create ``count`` seed users of ``role``; returns them with ids"""
+    from .models import User
+
+    users = []
+    label = role.lower()
+    for start in range(0, count, batch_size):
+        users += User.objects.bulk_create(
+            User(
+                username=f"{SEED_PREFIX}{label}-{index}",
+                email=f"{SEED_PREFIX}{label}-{index}@example.com",
+                password="!",
+                role=role,
+            )
+            for index in range(start, min(start + batch_size, count))
+        )
+    return users
+
+
+def seed_marketplace(cars, seed=0, batch_size=5000, log=None):
+    """
+    Insert a deterministic marketplace of ``cars`` listings: dealers with
+    dealerships, buyers, categories, images, reviews and favorites, all
+    through ``bulk_create``. Image values are ``car_images/...`` public ids
+    as LocalImageStorage writes them, so no upload service is involved.
+    Ratings are filled in as the reviews are generated; the search index
+    and dealership rollups are rebuilt once at the end. Returns row counts.
+    """
+    from . import search
+    from .models import Buyer, Car, CarImage, Category, Dealer, Dealership, Favorite, Review
+    from .response_cache import response_cache
+    from .rollups import refresh_dealership_rollups
+    from .signals import RESPONSE_CACHE_NAMESPACES
+    from .stats import invalidate_dealership_stats
+    from .suggestions import suggestion_index
+
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    counts = dict.fromkeys(["dealers", "buyers", "cars", "images", "reviews", "favorites"], 0)
+
+    with transaction.atomic():
+        categories = [
+            Category.objects.get_or_create(slug=name.lower(), defaults={"name": name})[0]
+            for name in CATEGORIES
+        ]
+
+        dealer_count = max(1, cars // CARS_PER_DEALER)
+        dealers = []
+        users = seed_users("DEALER", dealer_count, batch_size)
+        for start in range(0, dealer_count, batch_size):
+            batch = Dealer.objects.bulk_create(
+                Dealer(user=user, first_name="Seed", last_name=user.username, phone="0700000000",
+                       address=rng.choice(LOCATIONS))
+                for user in users[start:start + batch_size]
+            )
+            Dealership.objects.bulk_create(
+                Dealership(
+                    dealer=dealer,
+                    name=f"{dealer.last_name} Motors",
+                    specialties=rng.sample(SPECIALTIES, k=rng.randint(1, 4)),
+                    is_verified=rng.random() < 0.3,
+                    published=rng.random() < 0.85,
+                )
+                for dealer in batch
+            )
+            dealers += batch
+        counts["dealers"] = len(dealers)
+        log(f"{len(dealers)} dealers")
+
+        buyer_count = max(1, cars // CARS_PER_BUYER)
+        users = seed_users("BUYER", buyer_count, batch_size)
+        for start in range(0, buyer_count, batch_size):
+            Buyer.objects.bulk_create(
+                Buyer(user=user, first_name="Seed", last_name=user.username)
+                for user in users[start:start + batch_size]
+            )
+        buyer_ids = [user.pk for user in users]
+        del users
+        counts["buyers"] = len(buyer_ids)
+        log(f"{len(buyer_ids)} buyers")
+
+        # A few dealers hold most of the stock, as in the real catalog
+        dealer_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(dealers))]
+        makes = list(MAKES)
+        car_ids = []
+        for start in range(0, cars, batch_size):
+            size = min(batch_size, cars - start)
+            owners = rng.choices(dealers, weights=dealer_weights, k=size)
+            batch, batch_reviews = [], []
+            for offset, dealer in enumerate(owners):
+                make = rng.choice(makes)
+                model = rng.choice(MAKES[make])
+                year = rng.randint(2020, 2025)
+                reviewers = rng.sample(
+                    buyer_ids,
+                    min(len(buyer_ids), rng.choices(range(len(REVIEW_WEIGHTS)), REVIEW_WEIGHTS)[0]),
+                )
+                ratings = rng.choices(range(1, 6), RATING_WEIGHTS, k=len(reviewers))
+                car = Car(
+                    dealer=dealer,
+                    category=rng.choice(categories) if rng.random() < 0.9 else None,
+                    title=f"{year} {make} {model}",
+                    make=make,
+                    model=model,
+                    location=rng.choice(LOCATIONS),
+                    year=year,
+                    price=rng.randrange(800_000, 25_000_000, 5_000),
+                    mileage=rng.randrange(0, 150_000, 100),
+                    transmission=rng.choice(Car.TRANSMISSION_CHOICES)[0],
+                    fuel_type=rng.choice(Car.FUEL_CHOICES)[0],
+                    condition=rng.choice(CONDITIONS),
+                    description=" ".join(rng.choices(DESCRIPTION_WORDS, k=30)),
+                    published=rng.random() < 0.9,
+                    stock_number=f"SEED-{start + offset}",
+                    rating_sum=sum(ratings),
+                    rating_count=len(ratings),
+                    rating_average=sum(ratings) / len(ratings) if ratings else 0.0,
+                    **{f"rating_{stars}_count": ratings.count(stars) for stars in range(1, 6)},
+                )
+                batch.append(car)
+                batch_reviews.append(list(zip(reviewers, ratings)))
+
+            batch = Car.objects.bulk_create(batch)
+            images = CarImage.objects.bulk_create(
+                CarImage(car=car, image=f"car_images/seed-{car.pk}-{order}", order=order)
+                for car in batch
+                for order in range(rng.randint(1, 4))
+            )
+            reviews = Review.objects.bulk_create(
+                Review(car=car, user_id=user_id, rating=rating,
+                       comment=" ".join(rng.choices(DESCRIPTION_WORDS, k=8)))
+                for car, car_reviews in zip(batch, batch_reviews)
+                for user_id, rating in car_reviews
+            )
+            car_ids += [car.pk for car in batch]
+            counts["images"] += len(images)
+            counts["reviews"] += len(reviews)
+            log(f"{len(car_ids)} cars")
+        counts["cars"] = len(car_ids)
+
+        for start in range(0, len(buyer_ids), batch_size):
+            favorites = Favorite.objects.bulk_create(
+                Favorite(user_id=user_id, car_id=car_id)
+                for user_id in buyer_ids[start:start + batch_size]
+                for car_id in rng.sample(
+                    car_ids,
+                    min(len(car_ids), rng.choices(range(len(FAVORITE_WEIGHTS)), FAVORITE_WEIGHTS)[0]),
+                )
+            )
+            counts["favorites"] += len(favorites)
+        log(f"{counts['favorites']} favorites")
+
+        search.rebuild_index()
+        # Only the new dealerships have stock to roll up
+        dealer_ids = [dealer.pk for dealer in dealers]
+        for start in range(0, len(dealer_ids), batch_size):
+            refresh_dealership_rollups(dealer_ids[start:start + batch_size])
+
+    suggestion_index.invalidate()
+    invalidate_dealership_stats()
+    response_cache.bump(*RESPONSE_CACHE_NAMESPACES.values())
+    return counts
+
+
+def delete_seed_marketplace():
+    """
+    Remove everything seed_marketplace created. The rows go with raw deletes,
+    since per-row signals would take far longer than the seeding did, so
+    everything those signals maintain is refreshed here instead.
+    """
+    from rest_framework.authtoken.models import Token
+
+    from . import search
+    from .authentication import token_cache
+    from .bulk import refresh_after_car_writes
+    from .favorites import invalidate_favorites
+    from .models import Buyer, Car, CarImage, Dealer, Dealership, Favorite, Review, User
+    from .ratings import rebuild_car_ratings
+    from .response_cache import response_cache
+    from .rollups import rebuild_dealership_rollups
+    from .signals import RESPONSE_CACHE_NAMESPACES
+    from .stats import invalidate_dealership_stats
+
+    users = User.objects.filter(username__startswith=SEED_PREFIX)
+    cars = Car.objects.filter(dealer__user__in=users)
+    with transaction.atomic():
+        # Rows outside the seed that render or count seeded ones
+        reviewed = list(
+            Car.objects.filter(reviews__user__in=users).exclude(pk__in=cars)
+            .values_list("pk", "dealer_id").distinct()
+        )
+        favorited_by = set(
+            Favorite.objects.filter(car__in=cars).exclude(user__in=users).values_list("user_id", flat=True)
+        )
+        token_keys = list(Token.objects.filter(user__in=users).values_list("key", flat=True))
+
+        for queryset in (
+            Favorite.objects.filter(Q(user__in=users) | Q(car__in=cars)),
+            Review.objects.filter(Q(user__in=users) | Q(car__in=cars)),
+            CarImage.objects.filter(car__in=cars),
+            cars,
+            Dealership.objects.filter(dealer__user__in=users),
+            Dealer.objects.filter(user__in=users),
+            Buyer.objects.filter(user__in=users),
+            Token.objects.filter(user__in=users),
+            users,
+        ):
+            queryset._raw_delete(queryset.db)
+        search.rebuild_index()
+        # Also moves updated_at, so those cars get a new ETag
+        rebuild_car_ratings([car_id for car_id, _ in reviewed])
+        rebuild_dealership_rollups()
+        refresh_after_car_writes({dealer_id for _, dealer_id in reviewed})
+
+    for key in token_keys:
+        token_cache.delete(key)
+    for user_id in favorited_by:
+        invalidate_favorites(user_id)
+    invalidate_dealership_stats()
+    response_cache.bump(*RESPONSE_CACHE_NAMESPACES.values())
@@ -0,0 +1,50 @@
+"""
+Bulk writes of existing cars that skip ``bulk_update``'s CASE per field and
+row, used by the CSV/NDJSON import and the rating aggregates. Like any
+queryset write they send no signals; ``refresh_after_car_writes`` catches up
+with what the Car signals maintain.
+"""
+
+from django.db import connections
+from django.utils import timezone
+
+
+def update_cars(cars, fields):
+    """Write ``fields`` of existing ``cars`` with one prepared UPDATE"""
+    from .models import Car
+
+    connection = connections[Car.objects.db]
+    quote = connection.ops.quote_name
+    model_fields = [Car._meta.get_field(name) for name in fields]
+    assignments = ", ".join(f"{quote(field.column)} = %s" for field in model_fields)
+    sql = f"UPDATE {quote(Car._meta.db_table)} SET {assignments} WHERE {quote(Car._meta.pk.column)} = %s"
+    params = [
+        [field.get_db_prep_save(field.pre_save(car, False), connection) for field in model_fields]
+        + [car.pk]
+        for car in cars
+    ]
+    if params:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+def refresh_after_car_writes(dealer_ids):
+    """
+    Refresh what the Car signals would have after cars of ``dealer_ids`` were
+    created, updated or deleted around them: the dealerships' rollups, the
+    dealers' and categories' ``updated_at`` (ETags of their published car
+    counts), the suggestion index and the cached car responses.
+    """
+    from .models import Category, Dealer
+    from .response_cache import response_cache
+    from .rollups import refresh_dealership_rollups
+    from .suggestions import suggestion_index
+
+    dealer_ids = set(dealer_ids)
+    refresh_dealership_rollups(dealer_ids)
+    now = timezone.now()
+    Dealer.objects.filter(pk__in=dealer_ids).update(updated_at=now)
+    # The table of categories is small enough to touch whole
+    Category.objects.update(updated_at=now)
+    suggestion_index.invalidate()
+    response_cache.bump("car")
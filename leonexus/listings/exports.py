@@ -0,0 +1,118 @@
+"""
+Streaming CSV / NDJSON exports of car inventory.
+
+Rows come from ``values_list()`` over ``iterator(chunk_size=...)`` (a
+server-side cursor on PostgreSQL), are encoded ``EXPORT_CHUNK_SIZE`` at a
+time and written straight to a ``StreamingHttpResponse``, optionally gzip
+compressed. No model instances are built and memory stays flat whatever
+the size of the catalog.
+"""
+
+import csv
+import io
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Column name -> queryset lookup
+EXPORT_COLUMNS = {
+    "id": "id",
+    "stock_number": "stock_number",
+    "dealer_id": "dealer_id",
+    "title": "title",
+    "make": "make",
+    "model": "model",
+    "year": "year",
+    "price": "price",
+    "mileage": "mileage",
+    "location": "location",
+    "transmission": "transmission",
+    "fuel_type": "fuel_type",
+    "condition": "condition",
+    "category": "category__slug",
+    "published": "published",
+    "created_at": "created_at",
+}
+
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Tuples of ``EXPORT_COLUMNS`` values, ``chunk_size`` rows per fetch"""
+    return queryset.values_list(*EXPORT_COLUMNS.values()).iterator(chunk_size=chunk_size)
+
+
+def encode_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def encode_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    columns = list(EXPORT_COLUMNS)
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(columns, row))))
+        if len(lines) == chunk_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson}
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    """True if Accept-Encoding allows gzip, by name or ``*``, with a q-value above 0"""
+    qualities = {}
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def export_response(request, queryset, export_format, filename):
+    """Stream ``queryset`` as ``export_format``, gzipped if the client accepts it"""
+    chunks = ENCODERS[export_format](export_rows(queryset))
+    compress = accepts_gzip(request)
+    if compress:
+        chunks = gzip_chunks(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[export_format])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{export_format}"'
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
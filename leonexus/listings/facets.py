@@ -0,0 +1,83 @@
+"""
+Facet counts for the car filters, computed in one query.
+
+Each facet is a ``GROUP BY`` over the filtered queryset; the facets are
+glued together with ``UNION ALL`` into a single statement whose rows are
+``(facet, value, count)``, so the UI gets every count for the current
+filter set in one round trip.
+"""
+
+from django.db.models import Case, CharField, Count, F, Value, When
+from django.db.models.functions import Cast
+
+# (min, max) in KES; max is exclusive, None means unbounded
+PRICE_BUCKETS = [
+    (0, 1_000_000),
+    (1_000_000, 2_500_000),
+    (2_500_000, 5_000_000),
+    (5_000_000, 10_000_000),
+    (10_000_000, 20_000_000),
+    (20_000_000, None),
+]
+
+# Facet name -> Car field whose values are the filter values
+FIELD_FACETS = {
+    "make": "make",
+    "model": "model",
+    "fuel_type": "fuel_type",
+    "transmission": "transmission",
+    "category": "category_id",
+    "year": "year",
+}
+
+
+def price_bucket():
+    """Index of the ``PRICE_BUCKETS`` entry a car's price falls in"""
+    return Case(
+        *(
+            When(price__gte=low, **({"price__lt": high} if high is not None else {}), then=Value(str(index)))
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ),
+        output_field=CharField(),
+    )
+
+
+def facet_query(queryset, facet, key):
+    return (
+        queryset.annotate(facet=Value(facet, output_field=CharField()), key=key)
+        .values("facet", "key")
+        .annotate(count=Count("pk"))
+        .values_list("facet", "key", "count")
+    )
+
+
+def compute_facets(queryset):
+    """
+    ``{"total": n, facet: [{"value": ..., "count": n}, ...]}`` for the cars
+    in ``queryset``; ``price`` entries carry ``min``/``max`` instead.
+    """
+    queryset = queryset.order_by()
+    parts = [
+        facet_query(queryset, facet, Cast(F(field), output_field=CharField()))
+        for facet, field in FIELD_FACETS.items()
+    ]
+    parts.append(facet_query(queryset, "price", price_bucket()))
+    parts.append(facet_query(queryset, "total", Value("", output_field=CharField())))
+
+    facets = {facet: [] for facet in FIELD_FACETS}
+    facets["price"] = [
+        {"min": low, "max": high, "count": 0} for low, high in PRICE_BUCKETS
+    ]
+    total = 0
+    for facet, key, count in parts[0].union(*parts[1:], all=True):
+        if facet == "total":
+            total = count
+        elif facet == "price":
+            facets["price"][int(key)]["count"] = count
+        elif key not in (None, ""):
+            value = int(key) if facet in ("category", "year") else key
+            facets[facet].append({"value": value, "count": count})
+
+    for facet in FIELD_FACETS:
+        facets[facet].sort(key=lambda entry: (-entry["count"], entry["value"]))
+    return {"total": total, **facets}
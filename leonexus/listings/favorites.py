@@ -0,0 +1,65 @@
+"""
+Per-user set of favorited car ids.
+
+Loaded at most once per request, so serializers can mark favorites on any
+number of cars without a query per car. With ``FAVORITES_SHARED_CACHE``
+set the set is also cached across requests for ``FAVORITES_CACHE_TTL``
+seconds, and the Favorite signals drop a user's entry whenever one of their
+favorites is added or removed. Without a cache shared by every worker that
+entry could outlive a change made through another worker, so sets are then
+only memoized per request.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+REQUEST_ATTRIBUTE = "_favorite_car_ids"
+
+
+def cache_key(user_id):
+    return f"listings:favorites:{user_id}"
+
+
+def shared_cache():
+    """The cache that keeps favorite sets across requests, or None"""
+    alias = getattr(settings, "FAVORITES_SHARED_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def favorite_car_ids(request):
+    """frozenset of car ids the request's user has favorited (empty if anonymous)"""
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+
+    car_ids = getattr(request, REQUEST_ATTRIBUTE, None)
+    if car_ids is None:
+        cache = shared_cache()
+        key = cache_key(request.user.pk)
+        if cache is not None:
+            car_ids = cache.get(key)
+        if car_ids is None:
+            from .models import Favorite
+
+            car_ids = frozenset(
+                Favorite.objects.filter(user_id=request.user.pk).values_list("car_id", flat=True)
+            )
+            if cache is not None:
+                cache.set(key, car_ids, getattr(settings, "FAVORITES_CACHE_TTL", 300))
+        setattr(request, REQUEST_ATTRIBUTE, car_ids)
+    return car_ids
+
+
+def favorites_fingerprint(request):
+    """Short digest of the favorite set, for ETags of views that render it"""
+    car_ids = ",".join(map(str, sorted(favorite_car_ids(request))))
+    return hashlib.sha1(car_ids.encode()).hexdigest()[:16]
+
+
+def invalidate_favorites(user_id, request=None):
+    cache = shared_cache()
+    if cache is not None:
+        cache.delete(cache_key(user_id))
+    if request is not None and hasattr(request, REQUEST_ATTRIBUTE):
+        delattr(request, REQUEST_ATTRIBUTE)
@@ -0,0 +1,85 @@
+"""
+Sparse fieldsets for the car serializers.
+
+``?fields=title,price,primary_image`` keeps only the named top-level fields;
+``?expand=dealer`` nests only the named relations in full and renders the
+other ones as their id. Without the parameters every field is rendered and
+every relation expanded, as before. The views build their querysets from
+the same ``Fieldset``, so joins, prefetches and annotations behind fields
+that are not rendered are never run.
+"""
+
+from rest_framework import serializers
+
+FIELDS_PARAM = "fields"
+EXPAND_PARAM = "expand"
+
+
+def parse_names(value):
+    """Set of the comma-separated names in ``value``, or None if it is absent"""
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+class Fieldset:
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(
+            fields=parse_names(request.query_params.get(FIELDS_PARAM)),
+            expand=parse_names(request.query_params.get(EXPAND_PARAM)),
+        )
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        """True if ``name`` is rendered as a nested object"""
+        return self.includes(name) and (self.expand is None or name in self.expand)
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Takes a ``fieldset`` keyword (also passed to the child of a ``many=True``
+    serializer). Relations named in ``Meta.expandable_fields`` collapse to a
+    primary key when they are not expanded.
+    """
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        self.fieldset = fieldset
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset is None:
+            return fields
+
+        expandable = getattr(self.Meta, "expandable_fields", ())
+        for name in list(fields):
+            if not self.fieldset.includes(name):
+                del fields[name]
+            elif name in expandable and not self.fieldset.expands(name):
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return fields
+
+
+class SparseFieldsetMixin:
+    """View side: parses the request's fieldset and hands it to GET serializers"""
+
+    @property
+    def fieldset(self):
+        if not hasattr(self, "_fieldset"):
+            self._fieldset = Fieldset.from_request(self.request)
+        return self._fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        if self.request.method in ("GET", "HEAD") and issubclass(
+            serializer_class, SparseFieldsetSerializerMixin
+        ):
+            kwargs.setdefault("fieldset", self.fieldset)
+        return super().get_serializer(*args, **kwargs)
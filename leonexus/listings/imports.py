@@ -0,0 +1,173 @@
+"""
+Bulk inventory import for dealers.
+
+Rows are read one at a time from a CSV or NDJSON stream, validated with
+``CarImportRowSerializer`` and written in batches of ``IMPORT_BATCH_SIZE``,
+each in its own transaction. One query per batch finds which stock numbers
+the dealer already has; new cars go through ``bulk_create`` and known ones
+through one ``executemany`` UPDATE per set of columns present (a row only
+overwrites the fields it carries, so omitted optional columns keep their
+values). ``bulk_update`` would build a CASE per field and row, which costs
+more than the writes themselves.
+Bulk writes skip the Car signals, so the search index is refreshed per
+batch and the dealership rollups, suggestions, cached responses and the
+dealer and category ``updated_at`` (ETags) once at the end.
+
+Memory is bounded by the batch size and ``MAX_REPORTED_ERRORS``.
+"""
+
+import codecs
+import csv
+import json
+
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+from . import search
+from .bulk import refresh_after_car_writes, update_cars
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ("csv", "ndjson")
+
+
+def decoded_lines(stream):
+    return codecs.iterdecode(stream, "utf-8-sig")
+
+
+def csv_rows(stream):
+    """``(line, row, error)`` for each record; blank cells are dropped"""
+    reader = csv.DictReader(decoded_lines(stream))
+    for record in reader:
+        row = {}
+        for key, value in record.items():
+            # Extra cells land under a None key
+            if not isinstance(key, str) or not isinstance(value, str):
+                continue
+            value = value.strip()
+            if value:
+                row[key.strip()] = value
+        yield reader.line_num, row, None
+
+
+def ndjson_rows(stream):
+    """``(line, row, error)`` for each non-empty line"""
+    for number, line in enumerate(decoded_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON."
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Each line must be a JSON object."
+            continue
+        yield number, row, None
+
+
+ROW_READERS = {"csv": csv_rows, "ndjson": ndjson_rows}
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def preload_categories():
+    """Categories keyed by id and by lower-cased slug"""
+    from .models import Category
+
+    categories = {}
+    for category in Category.objects.all():
+        categories[str(category.pk)] = category
+        categories[category.slug.lower()] = category
+    return categories
+
+
+def write_batch(dealer, rows, fields, report):
+    """Upsert ``{stock_number: (line, validated_data)}`` in one transaction"""
+    from .models import Car
+
+    try:
+        with transaction.atomic():
+            existing = dict(
+                Car.objects.filter(dealer=dealer, stock_number__in=list(rows))
+                .values_list("stock_number", "pk")
+            )
+            created, updated = [], {}
+            for stock_number, (_, data) in rows.items():
+                car = Car(dealer=dealer, **data)
+                if stock_number in existing:
+                    car.pk = existing[stock_number]
+                    # Rows usually share their columns, so this is one group
+                    present = tuple(name for name in fields if name in data or name == "updated_at")
+                    updated.setdefault(present, []).append(car)
+                else:
+                    created.append(car)
+            Car.objects.bulk_create(created)
+            for present, cars in updated.items():
+                update_cars(cars, present)
+            updated = [car for cars in updated.values() for car in cars]
+            search.index_cars([car.pk for car in created + updated])
+    except IntegrityError:
+        # Another import added one of these stock numbers meanwhile
+        for line, _ in rows.values():
+            report.add_error(line, {"non_field_errors": ["Could not be saved, retry the import."]})
+        return
+    report.created += len(created)
+    report.updated += len(updated)
+
+
+def import_cars(dealer, stream, format, batch_size=IMPORT_BATCH_SIZE):
+    """Import the cars in ``stream`` for ``dealer``; returns the report dict"""
+    from .serializers import CarImportRowSerializer
+
+    serializer = CarImportRowSerializer(context={"categories": preload_categories()})
+    fields = [name for name in CarImportRowSerializer.Meta.fields if name != "stock_number"]
+    fields.append("updated_at")
+    report = ImportReport()
+    batch = {}
+
+    try:
+        for line, row, error in ROW_READERS[format](stream):
+            if error:
+                report.add_error(line, {"non_field_errors": [error]})
+                continue
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as exc:
+                report.add_error(line, exc.detail)
+                continue
+            stock_number = data["stock_number"]
+            # A repeated stock number goes to the next batch so the later row wins
+            if stock_number in batch or len(batch) >= batch_size:
+                write_batch(dealer, batch, fields, report)
+                batch = {}
+            batch[stock_number] = (line, data)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        report.add_error(None, {"non_field_errors": [f"Could not read the file: {exc}"]})
+
+    if batch:
+        write_batch(dealer, batch, fields, report)
+    if report.created or report.updated:
+        refresh_after_car_writes([dealer.pk])
+    return report.as_dict()
@@ -0,0 +1,267 @@
+"""
+Per-request instrumentation of the API.
+
+``InstrumentationMiddleware`` counts the queries of every request and times
+them with a database execute wrapper, and times serialization (serializers
+using ``TimedRepresentationMixin``) and rendering. Requests to the
+namespaces in ``NAMESPACES`` are aggregated per URL name
+(``listings:car-list-create``) in this process; see
+``endpoint_stats.snapshot()``.
+
+Views declare the queries a request may run with a ``query_budget``
+attribute (``@query_budget(n)`` on function views). Budgets of views that
+need a user include the token lookup of a token cache miss and assume no
+cache shared between workers. Requests over budget
+are logged, and raise ``QueryBudgetExceeded`` when ``ENFORCE_BUDGETS`` is
+on, which turns every over-budget request made by the test suite into an
+error.
+
+Options come from ``settings.INSTRUMENTATION``:
+
+``ENABLED``          turn the middleware into a pass-through
+``HEADERS``          add ``X-DB-Queries``, ``X-DB-Time``, ... and
+                     ``Server-Timing`` to responses (defaults to DEBUG)
+``NAMESPACES``       URL namespaces aggregated per URL name
+``ENFORCE_BUDGETS``  raise instead of logging when a budget is exceeded
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import ListSerializer
+
+from . import metrics as prometheus
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "HEADERS": None,
+    "NAMESPACES": ["listings"],
+    "ENFORCE_BUDGETS": False,
+}
+
+
+def get_option(name):
+    value = getattr(settings, "INSTRUMENTATION", {}).get(name, DEFAULTS[name])
+    if name == "HEADERS" and value is None:
+        return settings.DEBUG
+    return value
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    """What one request spent; times are in seconds"""
+
+    __slots__ = ("queries", "db_time", "serializer_time", "render_time", "total_time", "sql")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.sql = []
+
+    def as_dict(self):
+        return {
+            "queries": self.queries,
+            "db_ms": self.db_time * 1000,
+            "serializer_ms": self.serializer_time * 1000,
+            "render_ms": self.render_time * 1000,
+            "total_ms": self.total_time * 1000,
+        }
+
+
+_current = contextvars.ContextVar("listings_request_metrics", default=None)
+
+
+def current_metrics():
+    """The metrics of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+class EndpointStats:
+    """Per-URL-name totals and maxima of the request metrics in this process"""
+
+    FIELDS = ("queries", "db_ms", "serializer_ms", "render_ms", "total_ms")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, url_name, metrics):
+        values = metrics.as_dict()
+        with self._lock:
+            stats = self._stats.get(url_name)
+            if stats is None:
+                stats = self._stats[url_name] = {
+                    "requests": 0,
+                    "over_budget": 0,
+                    **{f"{field}_total": 0 for field in self.FIELDS},
+                    **{f"{field}_max": 0 for field in self.FIELDS},
+                }
+            stats["requests"] += 1
+            for field in self.FIELDS:
+                stats[f"{field}_total"] += values[field]
+                stats[f"{field}_max"] = max(stats[f"{field}_max"], values[field])
+
+    def record_over_budget(self, url_name):
+        with self._lock:
+            if url_name in self._stats:
+                self._stats[url_name]["over_budget"] += 1
+
+    def snapshot(self):
+        """``{url_name: {"requests": n, "queries_avg": ..., "db_ms_max": ...}}``"""
+        with self._lock:
+            snapshot = {}
+            for url_name, stats in self._stats.items():
+                requests = stats["requests"]
+                snapshot[url_name] = {
+                    **stats,
+                    **{f"{field}_avg": stats[f"{field}_total"] / requests for field in self.FIELDS},
+                }
+            return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+endpoint_stats = EndpointStats()
+
+
+def query_budget(budget):
+    """Declare the query budget of a function view (put it above ``@api_view``)"""
+
+    def decorator(view):
+        view.query_budget = budget
+        return view
+
+    return decorator
+
+
+def get_query_budget(resolver_match):
+    """Declared budget of the view behind ``resolver_match``, or None"""
+    if resolver_match is None:
+        return None
+    func = resolver_match.func
+    budget = getattr(func, "query_budget", None)
+    if budget is None:
+        budget = getattr(getattr(func, "view_class", None), "query_budget", None)
+    return budget
+
+
+class TimedRepresentationMixin:
+    """
+    Serializer mixin adding the time spent in the outermost
+    ``to_representation`` (per item of a ``many=True`` list) to the
+    request's serializer time.
+    """
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        parent = self.parent
+        if metrics is None or not (
+            parent is None or (isinstance(parent, ListSerializer) and parent.parent is None)
+        ):
+            return super().to_representation(instance)
+
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_option("ENABLED"):
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        metrics.total_time = time.perf_counter() - start
+
+        self.finish(request, response, metrics)
+        return response
+
+    def record_query(self, execute, sql, params, many, context):
+        metrics = _current.get()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if metrics is not None:
+                elapsed = time.perf_counter() - start
+                metrics.queries += 1
+                metrics.db_time += elapsed
+                metrics.sql.append((sql, elapsed))
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns
+        metrics = _current.get()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics):
+        # Kept on the response for tests and the profiler
+        response.metrics = metrics
+        resolver_match = getattr(request, "resolver_match", None)
+
+        if get_option("HEADERS"):
+            response["X-DB-Queries"] = str(metrics.queries)
+            response["X-DB-Time"] = f"{metrics.db_time * 1000:.2f}ms"
+            response["X-Serializer-Time"] = f"{metrics.serializer_time * 1000:.2f}ms"
+            response["X-Render-Time"] = f"{metrics.render_time * 1000:.2f}ms"
+            response["Server-Timing"] = ", ".join([
+                f"db;dur={metrics.db_time * 1000:.2f}",
+                f"serialize;dur={metrics.serializer_time * 1000:.2f}",
+                f"render;dur={metrics.render_time * 1000:.2f}",
+                f"total;dur={metrics.total_time * 1000:.2f}",
+            ])
+
+        if resolver_match is None or resolver_match.namespace not in get_option("NAMESPACES"):
+            return
+        url_name = resolver_match.view_name
+        endpoint_stats.record(url_name, metrics)
+        prometheus.record_request(url_name, request.method, response.status_code, metrics)
+
+        budget = get_query_budget(resolver_match)
+        if budget is None or metrics.queries <= budget:
+            return
+        endpoint_stats.record_over_budget(url_name)
+        message = (
+            f"{request.method} {request.get_full_path()} ({url_name}) ran "
+            f"{metrics.queries} queries, over its budget of {budget}"
+        )
+        if get_option("ENFORCE_BUDGETS"):
+            raise QueryBudgetExceeded(
+                message + ":\n" + "\n".join(sql for sql, _ in metrics.sql)
+            )
+        logger.warning(message)
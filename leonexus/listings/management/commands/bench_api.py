@@ -0,0 +1,163 @@
+import json
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from listings.benchmarks import SEED_PREFIX, summarize
+from listings.models import Car, CarImage, Category, Dealership, Favorite, Review, User
+
+# (name, path, who) -- paths are formatted with the ids picked in targets()
+SCENARIOS = [
+    ("car-list", "/api/cars/", None),
+    ("car-list-page-50", "/api/cars/?page=50", None),
+    ("car-list-cursor", "/api/cars/?pagination=cursor", None),
+    ("car-list-filtered", "/api/cars/?make=Toyota&year=2023&ordering=price", None),
+    ("car-list-search", "/api/cars/?search=land+cruiser", None),
+    ("car-list-top-rated", "/api/cars/?ordering=-rating_average", None),
+    ("car-list-sparse", "/api/cars/?fields=id,title,price,primary_image", None),
+    ("car-list-buyer", "/api/cars/", "buyer"),
+    ("car-detail", "/api/cars/{car}/", None),
+    ("car-detail-buyer", "/api/cars/{car}/", "buyer"),
+    ("car-facets", "/api/cars/facets/?make=Toyota", None),
+    ("car-suggestions", "/api/cars/suggestions/?q=to", None),
+    ("car-reviews", "/api/cars/{car}/reviews/", "buyer"),
+    ("categories", "/api/categories/", None),
+    ("dealerships", "/api/dealerships/?ordering=-total_cars", None),
+    ("dealership-detail", "/api/dealerships/{dealership}/", None),
+    ("dealership-stats", "/api/dealerships/stats/", None),
+    ("favorites", "/api/favorites/", "buyer"),
+    ("dealer-cars", "/api/dealers/cars/", "dealer"),
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Drive the main API endpoints through the test client and report latency and queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Measured requests per endpoint")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--only", nargs="+", default=[],
+                            help="Endpoints to run (substrings of their names)")
+        parser.add_argument("--no-response-cache", action="store_true",
+                            help="Serve anonymous requests without the response cache")
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--compare", help="JSON file of an earlier run to compare p50s against")
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not options["only"] or any(name in scenario[0] for name in options["only"])
+        ]
+        if not scenarios:
+            raise CommandError("No endpoint matches --only")
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)["endpoints"]
+
+        ids, tokens = self.targets()
+        results = {}
+        self.stdout.write(f"{'endpoint':<22}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>10}{'throughput':>16}")
+        setup_test_environment()
+        try:
+            with override_settings(RESPONSE_CACHE={
+                **getattr(settings, "RESPONSE_CACHE", {}),
+                "ENABLED": not options["no_response_cache"],
+            }):
+                for name, path, who in scenarios:
+                    results[name] = self.run_scenario(
+                        path.format(**ids), tokens.get(who), options["requests"], options["warmup"]
+                    )
+                    self.report(name, results[name], baseline)
+        finally:
+            teardown_test_environment()
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({
+                    "commit": git_commit(),
+                    "timestamp": timezone.now().isoformat(),
+                    "database": connection.vendor,
+                    "response_cache": not options["no_response_cache"],
+                    "dataset": {
+                        "cars": Car.objects.count(),
+                        "images": CarImage.objects.count(),
+                        "reviews": Review.objects.count(),
+                        "favorites": Favorite.objects.count(),
+                        "dealerships": Dealership.objects.count(),
+                        "categories": Category.objects.count(),
+                    },
+                    "endpoints": results,
+                }, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def targets(self):
+        """Ids interpolated into the paths and tokens of a seeded buyer and dealer"""
+        buyer = (
+            User.objects.filter(username__startswith=SEED_PREFIX, role="BUYER", favorites__isnull=False)
+            .order_by("pk").first()
+        )
+        car = Car.objects.filter(published=True, rating_count__gt=0).order_by("-rating_count", "pk").first()
+        dealership = Dealership.objects.filter(published=True).order_by("-total_cars", "pk").first()
+        if buyer is None or car is None or dealership is None:
+            raise CommandError("No seeded marketplace found; run manage.py seed_marketplace first")
+        tokens = {
+            "buyer": Token.objects.get_or_create(user=buyer)[0].key,
+            "dealer": Token.objects.get_or_create(user=dealership.dealer.user)[0].key,
+        }
+        return {"car": car.pk, "dealership": dealership.pk}, tokens
+
+    def run_scenario(self, path, token, requests, warmup):
+        client = Client()
+        headers = {"HTTP_AUTHORIZATION": f"Token {token}"} if token else {}
+        for _ in range(warmup):
+            client.get(path, **headers)
+
+        samples, queries, statuses = [], [], set()
+        start = time.perf_counter()
+        for _ in range(requests):
+            request_start = time.perf_counter()
+            response = client.get(path, **headers)
+            samples.append((time.perf_counter() - request_start) * 1000)
+            metrics = getattr(response, "metrics", None)
+            queries.append(metrics.queries if metrics else 0)
+            statuses.add(response.status_code)
+        elapsed = time.perf_counter() - start
+        return {
+            "path": path,
+            **summarize(samples),
+            "queries_avg": sum(queries) / len(queries) if queries else 0.0,
+            "queries_max": max(queries, default=0),
+            "requests_per_second": requests / elapsed if elapsed else 0.0,
+            "statuses": sorted(statuses),
+        }
+
+    def report(self, name, result, baseline):
+        line = (
+            f"{name:<22}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f} ms"
+            f"{result['queries_avg']:>7.1f} q{result['requests_per_second']:>9.1f} req/s"
+        )
+        if result["statuses"] != [200]:
+            line += f"  statuses {result['statuses']}"
+        if baseline and name in baseline:
+            before = baseline[name]["p50_ms"]
+            change = (result["p50_ms"] - before) / before * 100 if before else 0.0
+            line += f"  p50 {change:+.1f}% vs {before:.2f} ms"
+        self.stdout.write(line)
@@ -0,0 +1,109 @@
+import copy
+import io
+import sys
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from listings.benchmarks import summarize
+
+
+def pool_available():
+    """True if the default database can use Django's psycopg 3 pool"""
+    if connection.vendor != "postgresql":
+        return False
+    try:
+        import psycopg_pool  # noqa: F401
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    except ImportError:
+        return False
+    return is_psycopg3
+
+
+class Command(BaseCommand):
+    help = "Compare per-request connection overhead without reuse, with persistent connections and pooled"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument("--path", default="/api/categories/",
+                            help="Endpoint to request; the response cache is turned off")
+        parser.add_argument("--max-age", type=int, default=600,
+                            help="CONN_MAX_AGE of the persistent modes")
+
+    def handle(self, *args, **options):
+        modes = [
+            ("new connection", {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False}, None),
+            ("persistent", {"CONN_MAX_AGE": options["max_age"], "CONN_HEALTH_CHECKS": False}, None),
+            ("persistent+checks", {"CONN_MAX_AGE": options["max_age"], "CONN_HEALTH_CHECKS": True}, None),
+        ]
+        if pool_available():
+            modes.append(("pool", {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True}, {"min_size": 1, "max_size": 4}))
+        else:
+            self.stdout.write("Skipping the pool: it needs PostgreSQL with psycopg 3 and psycopg_pool\n")
+
+        original = copy.deepcopy(connection.settings_dict)
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        handler = WSGIHandler()
+        connection_created.connect(count_connection)
+        setup_test_environment()
+        self.stdout.write(
+            f"{connection.vendor}: {options['requests']} requests to {options['path']}\n"
+            f"{'mode':<20}{'connections':>12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        )
+        try:
+            with override_settings(RESPONSE_CACHE={**getattr(settings, "RESPONSE_CACHE", {}), "ENABLED": False}):
+                for name, values, pool in modes:
+                    self.configure(original, values, pool)
+                    for _ in range(options["warmup"]):
+                        self.request(handler, options["path"])
+                    opened.clear()
+                    samples = [self.request(handler, options["path"]) for _ in range(options["requests"])]
+                    stats = summarize(samples)
+                    self.stdout.write(
+                        f"{name:<20}{len(opened):>12}{stats['mean_ms']:>10.3f}{stats['p50_ms']:>10.3f}"
+                        f"{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+                    )
+        finally:
+            teardown_test_environment()
+            connection_created.disconnect(count_connection)
+            self.configure(original, {}, None)
+
+    def configure(self, original, values, pool):
+        connection.close()
+        if getattr(connection, "pool", None) is not None:
+            connection.close_pool()
+        connection.settings_dict.clear()
+        connection.settings_dict.update(copy.deepcopy(original), **values)
+        if pool:
+            connection.settings_dict["OPTIONS"]["pool"] = pool
+
+    def request(self, handler, path):
+        """One full WSGI request, including the request_finished cleanup; in ms"""
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": "testserver",
+            "SERVER_PORT": "80",
+            "HTTP_HOST": "testserver",
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(),
+            "wsgi.errors": sys.stderr,
+        }
+        start = time.perf_counter()
+        response = handler(environ, lambda status, headers: None)
+        b"".join(response)
+        # Sends request_finished, which closes or keeps the connection
+        response.close()
+        return (time.perf_counter() - start) * 1000
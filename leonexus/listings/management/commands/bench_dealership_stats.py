@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Avg
+from django.test.utils import CaptureQueriesContext
+
+from listings.benchmarks import measure, seed_dealerships
+from listings.models import Dealership
+from listings.stats import get_dealership_stats, invalidate_dealership_stats
+
+
+def legacy_dealership_stats():
+    """The per-dealership implementation dealership_stats used to run"""
+    return {
+        "total_dealerships": Dealership.objects.count(),
+        "verified_dealerships": Dealership.objects.filter(is_verified=True).count(),
+        "published_dealerships": Dealership.objects.filter(published=True).count(),
+        "total_cars_listed": sum(
+            dealership.dealer.cars.filter(published=True).count()
+            for dealership in Dealership.objects.all()
+        ),
+        "average_rating": Dealership.objects.aggregate(
+            avg_rating=Avg("dealer__cars__reviews__rating")
+        )["avg_rating"] or 0,
+        "specialties": list(set(
+            specialty for dealership in Dealership.objects.all()
+            for specialty in dealership.specialties
+        )),
+    }
+
+
+class Command(BaseCommand):
+    help = "Measure dealership_stats latency as the number of dealerships grows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", default="100,1000,10000,100000",
+                            help="Comma-separated dealership counts")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--legacy-max", type=int, default=10_000,
+                            help="Largest scale to also time the old per-dealership code at")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'dealerships':>12}{'variant':>10}{'queries':>9}{'p50 ms':>10}{'p95 ms':>10}"
+        )
+        for scale in sorted(int(value) for value in options["scales"].split(",")):
+            existing = Dealership.objects.count()
+            if existing < scale:
+                seed_dealerships(scale - existing)
+
+            def cold():
+                invalidate_dealership_stats()
+                return get_dealership_stats()
+
+            variants = [("cold", cold), ("cached", get_dealership_stats)]
+            if scale <= options["legacy_max"]:
+                variants.append(("legacy", legacy_dealership_stats))
+
+            for name, func in variants:
+                with CaptureQueriesContext(connection) as queries:
+                    func()
+                repeat = options["repeat"] if name != "legacy" else max(1, options["repeat"] // 10)
+                stats = measure(func, repeat=repeat, warmup=0 if name == "legacy" else 1)
+                self.stdout.write(
+                    f"{scale:>12}{name:>10}{len(queries):>9}"
+                    f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                )
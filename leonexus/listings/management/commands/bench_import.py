@@ -0,0 +1,66 @@
+import csv
+import io
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from listings import search
+from listings.benchmarks import LOCATIONS, MAKES, bench_dealer
+from listings.bulk import refresh_after_car_writes
+from listings.imports import import_cars
+from listings.models import Car
+
+FIELDS = ["stock_number", "title", "make", "model", "year", "price", "location", "mileage", "published"]
+
+
+class Command(BaseCommand):
+    help = "Time a CSV bulk import of new cars and a second pass that updates them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def csv_body(self, rows, seed):
+        rng = random.Random(seed)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS)
+        for index in range(rows):
+            make = rng.choice(list(MAKES))
+            model = rng.choice(MAKES[make])
+            year = rng.randint(2020, 2025)
+            writer.writerow([
+                f"BENCH-{index}", f"{year} {make} {model}", make, model, year,
+                rng.randrange(800_000, 25_000_000, 5_000), rng.choice(LOCATIONS),
+                rng.randrange(0, 150_000, 100), "true",
+            ])
+        return buffer.getvalue().encode()
+
+    def handle(self, *args, **options):
+        dealer = bench_dealer()
+        self.cleanup(dealer)
+        try:
+            self.stdout.write(f"{'pass':<8}{'rows':>8}{'created':>9}{'updated':>9}{'queries':>9}{'seconds':>9}{'rows/s':>9}")
+            for label, seed in (("insert", options["seed"]), ("update", options["seed"] + 1)):
+                body = self.csv_body(options["rows"], seed)
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    report = import_cars(dealer, io.BytesIO(body), "csv")
+                    elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{label:<8}{options['rows']:>8}{report['created']:>9}{report['updated']:>9}"
+                    f"{len(queries):>9}{elapsed:>9.2f}{options['rows'] / elapsed:>9.0f}"
+                )
+        finally:
+            self.cleanup(dealer)
+
+    def cleanup(self, dealer):
+        # Raw delete: the per-car delete signals would dominate the runtime,
+        # so what they maintain is refreshed afterwards
+        cars = Car.objects.filter(dealer=dealer, stock_number__startswith="BENCH-")
+        search.remove_cars(list(cars.values_list("pk", flat=True)))
+        cars._raw_delete(cars.db)
+        refresh_after_car_writes([dealer.pk])
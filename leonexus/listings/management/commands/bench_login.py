@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from listings.authentication import EmailOrUsernameModelBackend
+from listings.benchmarks import measure
+from listings.models import User
+
+
+def legacy_login_user(username):
+    """The original username-or-email lookup"""
+    try:
+        return User.objects.get(Q(username=username) | Q(email=username))
+    except User.DoesNotExist:
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark the login lookup and the full password check for hits and misses"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20000, help="Users to seed when fewer exist")
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--logins", type=int, default=10, help="Full authenticate() calls per case")
+
+    def handle(self, *args, **options):
+        missing = options["users"] - User.objects.filter(username__startswith="bench-login-").count()
+        if missing > 0:
+            self.stdout.write(f"Seeding {missing} users...")
+            offset = options["users"] - missing
+            User.objects.bulk_create(
+                (
+                    User(username=f"bench-login-{index}", email=f"bench-login-{index}@example.com", password="!")
+                    for index in range(offset, offset + missing)
+                ),
+                batch_size=5000,
+            )
+        user, created = User.objects.get_or_create(
+            username="bench-login", defaults={"email": "Bench-Login@Example.com"}
+        )
+        user.set_password("bench-password")
+        user.save(update_fields=["password"])
+
+        backend = EmailOrUsernameModelBackend()
+        cases = [
+            ("username hit", "bench-login"),
+            ("email hit", "bench-login@example.com"),
+            ("username miss", "nobody-here"),
+            ("email miss", "nobody@example.com"),
+        ]
+
+        self.stdout.write("Lookup only")
+        self.stdout.write(f"{'case':<16}{'legacy p50 ms':>15}{'new p50 ms':>12}{'queries':>9}")
+        for label, login in cases:
+            legacy = measure(lambda: legacy_login_user(login), repeat=options["repeat"])
+            new = measure(lambda: backend.get_login_user(login), repeat=options["repeat"])
+            with CaptureQueriesContext(connection) as queries:
+                backend.get_login_user(login)
+            self.stdout.write(f"{label:<16}{legacy['p50_ms']:>15.3f}{new['p50_ms']:>12.3f}{len(queries):>9}")
+
+        self.stdout.write("authenticate() including the password hasher")
+        self.stdout.write(f"{'case':<16}{'logins/s':>10}{'ms/login':>10}")
+        for label, login in cases:
+            start = time.perf_counter()
+            for _ in range(options["logins"]):
+                backend.authenticate(None, username=login, password="bench-password")
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label:<16}{options['logins'] / elapsed:>10.1f}{elapsed / options['logins'] * 1000:>10.1f}"
+            )
@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from listings.benchmarks import measure, seed_cars
+from listings.models import Car
+from listings.parsers import ORJSONParser
+from listings.renderers import ORJSONRenderer, orjson
+from listings.serializers import CarListSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare JSONRenderer with ORJSONRenderer on CarListSerializer pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-sizes", type=int, nargs="+", default=[20, 100])
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError("orjson is not installed; ORJSONRenderer would fall back to JSONRenderer")
+
+        largest = max(options["page_sizes"])
+        existing = Car.objects.filter(published=True).count()
+        if existing < largest:
+            seed_cars(largest - existing)
+
+        request = Request(APIRequestFactory().get("/api/cars/"))
+        self.stdout.write(
+            f"{'page size':>10}{'renderer':>16}{'bytes':>10}{'p50 us':>10}{'p99 us':>10}{'parse us':>10}"
+        )
+        for page_size in options["page_sizes"]:
+            cars = Car.objects.filter(published=True).order_by("pk").with_listing_annotations()[:page_size]
+            data = {
+                "count": existing,
+                "next": None,
+                "previous": None,
+                "results": CarListSerializer(cars, many=True, context={"request": request}).data,
+            }
+            outputs = {}
+            for renderer, parse in (
+                (JSONRenderer(), json.loads),
+                (ORJSONRenderer(), lambda content: ORJSONParser().parse(_Body(content))),
+            ):
+                content = renderer.render(data, "application/json")
+                outputs[type(renderer).__name__] = content
+                rendering = measure(lambda: renderer.render(data, "application/json"), repeat=options["repeat"])
+                parsing = measure(lambda: parse(content), repeat=options["repeat"])
+                self.stdout.write(
+                    f"{page_size:>10}{type(renderer).__name__:>16}{len(content):>10}"
+                    f"{rendering['p50_ms'] * 1000:>10.1f}{rendering['p99_ms'] * 1000:>10.1f}"
+                    f"{parsing['p50_ms'] * 1000:>10.1f}"
+                )
+            if outputs["JSONRenderer"] != outputs["ORJSONRenderer"]:
+                self.stdout.write(self.style.WARNING(f"  page size {page_size}: output differs"))
+
+
+class _Body:
+    """Minimal request stream for ORJSONParser"""
+
+    def __init__(self, content):
+        self.content = content
+
+    def read(self):
+        return self.content
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from listings.benchmarks import measure, seed_cars
+from listings.models import Car
+from listings.search import CarSearchFilter, RankedOrderingFilter
+
+DEFAULT_QUERIES = ["toyota", "land cruiser", "nairobi", "leather sunroof", "subaru forester nakuru"]
+
+
+class SearchView:
+    """Stand-in for CarListCreateView's filter configuration"""
+
+    search_fields = ["title", "make", "model", "location", "description"]
+    ordering_fields = ["price", "year", "created_at", "mileage"]
+    ordering = ["-created_at"]
+
+
+class Command(BaseCommand):
+    help = "Compare the icontains SearchFilter with the full-text search backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=500_000,
+                            help="Seed synthetic cars until at least this many exist")
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--query", action="append", dest="queries",
+                            help="Search string to benchmark (repeatable)")
+
+    def handle(self, *args, **options):
+        existing = Car.objects.count()
+        if existing < options["cars"]:
+            self.stdout.write(f"Seeding {options['cars'] - existing} cars...")
+            seed_cars(options["cars"] - existing)
+
+        view = SearchView()
+        factory = APIRequestFactory()
+        backends = {
+            "icontains": [filters.SearchFilter(), filters.OrderingFilter()],
+            "fulltext": [CarSearchFilter(), RankedOrderingFilter()],
+        }
+
+        self.stdout.write(f"{'query':<28}{'backend':<12}{'matches':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for query in options["queries"] or DEFAULT_QUERIES:
+            request = Request(factory.get("/api/cars/", {"search": query}))
+            for name, backend_chain in backends.items():
+
+                def run():
+                    queryset = Car.objects.filter(published=True)
+                    for backend in backend_chain:
+                        queryset = backend.filter_queryset(request, queryset, view)
+                    # Same work as one page of CarListCreateView: COUNT + first 20 rows
+                    return queryset.count(), list(queryset[:20])
+
+                matches, _ = run()
+                stats = measure(run, repeat=options["repeat"], warmup=1)
+                self.stdout.write(
+                    f"{query:<28}{name:<12}{matches:>10}"
+                    f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+                )
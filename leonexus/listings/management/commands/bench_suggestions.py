@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from listings.benchmarks import measure, seed_cars
+from listings.models import Car
+from listings.suggestions import PrefixIndex
+
+DEFAULT_PREFIXES = ["to", "toy", "la", "land cr", "nai", "su", "cx", "mo", "range", "zz"]
+
+
+def legacy_suggestions(query):
+    """The three icontains + DISTINCT queries search_suggestions used to run"""
+    published = Car.objects.filter(published=True)
+    makes = published.filter(make__icontains=query).values_list("make", flat=True).distinct()[:5]
+    models = published.filter(model__icontains=query).values_list("model", flat=True).distinct()[:5]
+    locations = published.filter(location__icontains=query).values_list("location", flat=True).distinct()[:5]
+    return list(makes), list(models), list(locations)
+
+
+class Command(BaseCommand):
+    help = "Compare search_suggestions' icontains queries with the in-process prefix index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=100_000,
+                            help="Seed synthetic cars until at least this many exist")
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        existing = Car.objects.count()
+        if existing < options["cars"]:
+            seed_cars(options["cars"] - existing)
+
+        index = PrefixIndex()
+        build = measure(index.build, repeat=3, warmup=0)
+        self.stdout.write(f"index build: {build['p50_ms']:.1f} ms\n")
+
+        self.stdout.write(f"{'prefix':<10}{'variant':>10}{'queries':>9}{'p50 us':>12}{'p99 us':>12}")
+        for prefix in DEFAULT_PREFIXES:
+            variants = [
+                ("icontains", lambda: legacy_suggestions(prefix), max(1, options["repeat"] // 20)),
+                ("index", lambda: index.suggest(prefix), options["repeat"]),
+            ]
+            for name, func, repeat in variants:
+                with CaptureQueriesContext(connection) as queries:
+                    func()
+                stats = measure(func, repeat=repeat, warmup=1)
+                self.stdout.write(
+                    f"{prefix:<10}{name:>10}{len(queries):>9}"
+                    f"{stats['p50_ms'] * 1000:>12.1f}{stats['p99_ms'] * 1000:>12.1f}"
+                )
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from listings.authentication import CachedTokenAuthentication, token_cache
+from listings.models import User
+
+
+class Command(BaseCommand):
+    help = "Compare database round trips of TokenAuthentication and its cached variant"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(
+            username="bench-buyer", defaults={"email": "bench-buyer@example.com"}
+        )
+        token, _ = Token.objects.get_or_create(user=user)
+        factory = APIRequestFactory()
+        token_cache.clear()
+
+        self.stdout.write(f"{'authenticator':<28}{'requests':>10}{'queries':>10}{'us/request':>12}")
+        for authenticator in (TokenAuthentication(), CachedTokenAuthentication()):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(options["requests"]):
+                    request = Request(
+                        factory.get("/api/cars/", HTTP_AUTHORIZATION=f"Token {token.key}")
+                    )
+                    assert authenticator.authenticate(request)[0].pk == user.pk
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{type(authenticator).__name__:<28}{options['requests']:>10}{len(queries):>10}"
+                f"{elapsed / options['requests'] * 1e6:>12.1f}"
+            )
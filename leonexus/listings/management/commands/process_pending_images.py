@@ -0,0 +1,39 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from listings.models import CarImage
+from listings.uploads import process_images, sweep_staged_files
+
+
+class Command(BaseCommand):
+    help = "Upload car images still waiting in the staging directory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retry-failed", action="store_true", help="Also retry FAILED images")
+        parser.add_argument(
+            "--include-processing",
+            action="store_true",
+            help="Also take over PROCESSING images (only after the web workers were stopped)",
+        )
+        parser.add_argument("--workers", type=int, default=None)
+
+    def handle(self, *args, **options):
+        statuses = [CarImage.STATUS_PENDING]
+        if options["retry_failed"]:
+            statuses.append(CarImage.STATUS_FAILED)
+        if options["include_processing"]:
+            statuses.append(CarImage.STATUS_PROCESSING)
+
+        image_ids = list(
+            CarImage.objects.filter(status__in=statuses).order_by("pk").values_list("pk", flat=True)
+        )
+        results = process_images(image_ids, statuses=statuses, workers=options["workers"])
+        summary = Counter(status or "SKIPPED" for status in results.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(image_ids)} images: "
+            + ", ".join(f"{count} {status.lower()}" for status, count in sorted(summary.items()))
+        ))
+        swept = sweep_staged_files()
+        if swept:
+            self.stdout.write(f"Deleted {swept} staged files of rolled back uploads")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from listings.ratings import rebuild_car_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute car rating_sum, rating_count, rating histograms and rating_average"
+
+    def handle(self, *args, **options):
+        count = rebuild_car_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {count} cars"))
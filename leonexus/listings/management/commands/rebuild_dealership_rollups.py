@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from listings.rollups import rebuild_dealership_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute dealership total_cars, locations_served and average_rating"
+
+    def handle(self, *args, **options):
+        count = rebuild_dealership_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {count} dealerships"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from listings import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the car full-text search index from scratch"
+
+    def handle(self, *args, **options):
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
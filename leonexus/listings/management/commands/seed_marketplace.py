@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.benchmarks import SEED_PREFIX, delete_seed_marketplace, seed_marketplace
+from listings.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic marketplace (1k to 1M cars) with bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=10_000,
+                            help="Listings to create; dealers, buyers, reviews, ... scale with it")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--reset", action="store_true",
+                            help="Delete a previously seeded marketplace first")
+        parser.add_argument("--delete", action="store_true",
+                            help="Only delete the seeded marketplace")
+
+    def handle(self, *args, **options):
+        exists = User.objects.filter(username__startswith=SEED_PREFIX).exists()
+        if options["reset"] or options["delete"]:
+            if exists:
+                start = time.perf_counter()
+                delete_seed_marketplace()
+                self.stdout.write(f"Deleted the seeded marketplace in {time.perf_counter() - start:.1f}s")
+            if options["delete"]:
+                return
+        elif exists:
+            raise CommandError("A seeded marketplace already exists; pass --reset to replace it")
+
+        start = time.perf_counter()
+        counts = seed_marketplace(
+            options["cars"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            log=lambda message: self.stdout.write(f"  {message}"),
+        )
+        elapsed = time.perf_counter() - start
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {elapsed:.1f}s"))
@@ -0,0 +1,534 @@
+"""
+Process-wide metrics exported in the Prometheus text format at ``/metrics``.
+
+Counters and histograms live in a plain in-process registry: recording a
+value is a lock and a few dictionary operations, cheap enough to leave on.
+Under several worker processes every process also writes its values to
+``MULTIPROCESS_DIR/<pid>.json`` (at most every ``FLUSH_INTERVAL`` seconds
+and at exit), and the endpoint sums the files of all processes, so a scrape
+answered by any worker covers the whole server. The counters and histograms
+of a stopped worker are folded into ``aggregate.json`` and its file is
+deleted, so counters never go backwards while the server runs and the
+directory does not grow with every restarted worker; clear it when the
+server is restarted. A process that finds a file under its own (reused) pid
+folds that in the same way before writing its own. A forked worker starts
+with empty values, so what a preloading master recorded is not counted once
+per worker.
+
+Options come from ``settings.METRICS``:
+
+``ENABLED``           stop recording and answer 404 at ``/metrics``
+``MULTIPROCESS_DIR``  directory shared by the workers; None keeps the
+                      metrics per process
+``FLUSH_INTERVAL``    seconds between writes of this process's file
+``TOKEN``             scrapes must send ``Authorization: Bearer <TOKEN>``;
+                      without one ``/metrics`` answers 404 unless DEBUG is on
+
+Gauges describe one process and carry a ``pid`` label; the files of
+processes that are gone only contribute their counters and histograms.
+Collectors registered with ``Registry.add_collector`` refresh values that
+are read rather than recorded (the connection pool statistics) before
+every snapshot.
+"""
+
+import atexit
+import bisect
+import hmac
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows; the multi-process mode needs a POSIX server anyway
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "MULTIPROCESS_DIR": None,
+    "FLUSH_INTERVAL": 5.0,
+    "TOKEN": None,
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Counters and histograms of the processes that have stopped
+AGGREGATE_FILE = "aggregate.json"
+LOCK_FILE = ".lock"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def get_option(name):
+    return getattr(settings, "METRICS", {}).get(name, DEFAULTS[name])
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), self.copy_value(value)] for key, value in self._values.items()]
+
+    def copy_value(self, value):
+        return value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def reset_after_fork(self):
+        # Another thread of the parent may have held the lock when it forked
+        self._lock = threading.Lock()
+        self._values = {}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @staticmethod
+    def merge(value, other):
+        return other
+
+
+class Histogram(Metric):
+    """Per-bucket (not cumulative) counts plus the sum of the observed values"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One slot per bucket, one for +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def copy_value(self, value):
+        return list(value)
+
+    @staticmethod
+    def merge(value, other):
+        return [a + b for a, b in zip(value, other)]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        # The pid whose file this registry has taken over (changes on fork)
+        self._file_pid = None
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def snapshot(self):
+        """``{name: [[label values, value], ...]}`` of this process"""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector %s failed", collector.__name__)
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def merge(self, snapshots):
+        """``{name: {label values: value}}`` summed over ``snapshots``"""
+        merged = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                values = merged[name]
+                for key, value in samples:
+                    key = tuple(key)
+                    values[key] = metric.merge(values[key], value) if key in values else value
+        return merged
+
+    def without_gauges(self, snapshot):
+        """``snapshot`` of a stopped process: its gauges describe nothing any more"""
+        return {
+            name: samples for name, samples in snapshot.items()
+            if getattr(self._metrics.get(name), "type", None) != "gauge"
+        }
+
+    # Multi-process support
+
+    def reset_after_fork(self):
+        """Start a forked child empty: what the parent recorded is the parent's to report"""
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        for metric in self._metrics.values():
+            metric.reset_after_fork()
+
+    def process_file(self, directory):
+        return os.path.join(directory, f"{os.getpid()}.json")
+
+    @contextmanager
+    def directory_lock(self, directory):
+        """Serializes the workers' reads and rewrites of the shared files"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(directory, LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def absorb(self, directory, name):
+        """
+        Fold the counters and histograms of a stopped process's file into
+        ``AGGREGATE_FILE`` and delete it; call with the directory locked.
+        """
+        path = os.path.join(directory, name)
+        snapshot = read_snapshot(path)
+        if snapshot is None and not os.path.exists(path):
+            return
+        aggregate = read_snapshot(os.path.join(directory, AGGREGATE_FILE)) or {}
+        merged = self.merge([aggregate, self.without_gauges(snapshot or {})])
+        write_snapshot(
+            os.path.join(directory, AGGREGATE_FILE),
+            {name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()},
+        )
+        os.remove(path)
+
+    def flush(self, force=False):
+        """Write this process's snapshot if ``FLUSH_INTERVAL`` has passed"""
+        directory = get_option("MULTIPROCESS_DIR")
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < get_option("FLUSH_INTERVAL"):
+            return
+        with self._lock:
+            self._last_flush = now
+            os.makedirs(directory, exist_ok=True)
+            path = self.process_file(directory)
+            if self._file_pid != os.getpid():
+                # A file under our pid before our first write was left by a
+                # stopped process that had the same pid
+                if os.path.exists(path):
+                    with self.directory_lock(directory):
+                        self.absorb(directory, os.path.basename(path))
+                self._file_pid = os.getpid()
+            write_snapshot(path, self.snapshot())
+
+    def collect(self):
+        """This process's snapshot merged with the files of every other process"""
+        snapshots = [self.snapshot()]
+        directory = get_option("MULTIPROCESS_DIR")
+        if directory and os.path.isdir(directory):
+            own = os.path.basename(self.process_file(directory))
+            with self.directory_lock(directory):
+                for name in sorted(os.listdir(directory)):
+                    if name in (own, AGGREGATE_FILE) or not name.endswith(".json"):
+                        continue
+                    if not process_alive(name[:-len(".json")]):
+                        self.absorb(directory, name)
+                for name in os.listdir(directory):
+                    if name == own or not name.endswith(".json"):
+                        continue
+                    snapshot = read_snapshot(os.path.join(directory, name))
+                    if snapshot is not None:
+                        snapshots.append(snapshot)
+        return self.merge(snapshots)
+
+    def render(self):
+        """Prometheus text exposition of ``collect()``"""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(values.items()):
+                labels = list(zip(metric.labelnames, key))
+                if metric.type == "histogram":
+                    cumulative = 0
+                    for bound, count in zip([*metric.buckets, math.inf], value):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else format_value(bound)
+                        lines.append(f"{name}_bucket{format_labels([*labels, ('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(value[-1])}")
+                    lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def read_snapshot(path):
+    """The snapshot stored at ``path``, or None if it is missing or unreadable"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(path, snapshot):
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(temporary, path)
+
+
+def process_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+# A preloading server (gunicorn --preload) records in the master before it
+# forks the workers, which would each report those values again
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.reset_after_fork)
+
+http_requests = registry.counter(
+    "leonexus_http_requests_total",
+    "Requests to the listings API by URL name, method and status code.",
+    ["view", "method", "status"],
+)
+http_request_duration = registry.histogram(
+    "leonexus_http_request_duration_seconds",
+    "Time spent handling listings API requests.",
+    ["view"],
+)
+db_queries = registry.histogram(
+    "leonexus_db_queries_per_request",
+    "Database queries run per listings API request.",
+    ["view"],
+    buckets=QUERY_BUCKETS,
+)
+db_time = registry.counter(
+    "leonexus_db_time_seconds_total",
+    "Time spent in database queries by listings API requests.",
+    ["view"],
+)
+response_cache_requests = registry.counter(
+    "leonexus_response_cache_requests_total",
+    "Anonymous GETs served from (hit) or stored into (miss) the response cache.",
+    ["view", "outcome"],
+)
+token_auth_duration = registry.histogram(
+    "leonexus_token_auth_duration_seconds",
+    "Token authentication time by where the user came from (cache, database) or failure.",
+    ["source"],
+)
+login_duration = registry.histogram(
+    "leonexus_login_duration_seconds",
+    "Username or email and password checks, including the password hash.",
+    ["outcome"],
+)
+image_stage_duration = registry.histogram(
+    "leonexus_image_stage_duration_seconds",
+    "Time to stage the uploaded files of one car image request.",
+)
+image_upload_duration = registry.histogram(
+    "leonexus_image_upload_duration_seconds",
+    "Storage upload attempts of car images.",
+    ["outcome"],
+)
+image_uploads = registry.counter(
+    "leonexus_image_uploads_total",
+    "Car images processed by the upload pipeline, by final status.",
+    ["status"],
+)
+db_connections_opened = registry.counter(
+    "leonexus_db_connections_opened_total",
+    "Database connections opened, by alias.",
+    ["alias"],
+)
+
+db_pool_size = registry.gauge(
+    "leonexus_db_pool_size",
+    "Connections currently held by the connection pool.",
+    ["alias", "pid"],
+)
+db_pool_max_size = registry.gauge(
+    "leonexus_db_pool_max_size",
+    "Connections the pool may open.",
+    ["alias", "pid"],
+)
+db_pool_available = registry.gauge(
+    "leonexus_db_pool_available",
+    "Idle connections in the pool.",
+    ["alias", "pid"],
+)
+db_pool_waiting = registry.gauge(
+    "leonexus_db_pool_requests_waiting",
+    "Requests waiting for a pooled connection right now.",
+    ["alias", "pid"],
+)
+db_pool_requests = registry.counter(
+    "leonexus_db_pool_requests_total",
+    "Connections handed out by the pool.",
+    ["alias"],
+)
+db_pool_queued = registry.counter(
+    "leonexus_db_pool_requests_queued_total",
+    "Requests that had to wait for a pooled connection.",
+    ["alias"],
+)
+db_pool_wait = registry.counter(
+    "leonexus_db_pool_wait_seconds_total",
+    "Time spent waiting for pooled connections.",
+    ["alias"],
+)
+db_pool_timeouts = registry.counter(
+    "leonexus_db_pool_timeouts_total",
+    "Requests that gave up waiting because the pool was exhausted.",
+    ["alias"],
+)
+
+
+@registry.add_collector
+def collect_pool_stats():
+    """Move the statistics of every psycopg connection pool into the registry"""
+    from django.db import connections
+
+    pid = os.getpid()
+    for alias in connections:
+        connection = connections[alias]
+        if not connection.settings_dict.get("OPTIONS", {}).get("pool"):
+            continue
+        # pop_stats() resets the pool's counters, so each wait is counted once
+        stats = connection.pool.pop_stats()
+        db_pool_size.set(stats.get("pool_size", 0), alias=alias, pid=pid)
+        db_pool_max_size.set(stats.get("pool_max", 0), alias=alias, pid=pid)
+        db_pool_available.set(stats.get("pool_available", 0), alias=alias, pid=pid)
+        db_pool_waiting.set(stats.get("requests_waiting", 0), alias=alias, pid=pid)
+        db_pool_requests.inc(stats.get("requests_num", 0), alias=alias)
+        db_pool_queued.inc(stats.get("requests_queued", 0), alias=alias)
+        db_pool_wait.inc(stats.get("requests_wait_ms", 0) / 1000, alias=alias)
+        db_pool_timeouts.inc(stats.get("requests_errors", 0), alias=alias)
+
+
+def record_request(view_name, method, status, metrics):
+    """Record one finished request (called by InstrumentationMiddleware)"""
+    if not get_option("ENABLED"):
+        return
+    http_requests.inc(view=view_name, method=method, status=status)
+    http_request_duration.observe(metrics.total_time, view=view_name)
+    db_queries.observe(metrics.queries, view=view_name)
+    db_time.inc(metrics.db_time, view=view_name)
+    registry.flush()
+
+
+def observe(histogram, value, **labels):
+    """``histogram.observe`` unless metrics are disabled"""
+    if get_option("ENABLED"):
+        histogram.observe(value, **labels)
+
+
+def inc(counter, amount=1, **labels):
+    """``counter.inc`` unless metrics are disabled"""
+    if get_option("ENABLED"):
+        counter.inc(amount, **labels)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        registry.flush(force=True)
+    except Exception:
+        pass
+
+
+def metrics_view(request):
+    token = get_option("TOKEN")
+    # Without a token the endpoint would be public; only DEBUG serves it then
+    if not get_option("ENABLED") or (not token and not settings.DEBUG):
+        raise Http404
+    if token and not hmac.compare_digest(
+        request.META.get("HTTP_AUTHORIZATION", "").encode(), f"Bearer {token}".encode()
+    ):
+        return HttpResponse("Unauthorized\n", status=401, content_type=CONTENT_TYPE)
+    registry.flush(force=True)
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:53
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+import listings.search
+from django.db import migrations, models
+
+FTS_TABLE = 'listings_car_fts'
+SEARCH_COLUMNS = 'title, make, model, location, description'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE listings_car SET search_vector = "
+            "setweight(to_tsvector('english', coalesce(title, '') || ' ' || "
+            "coalesce(make, '') || ' ' || coalesce(model, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(location, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+        )
+        schema_editor.execute(
+            'CREATE INDEX listings_car_search_gin ON listings_car '
+            'USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"{SEARCH_COLUMNS}, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {SEARCH_COLUMNS}) '
+            f'SELECT id, {SEARCH_COLUMNS} FROM listings_car'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS listings_car_search_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='CarSearchDocument',
+            fields=[
+                ('car', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='listings.car')),
+                ('document', listings.search.FTSDocumentField(db_column='listings_car_fts')),
+            ],
+            options={
+                'db_table': 'listings_car_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:01
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def fill_rollups(apps, schema_editor):
+    Car = apps.get_model('listings', 'Car')
+    Dealership = apps.get_model('listings', 'Dealership')
+    Review = apps.get_model('listings', 'Review')
+
+    published = Car.objects.filter(published=True).order_by()
+    totals = dict(published.values('dealer_id').annotate(count=Count('pk')).values_list('dealer_id', 'count'))
+    locations = {}
+    for dealer_id, location in published.values_list('dealer_id', 'location').distinct():
+        locations.setdefault(dealer_id, []).append(location)
+    ratings = dict(
+        Review.objects.filter(car__published=True).order_by()
+        .values('car__dealer_id').annotate(average=Avg('rating'))
+        .values_list('car__dealer_id', 'average')
+    )
+
+    dealerships = list(Dealership.objects.all())
+    for dealership in dealerships:
+        dealership.total_cars = totals.get(dealership.dealer_id, 0)
+        dealership.locations_served = sorted(locations.get(dealership.dealer_id, []))
+        rating = ratings.get(dealership.dealer_id)
+        dealership.average_rating = round(rating, 1) if rating else 0.0
+    Dealership.objects.bulk_update(
+        dealerships, ['total_cars', 'locations_served', 'average_rating'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0002_car_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dealership',
+            name='average_rating',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dealership',
+            name='locations_served',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='dealership',
+            name='total_cars',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='dealership',
+            index=models.Index(fields=['published', 'total_cars'], name='listings_de_publish_ce82bd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dealership',
+            index=models.Index(fields=['published', 'average_rating'], name='listings_de_publish_66a2bf_idx'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
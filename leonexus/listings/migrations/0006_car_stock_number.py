@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_car_image_upload_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='stock_number',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='car',
+            constraint=models.UniqueConstraint(condition=models.Q(('stock_number', ''), _negated=True), fields=('dealer', 'stock_number'), name='listings_car_unique_stock_number'),
+        ),
+    ]
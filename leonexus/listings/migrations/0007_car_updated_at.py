@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:30
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    Car = apps.get_model('listings', 'Car')
+    Car.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_car_stock_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['published', 'updated_at'], name='listings_ca_publish_6e285c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['id', 'updated_at'], name='listings_car_id_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dealership',
+            index=models.Index(fields=['published', 'updated_at'], name='listings_de_publish_6d4e71_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dealership',
+            index=models.Index(fields=['id', 'updated_at'], name='listings_dealership_id_upd_idx'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:36
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Car = apps.get_model('listings', 'Car')
+    Review = apps.get_model('listings', 'Review')
+    reviews = Review.objects.filter(car=OuterRef('pk')).order_by().values('car')
+
+    def aggregate(expression):
+        return Coalesce(Subquery(reviews.annotate(value=expression).values('value')), 0)
+
+    Car.objects.update(
+        rating_sum=aggregate(Sum('rating')),
+        rating_count=aggregate(Count('pk')),
+        **{
+            f'rating_{rating}_count': aggregate(Count('pk', filter=Q(rating=rating)))
+            for rating in range(1, 6)
+        },
+    )
+    Car.objects.update(
+        rating_average=Coalesce(
+            Cast('rating_sum', FloatField()) / NullIf('rating_count', 0), 0.0
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_car_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_average',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['published', 'rating_average'], name='listings_ca_publish_5da6e9_idx'),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
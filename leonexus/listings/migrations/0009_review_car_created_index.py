@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_car_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['car', 'created_at', 'id'], name='listings_review_car_newest_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-17 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_review_car_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['dealer', 'created_at'], name='listings_ca_dealer__d13263_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('published', True)), fields=['created_at', 'id'], name='listings_car_feed_idx'),
+        ),
+    ]
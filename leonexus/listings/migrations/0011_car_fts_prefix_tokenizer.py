@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 09:12
+
+from django.db import migrations
+
+FTS_TABLE = 'listings_car_fts'
+SEARCH_COLUMNS = 'title, make, model, location, description'
+
+
+def recreate_fts_table(tokenizer):
+    # The porter stemmer also stems prefix queries, so "toy"* became "toi"*
+    # and no longer matched "toyota"; search matches word prefixes instead
+    def recreate(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"{SEARCH_COLUMNS}, tokenize='{tokenizer}')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {SEARCH_COLUMNS}) '
+            f'SELECT id, {SEARCH_COLUMNS} FROM listings_car'
+        )
+    return recreate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_car_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_fts_table('unicode61'), recreate_fts_table('porter unicode61')),
+    ]
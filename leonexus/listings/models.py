@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce, Upper
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from datetime import datetime
+from types import MappingProxyType
 from cloudinary.models import CloudinaryField
+from django.contrib.postgres.search import SearchVectorField
+from .search import FTSDocumentField
 
 
 class User(AbstractUser):
@@ -14,6 +21,12 @@ class User(AbstractUser):
         max_length=10, choices=ROLE_CHOICES, default="BUYER"
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Case-insensitive email logins (UPPER(email) = UPPER(%s))
+            models.Index(Upper("email"), name="listings_user_email_upper_idx"),
+        ]
+
 
 class Dealer(models.Model):
     user = models.OneToOneField(
@@ -24,6 +37,9 @@ class Dealer(models.Model):
     phone = models.CharField(max_length=20)
     address = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped by listings.signals when the user or the published car
+    # count changes, so ETags of the views embedding a dealer follow them
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.user.username
@@ -68,6 +84,8 @@ class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also bumped when its published car count changes (listings.signals)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -77,6 +95,89 @@ class Category(models.Model):
         ordering = ["name"]
 
 
+class CarQuerySet(models.QuerySet):
+    def touch(self):
+        """Bump ``updated_at`` without a save (no signals)"""
+        return self.update(updated_at=timezone.now())
+
+    def with_latest_reviews(self, count=None):
+        """
+        Prefetch only the newest ``count`` reviews of each car (default
+        ``CAR_DETAIL_REVIEWS``) into ``latest_reviews``; the rest are paged
+        through the car's review list.
+        """
+        if count is None:
+            count = settings.CAR_DETAIL_REVIEWS
+        latest = Review.objects.select_related("user").order_by("-created_at", "-id")
+        return self.prefetch_related(
+            Prefetch("reviews", queryset=latest[:count], to_attr="latest_reviews")
+        )
+
+    def with_listing_annotations(self, fieldset=None):
+        """
+        Load everything CarListSerializer renders in a fixed number of
+        queries: related rows are joined or prefetched and the computed
+        fields are annotated as correlated subqueries. Ratings are stored
+        on the car itself (listings.ratings). With a ``fieldset``
+        (listings.fieldsets) only what it renders is loaded.
+        """
+        includes = fieldset.includes if fieldset else lambda name: True
+        expands = fieldset.expands if fieldset else lambda name: True
+
+        queryset = self
+        if expands("dealer"):
+            dealer_cars = (
+                Car.objects.filter(dealer=OuterRef("dealer"), published=True)
+                .order_by()
+                .values("dealer")
+            )
+            queryset = queryset.select_related("dealer__user").annotate(
+                dealer_car_count=Coalesce(
+                    Subquery(dealer_cars.annotate(count=Count("pk")).values("count")), 0
+                )
+            )
+        if expands("category"):
+            queryset = queryset.with_category_counts()
+        if includes("images"):
+            queryset = queryset.prefetch_related("images")
+        if includes("primary_image"):
+            queryset = queryset.annotate(
+                primary_image_ref=Subquery(
+                    CarImage.objects.filter(car=OuterRef("pk"), order=0).values("image")[:1]
+                )
+            )
+        return queryset
+
+    def with_category_counts(self):
+        """Join the category and annotate its published car count (``category_car_count``)"""
+        category_cars = (
+            Car.objects.filter(category=OuterRef("category"), published=True)
+            .order_by()
+            .values("category")
+        )
+        return self.select_related("category").annotate(
+            category_car_count=Subquery(
+                category_cars.annotate(count=Count("pk")).values("count")
+            )
+        )
+
+    def with_detail_relations(self, fieldset=None):
+        """Joins and prefetches for CarDetailSerializer, limited to ``fieldset``"""
+        includes = fieldset.includes if fieldset else lambda name: True
+        expands = fieldset.expands if fieldset else lambda name: True
+
+        queryset = self
+        if expands("dealer"):
+            queryset = queryset.select_related("dealer__user")
+        if expands("category"):
+            queryset = queryset.select_related("category")
+        if includes("images"):
+            queryset = queryset.prefetch_related("images")
+        if includes("reviews"):
+            queryset = queryset.with_latest_reviews()
+        return queryset
+
+
 class Car(models.Model):
     TRANSMISSION_CHOICES = (
         ("MANUAL", "Manual"),
@@ -117,11 +218,51 @@ class Car(models.Model):
     condition = models.CharField(max_length=50, blank=True)
     description = models.TextField(blank=True)
     published = models.BooleanField(default=False)
+    # Dealer's own inventory id; bulk imports upsert on it
+    stock_number = models.CharField(max_length=50, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also touched when the car's images or reviews change (listings.signals)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Review aggregates, kept current by listings.ratings; repair with
+    # `manage.py rebuild_car_ratings`
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0.0, editable=False)
+    # Maintained by listings.search; GIN indexed on PostgreSQL only
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = CarQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.make} {self.model} {self.year}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so signal handlers can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The stored row as of before this save, read-only so that every
+        # save signal handler compares against the same values
+        self._stored_values = MappingProxyType(dict(getattr(self, "_loaded_values", None) or {}))
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        saved = [
+            field.attname for field in self._meta.concrete_fields
+            if update_fields is None or field.name in update_fields or field.attname in update_fields
+        ]
+        self._loaded_values = {
+            **self._stored_values,
+            **{name: self.__dict__[name] for name in saved if name in self.__dict__},
+        }
+
     class Meta:
         ordering = ["-created_at"]
         indexes = [
@@ -129,15 +270,74 @@ class Car(models.Model):
             models.Index(fields=["price"]),
             models.Index(fields=["year"]),
             models.Index(fields=["published", "created_at"]),
+            # Index-only lookups of the conditional GET validators
+            models.Index(fields=["published", "updated_at"]),
+            models.Index(fields=["id", "updated_at"], name="listings_car_id_updated_idx"),
+            models.Index(fields=["published", "rating_average"]),
+            # A dealer's own listings, newest first
+            models.Index(fields=["dealer", "created_at"]),
+            # Matches the bare ``WHERE published`` Django emits, which the
+            # composite indexes above cannot serve on SQLite
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(published=True),
+                name="listings_car_feed_idx",
+            ),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dealer", "stock_number"],
+                condition=~models.Q(stock_number=""),
+                name="listings_car_unique_stock_number",
+            ),
+        ]
+
+
+class CarSearchDocument(models.Model):
+    """
+    The SQLite FTS5 shadow table used by listings.search. It only exists on
+    SQLite; PostgreSQL searches ``Car.search_vector`` instead.
+    """
+
+    car = models.OneToOneField(
+        Car,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        related_name="search_document",
+    )
+    document = FTSDocumentField(db_column="listings_car_fts")
+
+    class Meta:
+        managed = False
+        db_table = "listings_car_fts"
 
 
 class CarImage(models.Model):
+    STATUS_PENDING = "PENDING"
+    STATUS_PROCESSING = "PROCESSING"
+    STATUS_READY = "READY"
+    STATUS_FAILED = "FAILED"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSING, "Processing"),
+        (STATUS_READY, "Ready"),
+        (STATUS_FAILED, "Failed"),
+    )
+
     car = models.ForeignKey(
         Car, on_delete=models.CASCADE, related_name="images"
     )
-    image = CloudinaryField("image", folder="car_images/")
+    # Empty until the background upload (listings.uploads) completes
+    image = CloudinaryField("image", folder="car_images/", blank=True, null=True)
     order = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_READY
+    )
+    staged_file = models.CharField(max_length=255, blank=True, editable=False)
+    attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    error = models.TextField(blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -146,6 +346,13 @@ class CarImage(models.Model):
     class Meta:
         ordering = ["order"]
         unique_together = ("car", "order")
+        indexes = [
+            models.Index(
+                fields=["status"],
+                name="listings_carimage_unready",
+                condition=~models.Q(status="READY"),
+            ),
+        ]
 
 
 class Review(models.Model):
@@ -164,9 +371,20 @@ class Review(models.Model):
     def __str__(self):
         return f"Review {self.id} for {self.car.title} by {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored rating, so listings.ratings can move an edited review
+        instance._loaded_rating = dict(zip(field_names, values)).get("rating")
+        return instance
+
     class Meta:
         ordering = ["-created_at"]
         unique_together = ("car", "user")
+        indexes = [
+            # Newest-first review pages and the detail view's latest reviews
+            models.Index(fields=["car", "created_at", "id"], name="listings_review_car_newest_idx"),
+        ]
 
 
 class Dealership(models.Model):
@@ -185,37 +403,23 @@ class Dealership(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Rollups over the dealer's published cars, kept current by
+    # listings.rollups; repair with `manage.py rebuild_dealership_rollups`
+    total_cars = models.PositiveIntegerField(default=0, editable=False)
+    locations_served = models.JSONField(default=list, blank=True, editable=False)
+    average_rating = models.FloatField(default=0.0, editable=False)
+
     def __str__(self):
         return self.name
 
-    @property
-    def total_cars(self):
-        """Calculate total published cars for this dealership"""
-        return self.dealer.cars.filter(published=True).count()
-
-    @property
-    def locations_served(self):
-        """Get unique locations from dealer's cars"""
-        return list(
-            set(
-                self.dealer.cars.filter(published=True).values_list(
-                    "location", flat=True
-                )
-            )
-        )
-
-    @property
-    def average_rating(self):
-        """Calculate average rating from all car reviews"""
-        from django.db.models import Avg
-
-        avg_rating = self.dealer.cars.filter(published=True).aggregate(
-            avg_rating=Avg("reviews__rating")
-        )["avg_rating"]
-        return round(avg_rating, 1) if avg_rating else 0.0
-
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["published", "total_cars"]),
+            models.Index(fields=["published", "average_rating"]),
+            models.Index(fields=["published", "updated_at"]),
+            models.Index(fields=["id", "updated_at"], name="listings_dealership_id_upd_idx"),
+        ]
 
 
 class Favorite(models.Model):
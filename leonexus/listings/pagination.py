@@ -0,0 +1,243 @@
+"""
+Keyset (cursor) pagination for the public listing feeds.
+
+Page-number pagination stays the default; clients opt in with
+``?pagination=cursor`` (or by following a ``next``/``previous`` link that
+carries ``?cursor=``). Cursors encode the sort values of the boundary row
+plus its ``id``, so every page is a single indexed range scan instead of an
+``OFFSET`` and no ``COUNT(*)`` is needed.
+"""
+
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Planner row estimate for ``queryset`` on PostgreSQL (no scan); other
+    databases fall back to an exact ``COUNT(*)``.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    sql, params = (
+        queryset.order_by().values("pk").query.get_compiler(queryset.db).as_sql()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on the queryset's current ordering (as set by OrderingFilter)
+    with ``id`` appended as a tie-breaker. Nullable sort fields keep NULLs
+    last. ``?count=exact`` or ``?count=estimate`` adds a total.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.keys = self.get_keys(queryset)
+
+        position, reverse = self.decode_cursor(request)
+        keys = self.keys
+        if reverse:
+            # Walk backwards: flip every key, which also moves NULLs first
+            keys = [(name, not descending, nullable) for name, descending, nullable in keys]
+
+        self.count = self.get_count(queryset, request)
+
+        queryset = queryset.order_by(*self.order_expressions(keys, nulls_last=not reverse))
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(keys, position, nulls_last=not reverse))
+            except (TypeError, ValueError, ValidationError):
+                # A cursor value the sort field cannot hold was not issued by us
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = position is not None if not reverse else has_more
+        self.first_position = self.position(results[0]) if results else None
+        self.last_position = self.position(results[-1]) if results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_keys(self, queryset):
+        """``(field, descending, nullable)`` for each sort key, ending with id"""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        keys = []
+        for term in ordering:
+            if not isinstance(term, str) or "__" in term or term.lstrip("-") == "?":
+                continue
+            name = term.lstrip("-")
+            if name == "pk":
+                name = "id"
+            if name == "id":
+                break
+            try:
+                field = queryset.model._meta.get_field(name)
+            except Exception:
+                nullable = False
+            else:
+                # Compare foreign keys by their column, not the related row
+                name, nullable = field.attname, field.null
+            keys.append((name, term.startswith("-"), nullable))
+        keys.append(("id", keys[0][1] if keys else False, False))
+        return keys
+
+    def order_expressions(self, keys, nulls_last):
+        expressions = []
+        for name, descending, nullable in keys:
+            if nullable:
+                expression = F(name).desc if descending else F(name).asc
+                expressions.append(
+                    expression(nulls_last=True) if nulls_last else expression(nulls_first=True)
+                )
+            else:
+                expressions.append(f"-{name}" if descending else name)
+        return expressions
+
+    def after(self, keys, position, nulls_last):
+        """Rows strictly after ``position`` in the ordering given by ``keys``"""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nullable), value in zip(keys, position):
+            if value is None:
+                beyond = Q(pk__in=[]) if nulls_last else Q(**{f"{name}__isnull": False})
+                same = Q(**{f"{name}__isnull": True})
+            else:
+                beyond = Q(**{f"{name}__lt" if descending else f"{name}__gt": value})
+                if nullable and nulls_last:
+                    beyond |= Q(**{f"{name}__isnull": True})
+                same = Q(**{name: value})
+            condition |= equal & beyond
+            equal &= same
+        return condition
+
+    def position(self, obj):
+        values = []
+        for name, _, _ in self.keys:
+            value = getattr(obj, name)
+            if value is not None and not isinstance(value, (int, float, str, bool)):
+                value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+            values.append(value)
+        return values
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            position, reverse = cursor["p"], bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.keys):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({"p": position, "r": int(reverse)}, separators=(",", ":"))
+        encoded = base64.urlsafe_b64encode(payload.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == "exact":
+            return queryset.order_by().count()
+        if mode == "estimate":
+            return estimate_count(queryset)
+        return None
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(self.first_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("count", self.count),
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "nullable": True},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class ListingPagination(PageNumberPagination):
+    """
+    Page-number pagination unless the client opts into keyset mode with
+    ``?pagination=cursor`` or sends a ``?cursor=``.
+    """
+
+    keyset_class = KeysetPagination
+    mode_query_param = "pagination"
+
+    def uses_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.uses_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
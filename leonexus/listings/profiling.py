@@ -0,0 +1,231 @@
+"""
+Opt-in profiling of single requests.
+
+``ProfilingMiddleware`` profiles a sampled fraction of requests, or any
+request from a staff user that carries the ``X-Profile`` header. A profiled
+request runs under cProfile while a helper thread samples its Python stack,
+and leaves three files in ``OUTPUT_DIR/<url name>/``:
+
+``<id>.prof``       cProfile stats, for ``python -m pstats`` or snakeviz
+``<id>.collapsed``  sampled stacks in collapsed format, for flamegraph.pl
+                    or speedscope
+``<id>.json``       request, timings and every SQL statement with its time
+                    (as recorded by InstrumentationMiddleware)
+
+The id is returned in the ``X-Profile-Id`` response header.
+
+Options come from ``settings.PROFILING``:
+
+``ENABLED``      turn the middleware into a pass-through (the default)
+``SAMPLE_RATE``  fraction of requests profiled without the header
+``VIEWS``        URL names (``listings:car-list-create``) sampling is
+                 limited to; empty samples every view
+``HEADER``       request header that asks for a profile (staff only)
+``INTERVAL``     seconds between stack samples
+``OUTPUT_DIR``   where profiles are written
+"""
+
+import cProfile
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+from .instrumentation import current_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.0,
+    "VIEWS": [],
+    "HEADER": "X-Profile",
+    "INTERVAL": 0.001,
+    "OUTPUT_DIR": os.path.join(settings.BASE_DIR, "profiles"),
+}
+
+
+def get_option(name):
+    return getattr(settings, "PROFILING", {}).get(name, DEFAULTS[name])
+
+
+_path_prefixes = sorted((path for path in sys.path if path), key=len, reverse=True)
+_labels = {}
+
+
+def frame_label(code):
+    """``function (path/relative/to/sys.path.py:line)``, cached per code object"""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in _path_prefixes:
+            if filename.startswith(prefix + os.sep):
+                filename = filename[len(prefix) + 1:]
+                break
+        # ';' separates frames in the collapsed format
+        label = _labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+    return label
+
+
+def collapse(frame):
+    """The stack ending in ``frame`` as one ``root;...;leaf`` line"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Counts the stacks of one thread, sampled every ``interval`` seconds from another"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+class RequestProfile:
+    def __init__(self, view_name, reason):
+        self.view_name = view_name
+        self.reason = reason
+        self.id = f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), get_option("INTERVAL"))
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.sampler.start()
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiler owns this thread; the sampled stacks still work
+            self.profiler = None
+        return self
+
+    def stop(self):
+        self.sampler.stop()
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+
+    def save(self, request, response):
+        """Write the profile files; returns their path without extension"""
+        directory = os.path.join(get_option("OUTPUT_DIR"), self.view_name.replace(":", "."))
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.id)
+
+        if self.profiler is not None:
+            self.profiler.dump_stats(f"{base}.prof")
+        with open(f"{base}.collapsed", "w") as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        metrics = current_metrics()
+        user = getattr(request, "user", None)
+        with open(f"{base}.json", "w") as f:
+            json.dump({
+                "id": self.id,
+                "view": self.view_name,
+                "reason": self.reason,
+                "method": request.method,
+                "path": request.get_full_path(),
+                "status": response.status_code,
+                "user": user.pk if user is not None and user.is_authenticated else None,
+                "duration_ms": self.duration * 1000,
+                "samples": sum(self.sampler.stacks.values()),
+                "interval_ms": self.sampler.interval * 1000,
+                # total_ms is only known once InstrumentationMiddleware returns
+                "metrics": {
+                    name: value for name, value in metrics.as_dict().items() if name != "total_ms"
+                } if metrics else None,
+                "sql": [
+                    {"sql": sql, "ms": elapsed * 1000} for sql, elapsed in metrics.sql
+                ] if metrics else [],
+            }, f, indent=2)
+        return base
+
+
+def is_staff_request(request):
+    """
+    True for staff users, authenticated by session or, since DRF only
+    authenticates inside the view, by the API's authentication classes.
+    """
+    from rest_framework.exceptions import APIException
+    from rest_framework.request import Request
+    from rest_framework.settings import api_settings
+
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        try:
+            user = Request(request, authenticators=authenticators).user
+        except APIException:
+            return False
+    return bool(user and user.is_staff)
+
+
+def profile_reason(request):
+    """Why ``request`` should be profiled ("header" or "sampled"), or None"""
+    header = "HTTP_" + get_option("HEADER").upper().replace("-", "_")
+    if request.META.get(header):
+        return "header" if is_staff_request(request) else None
+
+    rate = get_option("SAMPLE_RATE")
+    if rate <= 0:
+        return None
+    views = get_option("VIEWS")
+    if views and request.resolver_match.view_name not in views:
+        return None
+    return "sampled" if random.random() < rate else None
+
+
+class ProfilingMiddleware:
+    """Put it right after InstrumentationMiddleware, whose SQL timings it saves"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profile = getattr(request, "_profile", None)
+        if profile is not None:
+            profile.stop()
+            try:
+                response["X-Profile-Id"] = os.path.basename(profile.save(request, response))
+            except OSError:
+                logger.exception("Could not write the profile of %s", request.get_full_path())
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The URL is resolved by now, so profiles can be filed by view
+        if not get_option("ENABLED"):
+            return None
+        reason = profile_reason(request)
+        if reason is not None:
+            view_name = request.resolver_match.view_name or "unnamed"
+            request._profile = RequestProfile(view_name, reason).start()
+        return None
@@ -0,0 +1,108 @@
+"""
+Per-car rating aggregates: ``rating_sum``, ``rating_count``, the
+``rating_<n>_count`` histogram and ``rating_average``.
+
+The Review signals apply every created, edited or deleted review (cascades
+included) as one ``UPDATE`` of F-expressions, so concurrent reviews never
+lose a write and nothing has to read the reviews back. Writes that bypass
+signals call ``rebuild_car_ratings`` themselves, as does
+``manage.py rebuild_car_ratings``.
+"""
+
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .bulk import update_cars
+from .response_cache import response_cache
+
+RATINGS = range(1, 6)
+
+RATING_FIELDS = (
+    "rating_sum",
+    "rating_count",
+    *(f"rating_{rating}_count" for rating in RATINGS),
+    "rating_average",
+)
+
+# Cars recomputed per round of queries during a full rebuild
+REBUILD_BATCH_SIZE = 2000
+
+
+def rating_changes(old_rating, new_rating):
+    """``UPDATE`` assignments that move one review from ``old_rating`` to ``new_rating``"""
+    total_delta = (new_rating or 0) - (old_rating or 0)
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    changes = {
+        "rating_sum": F("rating_sum") + total_delta,
+        "rating_count": F("rating_count") + count_delta,
+        # Evaluated against the row as it was before this UPDATE
+        "rating_average": Coalesce(
+            Cast(F("rating_sum") + total_delta, FloatField())
+            / NullIf(F("rating_count") + count_delta, 0),
+            0.0,
+        ),
+    }
+    if old_rating is not None:
+        field = f"rating_{old_rating}_count"
+        changes[field] = F(field) - 1
+    if new_rating is not None:
+        field = f"rating_{new_rating}_count"
+        changes[field] = changes.pop(field, F(field)) + 1
+    return changes
+
+
+def apply_rating_change(car_id, old_rating, new_rating):
+    """Move one review of ``car_id`` between ratings; None means no review"""
+    from .models import Car
+
+    if old_rating == new_rating:
+        return 0
+    return Car.objects.filter(pk=car_id).update(**rating_changes(old_rating, new_rating))
+
+
+def compute_car_ratings(car_ids):
+    """``{car_id: {field: value}}`` recomputed from the reviews"""
+    from .models import Review
+
+    aggregates = {
+        "rating_sum": Sum("rating"),
+        "rating_count": Count("pk"),
+        **{
+            f"rating_{rating}_count": Count("pk", filter=Q(rating=rating))
+            for rating in RATINGS
+        },
+    }
+    rows = (
+        Review.objects.filter(car_id__in=car_ids)
+        .order_by()
+        .values("car_id")
+        .annotate(**aggregates)
+    )
+    found = {row.pop("car_id"): row for row in rows}
+
+    ratings = {}
+    for car_id in car_ids:
+        values = found.get(car_id) or {field: 0 for field in aggregates}
+        count = values["rating_count"]
+        values["rating_average"] = values["rating_sum"] / count if count else 0.0
+        ratings[car_id] = values
+    return ratings
+
+
+def rebuild_car_ratings(car_ids=None):
+    """Recompute the aggregates of ``car_ids`` (every car if None); returns how many"""
+    from .models import Car
+
+    if car_ids is None:
+        car_ids = Car.objects.order_by("pk").values_list("pk", flat=True)
+    car_ids = list(car_ids)
+
+    for start in range(0, len(car_ids), REBUILD_BATCH_SIZE):
+        batch = compute_car_ratings(car_ids[start:start + REBUILD_BATCH_SIZE])
+        # updated_at is auto_now, so repaired cars get a new ETag as well
+        update_cars(
+            [Car(pk=car_id, **values) for car_id, values in batch.items()],
+            [*RATING_FIELDS, "updated_at"],
+        )
+    response_cache.bump_on_commit("car")
+    return len(car_ids)
@@ -0,0 +1,91 @@
+"""
+Renderers for the API.
+
+``ORJSONRenderer`` is a drop-in for DRF's ``JSONRenderer`` built on orjson
+(optional; requires the ``orjson`` package) and falls back to the stock
+encoder when it is missing or the request needs something orjson cannot do
+(indented or ASCII-only output).
+
+The row-oriented renderers serve the export endpoints. Exports stream their
+rows themselves (see ``listings.exports``); these renderers let content
+negotiation pick the format from ``?format=`` or the Accept header, and
+render anything else the view returns (errors, mostly) as one row per item.
+"""
+
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+if orjson is not None:
+    # Dict subclasses (ReturnDict) and non-str keys as the stdlib encodes
+    # them; aware UTC datetimes end in "Z" as with DRF's encoder
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+# Lazy strings, Decimals, querysets, ... go through DRF's own encoder
+_fallback_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """``application/json`` through orjson, byte-compatible with JSONRenderer"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if (
+            orjson is None
+            or not api_settings.UNICODE_JSON
+            or not api_settings.COMPACT_JSON
+            or self.get_indent(accepted_media_type or "", renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        content = orjson.dumps(data, default=_fallback_encoder.default, option=ORJSON_OPTIONS)
+        # Same escaping as JSONRenderer: these are line breaks in JavaScript
+        if b"\xe2\x80\xa8" in content or b"\xe2\x80\xa9" in content:
+            content = content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return content
+
+
+def as_rows(data):
+    if data is None:
+        return []
+    return data if isinstance(data, list) else [data]
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = [row if isinstance(row, dict) else {"detail": row} for row in as_rows(data)]
+        if not rows:
+            return b""
+        header = list(dict.fromkeys(key for row in rows for key in row))
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=header)
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return "".join(
+            json.dumps(row, cls=DjangoJSONEncoder, separators=(",", ":")) + "\n"
+            for row in as_rows(data)
+        ).encode(self.charset)
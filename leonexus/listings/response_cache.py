@@ -0,0 +1,195 @@
+"""
+Versioned cache of anonymous GET responses.
+
+Every cached view names the data namespaces it renders (``car``,
+``review``, ...). Each namespace has a generation counter in the cache,
+bumped by the model signals when a row is written and again when the
+writing transaction commits. The response key contains the current
+generation of every namespace the view depends on, so a write makes
+exactly the affected responses unreachable and they simply age out;
+nothing has to be deleted.
+
+Options come from ``settings.RESPONSE_CACHE``:
+
+``ENABLED``  turn the cache on; off by default, since a cache that is not
+             shared between workers serves responses another worker has
+             since made stale
+``CACHE``    CACHES alias; "local" keeps entries per process, a shared
+             alias (Redis) lets every worker see every bump
+``TTL``      seconds a response is kept
+"""
+
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe, urlencode
+
+from . import metrics
+
+KEY_PREFIX = "listings:responses"
+
+# Validators set by ConditionalGetMixin, replayed (and checked) on hits
+CACHED_HEADERS = ("ETag", "Last-Modified")
+
+DEFAULTS = {
+    "ENABLED": False,
+    "CACHE": "default",
+    "TTL": 300,
+}
+
+
+def get_option(name):
+    return getattr(settings, "RESPONSE_CACHE", {}).get(name, DEFAULTS[name])
+
+
+class ResponseCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    @property
+    def cache(self):
+        return caches[get_option("CACHE")]
+
+    def generation_key(self, namespace):
+        return f"{KEY_PREFIX}:generation:{namespace}"
+
+    def generations(self, namespaces):
+        """Current generation of each namespace, creating missing counters"""
+        keys = {namespace: self.generation_key(namespace) for namespace in namespaces}
+        found = self.cache.get_many(keys.values())
+        generations = {}
+        for namespace, key in keys.items():
+            if key not in found:
+                # Seeded from the clock so an evicted counter never comes
+                # back at a value older entries were stored under
+                self.cache.add(key, time.time_ns(), timeout=None)
+                found[key] = self.cache.get(key)
+            generations[namespace] = found[key]
+        return generations
+
+    def bump(self, *namespaces):
+        for namespace in namespaces:
+            key = self.generation_key(namespace)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, time.time_ns(), timeout=None)
+
+    def bump_on_commit(self, *namespaces):
+        """
+        Bump now and again once the current transaction commits: the second
+        bump drops anything cached from a read of the pre-commit data.
+        """
+        self.bump(*namespaces)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self.bump(*namespaces))
+
+    def response_key(self, request, view_name, namespaces, media_type):
+        params = sorted(
+            (name, values)
+            for name, values in request.query_params.lists()
+            if any(value != "" for value in values)
+        )
+        generations = self.generations(namespaces)
+        raw = "|".join([
+            request.get_host(),
+            request.path,
+            urlencode(params, doseq=True),
+            media_type,
+            ",".join(f"{namespace}={generations[namespace]}" for namespace in sorted(generations)),
+        ])
+        return f"{KEY_PREFIX}:{view_name}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, response):
+        headers = {name: response[name] for name in CACHED_HEADERS if name in response}
+        self.cache.set(
+            key,
+            (response.status_code, response["Content-Type"], response.content, headers),
+            get_option("TTL"),
+        )
+
+    def record(self, view_name, outcome):
+        with self._lock:
+            self._stats[(view_name, outcome)] += 1
+        metrics.inc(metrics.response_cache_requests, view=view_name, outcome=outcome)
+
+    def stats(self):
+        """``{view_name: {"hit": n, "miss": n}}`` for this process"""
+        with self._lock:
+            stats = {}
+            for (view_name, outcome), count in self._stats.items():
+                stats.setdefault(view_name, {"hit": 0, "miss": 0})[outcome] = count
+            return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+response_cache = ResponseCache()
+
+
+class CachedResponseMixin:
+    """
+    Serve anonymous GETs of a DRF view from ``response_cache``.
+    ``cache_namespaces`` lists the data the response is built from. Put it
+    before ConditionalGetMixin: hits then answer conditional requests from
+    the stored validators without touching the database.
+    """
+
+    cache_namespaces = ()
+
+    def is_response_cacheable(self, request):
+        return (
+            get_option("ENABLED")
+            and request.method == "GET"
+            and not request.user.is_authenticated
+        )
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_response_cacheable(request):
+            return super().get(request, *args, **kwargs)
+
+        view_name = type(self).__name__
+        self.response_cache_key = response_cache.response_key(
+            request, view_name, self.cache_namespaces, request.accepted_media_type
+        )
+        cached = response_cache.get(self.response_cache_key)
+        if cached is not None:
+            response_cache.record(view_name, "hit")
+            status_code, content_type, content, headers = cached
+            not_modified = get_conditional_response(
+                request._request,
+                etag=headers.get("ETag"),
+                last_modified=parse_http_date_safe(headers.get("Last-Modified")),
+            )
+            response = not_modified or HttpResponse(
+                content, status=status_code, content_type=content_type
+            )
+            for name, value in headers.items():
+                response[name] = value
+            response["X-Cache"] = "HIT"
+            return response
+
+        response_cache.record(view_name, "miss")
+        return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, "response_cache_key", None)
+        if key and response.get("X-Cache") != "HIT" and response.status_code == 200:
+            response.render()
+            response_cache.set(key, response)
+            response["X-Cache"] = "MISS"
+        return response
@@ -0,0 +1,91 @@
+"""
+Per-dealership rollups of published cars: ``total_cars``,
+``locations_served`` and ``average_rating``.
+
+The columns live on ``Dealership`` so the list view can sort and filter on
+them in SQL. Signals refresh the affected dealer whenever a car or review
+changes; bulk writes that bypass signals call ``refresh_dealership_rollups``
+themselves.
+"""
+
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .response_cache import response_cache
+from .stats import invalidate_dealership_stats
+
+ROLLUP_FIELDS = ("total_cars", "locations_served", "average_rating")
+
+# Dealers refreshed per round of queries during a full rebuild
+REBUILD_BATCH_SIZE = 500
+
+
+def compute_rollups(dealer_ids):
+    """``{dealer_id: (total_cars, locations_served, average_rating)}``"""
+    from .models import Car
+
+    dealer_ids = list(dealer_ids)
+    published = Car.objects.filter(dealer_id__in=dealer_ids, published=True).order_by()
+
+    # Sums of the per-car rating aggregates (listings.ratings), no review scan
+    totals = {
+        dealer_id: (count, rating_sum, rating_count)
+        for dealer_id, count, rating_sum, rating_count in published.values("dealer_id")
+        .annotate(count=Count("pk"), rating_sum=Sum("rating_sum"), rating_count=Sum("rating_count"))
+        .values_list("dealer_id", "count", "rating_sum", "rating_count")
+    }
+    locations = {}
+    for dealer_id, location in published.values_list("dealer_id", "location").distinct():
+        locations.setdefault(dealer_id, []).append(location)
+
+    rollups = {}
+    for dealer_id in dealer_ids:
+        count, rating_sum, rating_count = totals.get(dealer_id, (0, 0, 0))
+        rollups[dealer_id] = (
+            count,
+            sorted(locations.get(dealer_id, [])),
+            round(rating_sum / rating_count, 1) if rating_count else 0.0,
+        )
+    return rollups
+
+
+def refresh_dealership_rollups(dealer_ids):
+    """Recompute the rollups of the dealerships owned by ``dealer_ids``"""
+    from .models import Dealership
+
+    dealerships = list(
+        Dealership.objects.filter(dealer_id__in=set(dealer_ids)).only(
+            "pk", "dealer_id", *ROLLUP_FIELDS
+        )
+    )
+    if not dealerships:
+        return
+
+    rollups = compute_rollups(dealership.dealer_id for dealership in dealerships)
+    now = timezone.now()
+    changed = []
+    for dealership in dealerships:
+        values = rollups[dealership.dealer_id]
+        if values == tuple(getattr(dealership, field) for field in ROLLUP_FIELDS):
+            continue
+        for field, value in zip(ROLLUP_FIELDS, values):
+            setattr(dealership, field, value)
+        # bulk_update skips auto_now; set it so the dealership ETag changes
+        dealership.updated_at = now
+        changed.append(dealership)
+    if not changed:
+        return
+
+    Dealership.objects.bulk_update(changed, [*ROLLUP_FIELDS, "updated_at"])
+    invalidate_dealership_stats()
+    response_cache.bump_on_commit("dealership")
+
+
+def rebuild_dealership_rollups():
+    """Recompute every dealership's rollups; returns how many were updated"""
+    from .models import Dealership
+
+    dealer_ids = list(Dealership.objects.order_by("pk").values_list("dealer_id", flat=True))
+    for start in range(0, len(dealer_ids), REBUILD_BATCH_SIZE):
+        refresh_dealership_rollups(dealer_ids[start:start + REBUILD_BATCH_SIZE])
+    return len(dealer_ids)
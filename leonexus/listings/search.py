@@ -0,0 +1,174 @@
+"""
+Full-text search for car listings.
+
+PostgreSQL keeps a weighted ``tsvector`` in ``Car.search_vector`` (GIN
+indexed), SQLite keeps an FTS5 shadow table keyed by the car id. Any other
+database falls back to DRF's ``icontains`` search.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import F, Lookup, TextField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+FTS_TABLE = "listings_car_fts"
+SEARCH_FIELDS = ["title", "make", "model", "location", "description"]
+SEARCH_CONFIG = "english"
+
+# SQLite's default limit on bound parameters is 999
+ID_CHUNK_SIZE = 500
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class FTSDocumentField(TextField):
+    """The hidden FTS5 column named after its table, for ``__match``"""
+
+
+@FTSDocumentField.register_lookup
+class FTSMatch(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+def search_tokens(terms):
+    """Split search terms into word tokens that are safe for both engines"""
+    return [token.lower() for term in terms for token in _TOKEN_RE.findall(term)]
+
+
+def car_search_vector():
+    """Weighted vector used for ``Car.search_vector``"""
+    return (
+        SearchVector("title", "make", "model", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("location", weight="B", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+    )
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        yield ids[start:start + ID_CHUNK_SIZE]
+
+
+def index_cars(car_ids, using="default"):
+    """Refresh the search index entries of the given cars"""
+    from .models import Car
+
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        for chunk in _chunks(car_ids):
+            Car.objects.using(using).filter(pk__in=chunk).update(
+                search_vector=car_search_vector()
+            )
+    elif connection.vendor == "sqlite":
+        columns = ", ".join(SEARCH_FIELDS)
+        with connection.cursor() as cursor:
+            for chunk in _chunks(car_ids):
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+                    chunk,
+                )
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE} (rowid, {columns}) "
+                    f"SELECT id, {columns} FROM {Car._meta.db_table} "
+                    f"WHERE id IN ({placeholders})",
+                    chunk,
+                )
+
+
+def remove_cars(car_ids, using="default"):
+    """Drop index entries of deleted cars (PostgreSQL drops them with the row)"""
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(car_ids):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk
+            )
+
+
+def rebuild_index(using="default"):
+    """Rebuild the whole search index, e.g. after bulk inserts"""
+    from .models import Car
+
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        Car.objects.using(using).update(search_vector=car_search_vector())
+    elif connection.vendor == "sqlite":
+        columns = ", ".join(SEARCH_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, {columns}) "
+                f"SELECT id, {columns} FROM {Car._meta.db_table}"
+            )
+
+
+def search_cars(queryset, terms):
+    """
+    Restrict ``queryset`` to cars matching every term (as a word prefix) and
+    annotate a ``search_rank`` where higher is more relevant. Returns None
+    when the database has no full-text index to use.
+    """
+    tokens = search_tokens(terms)
+    if not tokens:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        query = SearchQuery(
+            " & ".join(f"{token}:*" for token in tokens),
+            search_type="raw",
+            config=SEARCH_CONFIG,
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F("search_vector"), query)
+        )
+
+    if vendor == "sqlite":
+        match = " ".join(f'"{token}"*' for token in tokens)
+        # Joining the FTS table lets it produce bm25() for every match at
+        # once; bm25() is lower for better matches, so negate it
+        return queryset.filter(
+            search_document__document__match=match
+        ).annotate(search_rank=RawSQL(f"-bm25({FTS_TABLE})", ()))
+
+    return None
+
+
+class CarSearchFilter(filters.SearchFilter):
+    """``?search=`` backed by the full-text index instead of ``icontains``"""
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+
+        results = search_cars(queryset, search_terms)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        return results
+
+
+class RankedOrderingFilter(filters.OrderingFilter):
+    """Order search results by relevance unless ``?ordering=`` is given"""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if (
+            not request.query_params.get(self.ordering_param)
+            and "search_rank" in queryset.query.annotations
+        ):
+            return ["-search_rank", *(ordering or [])]
+        return ordering
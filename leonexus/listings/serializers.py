@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.db import models
 import cloudinary
 from .models import (
@@ -13,11 +14,15 @@ from .models import (
     Buyer,
     Dealership,
 )
+from .favorites import favorite_car_ids
+from .fieldsets import SparseFieldsetSerializerMixin
+from .instrumentation import TimedRepresentationMixin
+from .uploads import stage_car_images
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -44,7 +49,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """Serializer for user profile without sensitive data"""
 
     class Meta:
@@ -60,7 +65,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "username", "date_joined"]
 
 
-class DealerSerializer(serializers.ModelSerializer):
+class DealerSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     user = UserProfileSerializer(read_only=True)
     car_count = serializers.SerializerMethodField()
 
@@ -77,6 +82,10 @@ class DealerSerializer(serializers.ModelSerializer):
         ]
 
     def get_car_count(self, obj):
+        # Annotated by the view (or handed down by CarListSerializer)
+        if getattr(obj, "published_car_count", None) is not None:
+            return obj.published_car_count
+
         # Use prefetched data if available to avoid N+1 queries
         if (
             hasattr(obj, "_prefetched_objects_cache")
@@ -92,7 +101,7 @@ class DealerSerializer(serializers.ModelSerializer):
         return obj.cars.filter(published=True).count()
 
 
-class DealerCreateSerializer(serializers.ModelSerializer):
+class DealerCreateSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """Serializer for creating dealer profiles"""
 
     class Meta:
@@ -100,7 +109,7 @@ class DealerCreateSerializer(serializers.ModelSerializer):
         fields = ["first_name", "last_name", "phone", "address"]
 
 
-class BuyerSerializer(serializers.ModelSerializer):
+class BuyerSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     user = UserProfileSerializer(read_only=True)
 
     class Meta:
@@ -116,7 +125,7 @@ class BuyerSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "username", "date_joined"]
 
 
-class BuyerCreateSerializer(serializers.ModelSerializer):
+class BuyerCreateSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """Serializer for creating buyer profiles"""
 
     class Meta:
@@ -124,14 +133,11 @@ class BuyerCreateSerializer(serializers.ModelSerializer):
         fields = ["first_name", "last_name", "phone"]
 
 
-class DealershipSerializer(serializers.ModelSerializer):
+class DealershipSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """Serializer for dealership profiles with computed fields"""
 
     dealer = DealerSerializer(read_only=True)
     avatar_url = serializers.SerializerMethodField()
-    total_cars = serializers.SerializerMethodField()
-    locations_served = serializers.SerializerMethodField()
-    average_rating = serializers.SerializerMethodField()
 
     class Meta:
         model = Dealership
@@ -152,7 +158,15 @@ class DealershipSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["id", "created_at", "updated_at", "is_verified"]
+        read_only_fields = [
+            "id",
+            "created_at",
+            "updated_at",
+            "is_verified",
+            "total_cars",
+            "locations_served",
+            "average_rating",
+        ]
 
     def get_avatar_url(self, obj):
         if obj.avatar:
@@ -161,23 +175,16 @@ class DealershipSerializer(serializers.ModelSerializer):
             return str(obj.avatar.url)
         return None
 
-    def get_total_cars(self, obj):
-        return obj.total_cars
-
-    def get_locations_served(self, obj):
-        return obj.locations_served
-
-    def get_average_rating(self, obj):
-        return obj.average_rating
-
     def to_representation(self, instance):
         """Ensure specialties is always returned as an array"""
+        # The dealer's published car count is the total_cars rollup
+        instance.dealer.published_car_count = instance.total_cars
         data = super().to_representation(instance)
         data["specialties"] = data.get("specialties", [])
         return data
 
 
-class DealershipCreateUpdateSerializer(serializers.ModelSerializer):
+class DealershipCreateUpdateSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """Serializer for creating and updating dealership profiles"""
 
     class Meta:
@@ -227,7 +234,7 @@ class DealershipCreateUpdateSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     car_count = serializers.SerializerMethodField()
 
     class Meta:
@@ -235,18 +242,21 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ["id", "name", "slug", "car_count"]
 
     def get_car_count(self, obj):
+        if getattr(obj, "published_car_count", None) is not None:
+            return obj.published_car_count
         try:
             return obj.car_set.filter(published=True).count()
         except Exception:
             return 0
 
 
-class CarImageSerializer(serializers.ModelSerializer):
+class CarImageSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
 
     class Meta:
         model = CarImage
-        fields = ["id", "image", "image_url", "order", "created_at"]
+        fields = ["id", "image", "image_url", "order", "status", "created_at"]
+        read_only_fields = ["status"]
 
     def get_image_url(self, obj):
         if obj.image:
@@ -256,7 +266,7 @@ class CarImageSerializer(serializers.ModelSerializer):
         return None
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     user = UserProfileSerializer(read_only=True)
 
     class Meta:
@@ -265,7 +275,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "created_at"]
 
 
-class ReviewCreateSerializer(serializers.ModelSerializer):
+class ReviewCreateSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ["rating", "comment"]
@@ -278,7 +288,7 @@ class ReviewCreateSerializer(serializers.ModelSerializer):
         return value
 
 
-class CarListSerializer(serializers.ModelSerializer):
+class CarListSerializer(SparseFieldsetSerializerMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     """Lightweight serializer for car listings"""
 
     dealer = DealerSerializer(read_only=True)
@@ -287,6 +297,7 @@ class CarListSerializer(serializers.ModelSerializer):
     primary_image = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
+    is_favorited = serializers.SerializerMethodField()
 
     class Meta:
         model = Car
@@ -308,13 +319,34 @@ class CarListSerializer(serializers.ModelSerializer):
             "primary_image",
             "average_rating",
             "review_count",
+            "is_favorited",
             "published",
             "created_at",
         ]
+        expandable_fields = ["dealer", "category"]
+
+    def to_representation(self, instance):
+        # Hand the counts annotated by Car.objects.with_listing_annotations()
+        # down to the nested dealer and category serializers
+        if getattr(instance, "dealer_car_count", None) is not None:
+            instance.dealer.published_car_count = instance.dealer_car_count
+        if (
+            instance.category_id
+            and getattr(instance, "category_car_count", None) is not None
+        ):
+            instance.category.published_car_count = instance.category_car_count
+        return super().to_representation(instance)
 
     def get_primary_image(self, obj):
+        if hasattr(obj, "primary_image_ref"):
+            if obj.primary_image_ref:
+                return str(obj.primary_image_ref.url)
+            return None
+
         try:
-            primary_image = obj.images.filter(order=0).first()
+            primary_image = next(
+                (image for image in obj.images.all() if image.order == 0), None
+            )
             if primary_image and primary_image.image:
                 # For CloudinaryField, obj.image.url should already be the full URL
                 # No need to build absolute URI as it's already absolute
@@ -324,24 +356,17 @@ class CarListSerializer(serializers.ModelSerializer):
         return None
 
     def get_average_rating(self, obj):
-        try:
-            reviews = obj.reviews.all()
-            if reviews:
-                return round(
-                    sum(review.rating for review in reviews) / len(reviews), 1
-                )
-        except Exception:
-            pass
-        return 0
+        return round(obj.rating_average, 1)
 
     def get_review_count(self, obj):
-        try:
-            return obj.reviews.count()
-        except Exception:
-            return 0
+        return obj.rating_count
 
+    def get_is_favorited(self, obj):
+        # One favorite-set lookup per request, however many cars are listed
+        return obj.pk in favorite_car_ids(self.context.get("request"))
 
-class DealerCarListSerializer(serializers.ModelSerializer):
+
+class DealerCarListSerializer(SparseFieldsetSerializerMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     """Serializer for dealer's own cars - includes all fields for management"""
 
     category = CategorySerializer(read_only=True)
@@ -367,17 +392,28 @@ class DealerCarListSerializer(serializers.ModelSerializer):
             "published",
             "created_at",
         ]
+        expandable_fields = ["category"]
+
+    def to_representation(self, instance):
+        # Count annotated by Car.objects.with_category_counts()
+        if (
+            instance.category_id
+            and getattr(instance, "category_car_count", None) is not None
+        ):
+            instance.category.published_car_count = instance.category_car_count
+        return super().to_representation(instance)
 
 
-class CarDetailSerializer(serializers.ModelSerializer):
+class CarDetailSerializer(SparseFieldsetSerializerMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     """Detailed serializer for individual car views"""
 
     dealer = DealerSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     images = CarImageSerializer(many=True, read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
+    reviews = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
+    rating_distribution = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
 
     class Meta:
@@ -401,30 +437,36 @@ class CarDetailSerializer(serializers.ModelSerializer):
             "reviews",
             "average_rating",
             "review_count",
+            "rating_distribution",
             "is_favorited",
             "published",
             "created_at",
         ]
+        expandable_fields = ["dealer", "category"]
+
+    def get_reviews(self, obj):
+        # Only the newest reviews; the rest are paged through CarReviewListView
+        reviews = getattr(obj, "latest_reviews", None)
+        if reviews is None:
+            reviews = obj.reviews.select_related("user").order_by("-created_at", "-id")[
+                :settings.CAR_DETAIL_REVIEWS
+            ]
+        return ReviewSerializer(reviews, many=True, context=self.context).data
 
     def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return round(
-                sum(review.rating for review in reviews) / len(reviews), 1
-            )
-        return 0
+        return round(obj.rating_average, 1)
 
     def get_review_count(self, obj):
-        return obj.reviews.count()
+        return obj.rating_count
+
+    def get_rating_distribution(self, obj):
+        return {str(rating): getattr(obj, f"rating_{rating}_count") for rating in range(1, 6)}
 
     def get_is_favorited(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(user=request.user, car=obj).exists()
-        return False
+        return obj.pk in favorite_car_ids(self.context.get("request"))
 
 
-class CarCreateUpdateSerializer(serializers.ModelSerializer):
+class CarCreateUpdateSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     """Serializer for creating and updating cars"""
 
     images = CarImageSerializer(many=True, read_only=True)
@@ -451,6 +493,7 @@ class CarCreateUpdateSerializer(serializers.ModelSerializer):
             "description",
             "category",
             "published",
+            "stock_number",
             "images",
             "uploaded_images",
         ]
@@ -470,14 +513,30 @@ class CarCreateUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Price must be greater than 0.")
         return value
 
+    def validate_stock_number(self, value):
+        if not value:
+            return value
+        request = self.context.get("request")
+        dealer = self.instance.dealer if self.instance else getattr(
+            getattr(request, "user", None), "dealer_profile", None
+        )
+        if dealer is not None:
+            duplicates = Car.objects.filter(dealer=dealer, stock_number=value)
+            if self.instance:
+                duplicates = duplicates.exclude(pk=self.instance.pk)
+            if duplicates.exists():
+                raise serializers.ValidationError(
+                    "You already have a car with this stock number."
+                )
+        return value
+
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
         car = Car.objects.create(**validated_data)
         
-        # Handle image uploads
+        # Files are staged locally and uploaded in the background
         if uploaded_images:
-            for index, image in enumerate(uploaded_images):
-                CarImage.objects.create(car=car, image=image, order=index)
+            stage_car_images(car, uploaded_images)
         
         return car
 
@@ -493,18 +552,51 @@ class CarCreateUpdateSerializer(serializers.ModelSerializer):
         if uploaded_images:
             # Get the next available order number
             existing_count = instance.images.count()
-            
-            for index, image in enumerate(uploaded_images):
-                CarImage.objects.create(
-                    car=instance,
-                    image=image,
-                    order=existing_count + index,
-                )
+            stage_car_images(instance, uploaded_images, start_order=existing_count)
         
         return instance
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class PreloadedCategoryField(serializers.Field):
+    """
+    Category given by id or slug, resolved against the ``categories`` dict in
+    the serializer context instead of one query per row.
+    """
+
+    default_error_messages = {"does_not_exist": "Unknown category \"{value}\"."}
+
+    def to_internal_value(self, data):
+        category = self.context["categories"].get(str(data).strip().lower())
+        if category is None:
+            self.fail("does_not_exist", value=data)
+        return category
+
+    def to_representation(self, value):
+        return value.pk
+
+
+class CarImportRowSerializer(CarCreateUpdateSerializer):
+    """
+    One row of a bulk inventory import: the CarCreateUpdateSerializer rules
+    without images, with a required stock number. Uniqueness is handled by
+    the import itself, which upserts on the stock number.
+    """
+
+    category = PreloadedCategoryField(required=False, allow_null=True)
+    stock_number = serializers.CharField(max_length=50)
+
+    class Meta(CarCreateUpdateSerializer.Meta):
+        fields = [
+            field
+            for field in CarCreateUpdateSerializer.Meta.fields
+            if field not in ("images", "uploaded_images")
+        ]
+
+    def validate_stock_number(self, value):
+        return value
+
+
+class FavoriteSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     car = CarListSerializer(read_only=True)
 
     class Meta:
@@ -512,7 +604,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ["id", "car", "created_at"]
 
 
-class FavoriteCreateSerializer(serializers.ModelSerializer):
+class FavoriteCreateSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Favorite
         fields = ["car"]
@@ -0,0 +1,233 @@
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import metrics, search
+from .authentication import invalidate_user_tokens, token_cache
+from .favorites import invalidate_favorites
+from .models import Car, CarImage, Category, Dealer, Dealership, Favorite, Review, User
+from .ratings import apply_rating_change, rebuild_car_ratings
+from .response_cache import response_cache
+from .rollups import refresh_dealership_rollups
+from .stats import invalidate_dealership_stats
+from .suggestions import SUGGESTION_FIELDS, update_for_car_change
+
+
+@receiver(post_save, sender=Car)
+def index_saved_car(sender, instance, using, **kwargs):
+    search.index_cars([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Car)
+def unindex_deleted_car(sender, instance, using, **kwargs):
+    search.remove_cars([instance.pk], using=using)
+
+
+def stored_car_values(instance, signal, names):
+    """
+    ``{name: value}`` of the car's row before this save or delete. Saves
+    compare against the read-only snapshot Car.save() takes, deletes against
+    what the instance was last loaded or saved with; columns neither has
+    count as unchanged. No handler writes them, so the handlers can run in
+    any order.
+    """
+    stored = getattr(instance, "_stored_values" if signal is post_save else "_loaded_values", None) or {}
+    return {name: stored.get(name, getattr(instance, name)) for name in names}
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+def touch_dealer_and_category_for_car(sender, instance, signal, created=False, **kwargs):
+    # Both render their published car count, which only moves when a
+    # published car comes, goes or changes hands
+    names = ("published", "dealer_id", "category_id")
+    old = stored_car_values(instance, signal, names)
+    new = {name: getattr(instance, name) for name in names}
+    if created:
+        old["published"] = False
+    if signal is post_delete:
+        new["published"] = False
+    if old == new or not (old["published"] or new["published"]):
+        return
+
+    now = timezone.now()
+    Dealer.objects.filter(pk__in={old["dealer_id"], new["dealer_id"]}).update(updated_at=now)
+    category_ids = {old["category_id"], new["category_id"]} - {None}
+    if category_ids:
+        Category.objects.filter(pk__in=category_ids).update(updated_at=now)
+
+
+def _suggestion_values(car):
+    return {field: getattr(car, field) for field in ("published", *SUGGESTION_FIELDS)}
+
+
+@receiver(post_save, sender=Car)
+def update_suggestions_for_saved_car(sender, instance, signal, created, **kwargs):
+    names = ("published", *SUGGESTION_FIELDS)
+    old = None if created else stored_car_values(instance, signal, names)
+    update_for_car_change(old, _suggestion_values(instance))
+
+
+@receiver(post_delete, sender=Car)
+def update_suggestions_for_deleted_car(sender, instance, signal, **kwargs):
+    update_for_car_change(stored_car_values(instance, signal, ("published", *SUGGESTION_FIELDS)), None)
+
+
+# Columns of the published cars the rollups are computed from
+ROLLUP_CAR_FIELDS = ("published", "dealer_id", "location", "rating_sum", "rating_count")
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+def refresh_rollups_for_car(sender, instance, signal, created=False, **kwargs):
+    old = stored_car_values(instance, signal, ROLLUP_CAR_FIELDS)
+    if signal is post_save and not created and old == {name: getattr(instance, name) for name in ROLLUP_CAR_FIELDS}:
+        return
+    # A reassigned car also leaves the rollups of the dealer it came from
+    refresh_dealership_rollups({instance.dealer_id, old["dealer_id"]})
+
+
+def deleted_by_cascade(sender, kwargs):
+    """True when a post_delete of ``sender`` was set off by deleting another model's rows"""
+    origin = kwargs.get("origin")
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not sender
+
+
+# Connected before the rollup refresh below, which reads these aggregates
+@receiver(post_save, sender=Review)
+def count_saved_review(sender, instance, created, **kwargs):
+    old_rating = None if created else getattr(instance, "_loaded_rating", None)
+    apply_rating_change(instance.car_id, old_rating, instance.rating)
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_delete, sender=Review)
+def uncount_deleted_review(sender, instance, **kwargs):
+    # Reviews only cascade from their car, which is gone anyway, or from
+    # their user, whose post_delete recomputes the reviewed cars once
+    if deleted_by_cascade(sender, kwargs):
+        return
+    rating = getattr(instance, "_loaded_rating", None) or instance.rating
+    apply_rating_change(instance.car_id, rating, None)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_rollups_for_review(sender, instance, **kwargs):
+    if deleted_by_cascade(sender, kwargs):
+        return
+    dealer_id = (
+        Car.objects.filter(pk=instance.car_id).values_list("dealer_id", flat=True).first()
+    )
+    if dealer_id is not None:
+        refresh_dealership_rollups([dealer_id])
+
+
+@receiver(post_save, sender=CarImage)
+@receiver(post_delete, sender=CarImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def touch_car_for_related_change(sender, instance, **kwargs):
+    # Keeps Car.updated_at (and so the ETag of the car) in step with
+    # everything the car detail renders
+    if deleted_by_cascade(sender, kwargs):
+        return
+    Car.objects.filter(pk=instance.car_id).touch()
+
+
+@receiver(pre_delete, sender=User)
+def remember_reviewed_cars(sender, instance, **kwargs):
+    # Their reviews are gone by the time the user's post_delete runs
+    instance._reviewed_cars = list(
+        Car.objects.filter(reviews__user=instance).values_list("pk", "dealer_id").distinct()
+    )
+
+
+@receiver(post_delete, sender=User)
+def recount_reviewed_cars(sender, instance, **kwargs):
+    reviewed = getattr(instance, "_reviewed_cars", None)
+    if not reviewed:
+        return
+    # Also moves updated_at, so the cars get a new ETag
+    rebuild_car_ratings([car_id for car_id, _ in reviewed])
+    refresh_dealership_rollups({dealer_id for _, dealer_id in reviewed})
+    invalidate_dealership_stats()
+
+
+@receiver(post_save, sender=Dealership)
+def fill_new_dealership_rollups(sender, instance, created, **kwargs):
+    if created:
+        refresh_dealership_rollups([instance.dealer_id])
+
+
+@receiver(post_save, sender=Dealership)
+@receiver(post_delete, sender=Dealership)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_dealership_stats_for_change(sender, **kwargs):
+    # The average rating covers every review, also those of unpublished
+    # cars, which leave the rollups untouched
+    invalidate_dealership_stats()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_favorites_for_user(sender, instance, **kwargs):
+    invalidate_favorites(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def uncache_deleted_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def uncache_saved_user_tokens(sender, instance, created, **kwargs):
+    # Covers deactivation as well as role or profile changes
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+RESPONSE_CACHE_NAMESPACES = {
+    Car: "car",
+    CarImage: "image",
+    Review: "review",
+    Category: "category",
+    Dealer: "dealer",
+    Dealership: "dealership",
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_response_cache_generation(sender, **kwargs):
+    namespace = RESPONSE_CACHE_NAMESPACES.get(sender)
+    if namespace:
+        response_cache.bump_on_commit(namespace)
+
+
+@receiver(post_save, sender=User)
+def touch_rows_rendering_user(sender, instance, created, **kwargs):
+    # Dealers and the cars a user reviewed embed the user's profile, and
+    # their updated_at is what the ETags are built from
+    if not created:
+        Dealer.objects.filter(user=instance).update(updated_at=timezone.now())
+        Car.objects.filter(reviews__user=instance).touch()
+
+
+@receiver(post_save, sender=User)
+def bump_response_cache_for_user(sender, instance, created, **kwargs):
+    # Dealers and reviews embed their user's profile; a new user has neither
+    if not created:
+        response_cache.bump_on_commit("dealer", "review")
+
+
+@receiver(connection_created)
+def count_opened_connection(sender, connection, **kwargs):
+    metrics.inc(metrics.db_connections_opened, alias=connection.alias)
@@ -0,0 +1,67 @@
+"""
+Marketplace statistics served from a cached snapshot.
+
+Each snapshot is computed with a fixed number of aggregate queries, so its
+cost does not grow with the number of dealerships, and is dropped whenever
+the underlying dealerships or their rollups change.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+DEALERSHIP_STATS_CACHE_KEY = "listings:dealership-stats"
+
+
+def distinct_specialties():
+    """Sorted union of every dealership's ``specialties`` list"""
+    from .models import Dealership
+
+    table = Dealership._meta.db_table
+    if connection.vendor == "postgresql":
+        sql = f"SELECT DISTINCT jsonb_array_elements_text(specialties) FROM {table}"
+    elif connection.vendor == "sqlite":
+        sql = f"SELECT DISTINCT value FROM {table}, json_each({table}.specialties)"
+    else:
+        specialties = set()
+        for values in Dealership.objects.values_list("specialties", flat=True).iterator():
+            specialties.update(values or [])
+        return sorted(specialties)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def compute_dealership_stats():
+    from .models import Dealership, Review
+
+    stats = Dealership.objects.aggregate(
+        total_dealerships=Count("pk"),
+        verified_dealerships=Count("pk", filter=Q(is_verified=True)),
+        published_dealerships=Count("pk", filter=Q(published=True)),
+        total_cars_listed=Coalesce(Sum("total_cars"), 0),
+    )
+    stats["average_rating"] = Review.objects.filter(
+        car__dealer__dealership__isnull=False
+    ).aggregate(average=Avg("rating"))["average"] or 0
+    stats["specialties"] = distinct_specialties()
+    return stats
+
+
+def get_dealership_stats():
+    stats = cache.get(DEALERSHIP_STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_dealership_stats()
+        cache.set(
+            DEALERSHIP_STATS_CACHE_KEY,
+            stats,
+            timeout=getattr(settings, "DEALERSHIP_STATS_CACHE_TTL", 300),
+        )
+    return stats
+
+
+def invalidate_dealership_stats():
+    cache.delete(DEALERSHIP_STATS_CACHE_KEY)
@@ -0,0 +1,164 @@
+"""
+Per-process prefix index behind ``search_suggestions``.
+
+Holds the distinct makes, models and locations of published cars with the
+number of cars using each, in sorted arrays that are searched with
+``bisect``. Every word of a value is indexed, so "cru" suggests
+"Land Cruiser". The index is built when the WSGI/ASGI application loads
+(``warm_suggestion_index``), or on first use where that failed, kept
+current by the Car signals in this process and rebuilt after
+``SEARCH_SUGGESTIONS_MAX_AGE`` seconds to pick up writes made by other
+workers.
+"""
+
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_FIELDS = ("make", "model", "location")
+
+_WORD_START_RE = re.compile(r"(?<=[\s\-/])\S")
+
+
+def index_keys(value):
+    """Lower-cased suffixes of ``value`` starting at each word"""
+    lowered = value.lower()
+    return [lowered] + [lowered[match.start():] for match in _WORD_START_RE.finditer(lowered)]
+
+
+class PrefixIndex:
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._counts = {}
+        self._keys = {}
+        self._built_at = None
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    def get_max_age(self):
+        if self.max_age is not None:
+            return self.max_age
+        return getattr(settings, "SEARCH_SUGGESTIONS_MAX_AGE", 300)
+
+    def build(self):
+        """Load the counts with one grouped query per field"""
+        from .models import Car
+
+        published = Car.objects.filter(published=True).order_by()
+        counts = {
+            field: Counter(dict(
+                published.exclude(**{field: ""})
+                .values_list(field)
+                .annotate(count=Count("pk"))
+                .values_list(field, "count")
+            ))
+            for field in SUGGESTION_FIELDS
+        }
+        keys = {
+            field: sorted(
+                (key, value) for value in counts[field] for key in index_keys(value)
+            )
+            for field in SUGGESTION_FIELDS
+        }
+        with self._lock:
+            self._counts, self._keys = counts, keys
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        """Rebuild on next use, e.g. after a bulk ``update()``"""
+        with self._lock:
+            self._built_at = None
+
+    def ensure_fresh(self):
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > self.get_max_age():
+            self.build()
+
+    def adjust(self, field, value, delta):
+        """Add ``delta`` cars to ``value``; no-op until the index is built"""
+        if not value or not self.is_built:
+            return
+        with self._lock:
+            counts, keys = self._counts[field], self._keys[field]
+            before = counts[value]
+            after = max(0, before + delta)
+            if after:
+                counts[value] = after
+            else:
+                counts.pop(value, None)
+
+            if before and not after:
+                for key in index_keys(value):
+                    position = bisect.bisect_left(keys, (key, value))
+                    if position < len(keys) and keys[position] == (key, value):
+                        del keys[position]
+            elif after and not before:
+                for key in index_keys(value):
+                    bisect.insort(keys, (key, value))
+
+    def suggest(self, query, limit=5):
+        """``{field: [values]}`` with up to ``limit`` values per field, most used first"""
+        self.ensure_fresh()
+        prefix = query.lower()
+        results = {}
+        with self._lock:
+            for field in SUGGESTION_FIELDS:
+                keys, counts = self._keys[field], self._counts[field]
+                matches = set()
+                position = bisect.bisect_left(keys, (prefix,))
+                while position < len(keys) and keys[position][0].startswith(prefix):
+                    matches.add(keys[position][1])
+                    position += 1
+                results[field] = sorted(matches, key=lambda value: (-counts[value], value))[:limit]
+        return results
+
+
+suggestion_index = PrefixIndex()
+
+
+def car_suggestion_values(values):
+    """The indexed ``{field: value}`` of a car, or None if it is unpublished"""
+    if not values or not values.get("published"):
+        return None
+    return {field: values.get(field) for field in SUGGESTION_FIELDS}
+
+
+def update_for_car_change(old_values, new_values):
+    """Move a car's contribution from ``old_values`` to ``new_values``"""
+    old, new = car_suggestion_values(old_values), car_suggestion_values(new_values)
+    if old == new:
+        return
+    for field in SUGGESTION_FIELDS:
+        if old:
+            suggestion_index.adjust(field, old[field], -1)
+        if new:
+            suggestion_index.adjust(field, new[field], 1)
+
+
+def warm_suggestion_index():
+    """
+    Build the index at server startup, so the first suggestion request of a
+    worker doesn't scan the cars table. Called from the WSGI and ASGI
+    modules, which no management command but runserver loads, once the apps
+    are ready.
+    """
+    try:
+        suggestion_index.build()
+    except DatabaseError:
+        # Not migrated yet, for one; suggest() builds it on first use
+        logger.warning("Could not build the search suggestion index at startup", exc_info=True)
+    finally:
+        # A preloading server forks after this; every worker opens its own
+        connections.close_all()
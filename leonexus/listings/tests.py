@@ -1,3 +1,1608 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+import cloudinary
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from PIL import Image
+
+from . import metrics, uploads
+from .authentication import EmailOrUsernameModelBackend, TokenCache, token_cache
+from .benchmarks import SEED_PREFIX, delete_seed_marketplace, seed_marketplace
+from .favorites import cache_key as favorites_cache_key
+from .instrumentation import endpoint_stats, get_query_budget
+from .models import Car, CarImage, Category, Dealer, Dealership, Favorite, Review, User
+from .pagination import KeysetPagination
+from .parsers import ORJSONParser
+from .ratings import RATING_FIELDS, compute_car_ratings, rebuild_car_ratings
+from .renderers import ORJSONRenderer
+from .rollups import compute_rollups, rebuild_dealership_rollups
+from .stats import invalidate_dealership_stats
+from .suggestions import PrefixIndex, suggestion_index, warm_suggestion_index
+
+# Image URLs are built locally from the stored public id, no API calls
+cloudinary.config(cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME") or "leonexus-test")
+
+
+class MarketplaceDataMixin:
+    """
+    Small fixture builders shared by the API tests. Every request they make
+    must stay within its view's query_budget (listings.instrumentation).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(
+            override_settings(INSTRUMENTATION={**settings.INSTRUMENTATION, "ENFORCE_BUDGETS": True})
+        )
+
+    def create_dealer(self, username):
+        user = User.objects.create_user(
+            username=username, email=f"{username}@example.com", password="pass12345", role="DEALER"
+        )
+        return Dealer.objects.create(user=user, first_name="Dealer", last_name=username, phone="0700000000")
+
+    def create_buyer(self, username):
+        return User.objects.create_user(
+            username=username, email=f"{username}@example.com", password="pass12345", role="BUYER"
+        )
+
+    def create_cars(self, dealer, count, category=None, reviewers=(), images=2):
+        cars = []
+        for index in range(count):
+            car = Car.objects.create(
+                dealer=dealer,
+                category=category,
+                title=f"Toyota Prado {index}",
+                make="Toyota",
+                model="Prado",
+                location="Nairobi",
+                year=2022,
+                price=4_500_000 + index,
+                mileage=10_000 + index,
+                published=True,
+            )
+            for order in range(images):
+                CarImage.objects.create(car=car, image=f"car_images/{car.pk}_{order}", order=order)
+            for rating, reviewer in enumerate(reviewers, start=1):
+                Review.objects.create(car=car, user=reviewer, rating=min(rating, 5))
+            cars.append(car)
+        return cars
+
+
+class CarListQueryCountTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:car-list-create")
+
+    def setUp(self):
+        self.category = Category.objects.create(name="SUV", slug="suv")
+        self.reviewers = [self.create_buyer(f"buyer{index}") for index in range(3)]
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_query_count_is_constant_in_page_size(self):
+        self.create_cars(self.create_dealer("dealer1"), 2, self.category, self.reviewers)
+        small_page_queries, data = self.count_list_queries()
+        self.assertEqual(len(data["results"]), 2)
+
+        for index in range(2, 6):
+            self.create_cars(self.create_dealer(f"dealer{index}"), 4, self.category, self.reviewers)
+        full_page_queries, data = self.count_list_queries()
+        self.assertEqual(len(data["results"]), 18)
+
+        self.assertEqual(small_page_queries, full_page_queries)
+
+    def test_annotated_fields_match_model_data(self):
+        dealer = self.create_dealer("dealer1")
+        self.create_cars(dealer, 2, self.category, self.reviewers)
+        self.create_cars(dealer, 1, images=0)
+
+        _, data = self.count_list_queries()
+        with_images = [car for car in data["results"] if car["images"]]
+        without_images = [car for car in data["results"] if not car["images"]]
+
+        self.assertEqual(with_images[0]["primary_image"], with_images[0]["images"][0]["image_url"])
+        self.assertEqual(with_images[0]["review_count"], 3)
+        self.assertEqual(with_images[0]["average_rating"], 2.0)
+        self.assertEqual(with_images[0]["dealer"]["car_count"], 3)
+        self.assertEqual(with_images[0]["category"]["car_count"], 2)
+        self.assertIsNone(without_images[0]["primary_image"])
+        self.assertEqual(without_images[0]["review_count"], 0)
+        self.assertEqual(without_images[0]["average_rating"], 0)
+
+
+class BrokenImageStorage:
+    def upload(self, path):
+        raise ConnectionError("storage unavailable")
+
+
+class CarImageUploadTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:dealer-car-create")
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.staging_dir = os.path.join(media_root, "staging")
+        self.use_storage("listings.uploads.LocalImageStorage", MEDIA_ROOT=media_root)
+        self.dealer = self.create_dealer("dealer1")
+        self.client.force_authenticate(self.dealer.user)
+
+    def use_storage(self, storage, **extra):
+        override = self.settings(
+            CAR_IMAGE_UPLOADS={
+                "STORAGE": storage,
+                "STAGING_DIR": self.staging_dir,
+                "MAX_ATTEMPTS": 2,
+                "RETRY_DELAY": 0,
+                "EAGER": True,
+            },
+            **extra,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def image_file(self, name):
+        data = io.BytesIO()
+        Image.new("RGB", (4, 4), "red").save(data, "PNG")
+        return SimpleUploadedFile(name, data.getvalue(), content_type="image/png")
+
+    def post_car(self, image_count):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(self.url, {
+                "title": "Toyota Prado",
+                "make": "Toyota",
+                "model": "Prado",
+                "year": 2022,
+                "price": 4500000,
+                "location": "Nairobi",
+                "mileage": 1000,
+                "transmission": "AUTOMATIC",
+                "fuel_type": "PETROL",
+                "condition": "Used",
+                "uploaded_images": [self.image_file(f"photo{index}.png") for index in range(image_count)],
+            }, format="multipart")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json(), callbacks
+
+    def test_images_are_staged_and_uploaded_after_commit(self):
+        data, callbacks = self.post_car(3)
+
+        self.assertEqual([image["status"] for image in data["images"]], ["PENDING"] * 3)
+        self.assertEqual([image["image_url"] for image in data["images"]], [None] * 3)
+        self.assertEqual(len(os.listdir(self.staging_dir)), 3)
+
+        for callback in callbacks:
+            callback()
+
+        images = CarImage.objects.order_by("order")
+        self.assertEqual([image.status for image in images], ["READY"] * 3)
+        self.assertTrue(all(str(image.image).startswith("car_images/") for image in images))
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+    def test_failed_uploads_keep_the_staged_file_for_a_retry(self):
+        self.use_storage("listings.tests.BrokenImageStorage")
+        data, callbacks = self.post_car(1)
+        with self.assertLogs("listings.uploads", "WARNING"):
+            for callback in callbacks:
+                callback()
+
+        image = CarImage.objects.get()
+        self.assertEqual((image.status, image.attempts), ("FAILED", 2))
+        self.assertEqual(image.error, "storage unavailable")
+        self.assertEqual(len(os.listdir(self.staging_dir)), 1)
+
+        self.use_storage("listings.uploads.LocalImageStorage")
+        self.assertEqual(uploads.process_image(image.pk, statuses=["FAILED"]), "READY")
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+    def test_files_of_rolled_back_requests_are_removed(self):
+        car = self.create_cars(self.dealer, 1, images=0)[0]
+        with mock.patch.object(CarImage.objects, "bulk_create", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                uploads.stage_car_images(car, [self.image_file("failed.png")])
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                uploads.stage_car_images(car, [self.image_file(f"photo{index}.png") for index in range(2)])
+                raise RuntimeError
+            uploads.stage_car_images(car, [self.image_file("kept.png")])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len(os.listdir(self.staging_dir)), 3)
+
+        # Files this young may belong to a transaction still running
+        self.assertEqual(uploads.sweep_staged_files(), 0)
+        self.assertEqual(uploads.sweep_staged_files(max_age=-1), 2)
+        self.assertEqual(os.listdir(self.staging_dir), [CarImage.objects.get().staged_file])
+
+
+class CarImportTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:dealer-car-import")
+
+    def setUp(self):
+        self.category = Category.objects.create(name="SUV", slug="suv")
+        self.dealer = self.create_dealer("dealer1")
+        self.client.force_authenticate(self.dealer.user)
+
+    def post_csv(self, *lines):
+        header = "stock_number,title,make,model,year,price,location,category,published"
+        body = "\n".join((header,) + lines).encode()
+        return self.client.post(self.url, body, content_type="text/csv")
+
+    def test_rows_are_upserted_on_stock_number(self):
+        response = self.post_csv(
+            "A1,Toyota Prado,Toyota,Prado,2022,4500000,Nairobi,suv,true",
+            "A2,Mazda Demio,Mazda,Demio,2021,900000,Mombasa,,false",
+        )
+        self.assertEqual(response.json()["created"], 2)
+
+        response = self.post_csv(
+            "A1,Toyota Prado TX,Toyota,Prado,2023,5000000,Nakuru,suv,true",
+            "A3,Honda Fit,Honda,Fit,2020,800000,Thika,,true",
+        )
+        self.assertEqual(
+            {key: response.json()[key] for key in ("created", "updated", "failed")},
+            {"created": 1, "updated": 1, "failed": 0},
+        )
+        prado = Car.objects.get(dealer=self.dealer, stock_number="A1")
+        self.assertEqual((prado.title, prado.year, prado.location), ("Toyota Prado TX", 2023, "Nakuru"))
+        self.assertEqual(prado.category, self.category)
+        self.assertEqual(Car.objects.filter(dealer=self.dealer).count(), 3)
+        self.assertEqual(self.dealer.cars.filter(published=True).count(), 2)
+
+    def test_updates_keep_the_fields_a_row_leaves_out(self):
+        self.post_csv("A1,Toyota Prado,Toyota,Prado,2022,4500000,Nairobi,suv,true")
+        Car.objects.filter(stock_number="A1").update(mileage=42_000, description="One owner")
+
+        # No category, published, mileage or description column
+        body = b"stock_number,title,make,model,year,price,location\nA1,Toyota Prado TX,Toyota,Prado,2023,5000000,Nakuru\n"
+        response = self.client.post(self.url, body, content_type="text/csv")
+        self.assertEqual(response.json()["updated"], 1)
+        prado = Car.objects.get(stock_number="A1")
+        self.assertEqual((prado.title, prado.year, prado.location), ("Toyota Prado TX", 2023, "Nakuru"))
+        self.assertEqual(
+            (prado.category, prado.published, prado.mileage, prado.description),
+            (self.category, True, 42_000, "One owner"),
+        )
+
+        # An explicit null still clears a field
+        response = self.client.post(
+            self.url,
+            b'{"stock_number": "A1", "title": "Prado", "make": "Toyota", "model": "Prado", '
+            b'"year": 2023, "price": "5000000", "location": "Nakuru", "category": null}\n'
+            b'{"stock_number": "A2", "title": "Fit", "make": "Honda", "model": "Fit", '
+            b'"year": 2021, "price": "800000", "location": "Thika", "mileage": 9000}\n',
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual((response.json()["updated"], response.json()["created"]), (1, 1))
+        prado.refresh_from_db()
+        self.assertEqual((prado.title, prado.category, prado.mileage), ("Prado", None, 42_000))
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        response = self.client.post(
+            self.url,
+            b'{"stock_number": "B1", "title": "Fit", "make": "Honda", "model": "Fit", '
+            b'"year": 2021, "price": "800000", "location": "Thika"}\n'
+            b'{"stock_number": "B2", "title": "Fit", "make": "Honda", "model": "Fit", '
+            b'"year": 2021, "price": "0", "location": "Thika", "category": "vans"}\n'
+            b"not json\n",
+            content_type="application/x-ndjson",
+        )
+        data = response.json()
+        self.assertEqual((data["created"], data["failed"]), (1, 2))
+        self.assertEqual(data["errors"][0]["line"], 2)
+        self.assertEqual(set(data["errors"][0]["errors"]), {"price", "category"})
+        self.assertEqual(data["errors"][1], {"line": 3, "errors": {"non_field_errors": ["Invalid JSON."]}})
+
+
+class CarExportTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:car-export")
+
+    def setUp(self):
+        self.dealer = self.create_dealer("dealer1")
+        self.cars = self.create_cars(self.dealer, 3, images=0)
+        Car.objects.filter(pk=self.cars[0].pk).update(published=False)
+
+    def test_csv_export_streams_published_cars_with_list_filters(self):
+        response = self.client.get(self.url, {"format": "csv", "max_price": 4_500_001, "ordering": "price"})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith("id,stock_number,dealer_id,title"))
+        self.assertEqual([line.split(",")[0] for line in lines[1:]], [str(self.cars[1].pk)])
+
+    def test_ndjson_export_is_gzipped_when_accepted(self):
+        response = self.client.get(self.url, {"format": "ndjson"}, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        rows = [json.loads(line) for line in gzip.decompress(b"".join(response.streaming_content)).splitlines()]
+        self.assertEqual({row["id"] for row in rows}, {car.pk for car in self.cars[1:]})
+        self.assertEqual(rows[0]["make"], "Toyota")
+
+    def test_gzip_follows_the_accept_encoding_q_values(self):
+        cases = [
+            ("deflate, gzip;q=0.5", True),
+            ("br;q=1.0, *;q=0.1", True),
+            ("gzip;q=0", False),
+            ("gzip; q=0.0, deflate", False),
+            ("*, gzip;q=0", False),
+            ("identity", False),
+        ]
+        for accept_encoding, gzipped in cases:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.client.get(self.url, {"format": "csv"}, HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertEqual(response.get("Content-Encoding") == "gzip", gzipped)
+                b"".join(response.streaming_content)
+
+
+class CarFacetTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:car-facets")
+
+    def test_facets_are_counted_in_one_query_for_the_current_filters(self):
+        category = Category.objects.create(name="SUV", slug="suv")
+        dealer = self.create_dealer("dealer1")
+        self.create_cars(dealer, 2, category, images=0)
+        Car.objects.create(
+            dealer=dealer, title="Honda Fit", make="Honda", model="Fit", location="Thika",
+            year=2021, price=900_000, transmission="CVT", published=True,
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(self.url, {"min_price": 500_000}).json()
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data["total"], 3)
+        self.assertEqual(data["make"], [{"value": "Toyota", "count": 2}, {"value": "Honda", "count": 1}])
+        self.assertEqual(data["category"], [{"value": category.pk, "count": 2}])
+        self.assertEqual(data["transmission"], [{"value": "CVT", "count": 1}])
+        self.assertEqual(data["year"], [{"value": 2022, "count": 2}, {"value": 2021, "count": 1}])
+        self.assertEqual([bucket["count"] for bucket in data["price"]], [1, 0, 2, 0, 0, 0])
+
+        data = self.client.get(self.url, {"make": "Honda"}).json()
+        self.assertEqual((data["total"], data["model"]), (1, [{"value": "Fit", "count": 1}]))
+
+
+@override_settings(RESPONSE_CACHE={**settings.RESPONSE_CACHE, "ENABLED": True})
+class ResponseCacheTests(MarketplaceDataMixin, APITestCase):
+    def setUp(self):
+        self.dealer = self.create_dealer("dealer1")
+        self.car = self.create_cars(self.dealer, 1, images=0)[0]
+        self.url = reverse("listings:car-detail", args=[self.car.pk])
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_anonymous_reads_are_served_from_cache_until_related_data_changes(self):
+        self.assertEqual(self.get()[0]["X-Cache"], "MISS")
+        response, queries = self.get()
+        self.assertEqual((response["X-Cache"], queries), ("HIT", 0))
+
+        Review.objects.create(car=self.car, user=self.create_buyer("buyer1"), rating=4)
+        response, _ = self.get()
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["reviews"]), 1)
+
+    def test_profile_edits_of_the_dealer_miss_the_cache(self):
+        self.get()
+        self.dealer.user.first_name = "Renamed"
+        self.dealer.user.save()
+        response, _ = self.get()
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["dealer"]["user"]["first_name"], "Renamed")
+
+    def test_authenticated_reads_bypass_the_cache(self):
+        self.get()
+        self.client.force_authenticate(self.create_buyer("buyer1"))
+        response, queries = self.get()
+        self.assertNotIn("X-Cache", response)
+        self.assertGreater(queries, 0)
+
+
+class ConditionalGetTests(MarketplaceDataMixin, APITestCase):
+    def setUp(self):
+        self.dealer = self.create_dealer("dealer1")
+        self.category = Category.objects.create(name="SUV", slug="suv")
+        self.car = self.create_cars(self.dealer, 1, self.category, images=0)[0]
+        self.url = reverse("listings:car-detail", args=[self.car.pk])
+        self.client.force_authenticate(self.create_buyer("buyer1"))
+
+    @override_settings(FAVORITES_SHARED_CACHE="default")
+    def test_unchanged_car_is_revalidated_with_one_query(self):
+        # Also caches the favorite set the ETag covers
+        response = self.client.get(self.url)
+        self.assertIn("Last-Modified", response)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertIn("updated_at", queries[0]["sql"])
+
+    def test_new_review_changes_the_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        Review.objects.create(car=self.car, user=self.create_buyer("buyer2"), rating=5)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_changes_to_embedded_rows_change_the_etag(self):
+        dealership = Dealership.objects.create(dealer=self.dealer, name="dealer1 Motors", published=True)
+        reviewer = self.create_buyer("buyer2")
+        Review.objects.create(car=self.car, user=reviewer, rating=5)
+        urls = [
+            self.url,
+            reverse("listings:car-list-create"),
+            reverse("listings:dealership-detail", args=[dealership.pk]),
+        ]
+
+        def rename(row, **fields):
+            for name, value in fields.items():
+                setattr(row, name, value)
+            row.save()
+
+        def add_published_car():
+            self.client.force_authenticate(self.dealer.user)
+            response = self.client.post(reverse("listings:dealer-car-create"), {
+                "title": "Toyota Hilux", "make": "Toyota", "model": "Hilux", "year": 2022,
+                "price": 3000000, "location": "Nairobi", "category": self.category.pk, "published": True,
+            })
+            self.assertEqual(response.status_code, 201)
+            self.client.force_authenticate(self.buyer)
+
+        self.buyer = User.objects.get(username="buyer1")
+        changes = [
+            ("dealer profile", lambda: rename(self.dealer, phone="0711111111"), urls),
+            ("dealer's user", lambda: rename(self.dealer.user, first_name="Renamed"), urls),
+            ("category", lambda: rename(self.category, name="4x4"), urls[:2]),
+            ("dealer and category car counts", add_published_car, urls),
+            ("reviewer", lambda: rename(reviewer, first_name="Renamed"), urls[:1]),
+        ]
+        for name, change, changed_urls in changes:
+            with self.subTest(change=name):
+                etags = {url: self.client.get(url)["ETag"] for url in changed_urls}
+                change()
+                for url, etag in etags.items():
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200, url)
+
+
+    def test_bulk_publish_toggle_changes_the_etags_of_other_cars(self):
+        other = self.create_cars(self.dealer, 1, self.category, images=0)[0]
+        Car.objects.filter(pk=other.pk).update(make="Honda")
+        honda_url = f"{reverse('listings:car-list-create')}?make=Honda"
+        etag = self.client.get(honda_url)["ETag"]
+
+        self.client.force_authenticate(self.dealer.user)
+        response = self.client.post(
+            reverse("listings:bulk-toggle-car-publish"),
+            {"car_ids": [self.car.pk], "action": "unpublish"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(User.objects.get(username="buyer1"))
+
+        # The Honda row is unchanged, but its embedded dealer and category counts are not
+        response = self.client.get(honda_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["dealer"]["car_count"], 1)
+
+
+class FavoriteCacheTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:car-list-create")
+
+    def setUp(self):
+        self.cars = self.create_cars(self.create_dealer("dealer1"), 3, images=0)
+        self.buyer = self.create_buyer("buyer1")
+        self.client.force_authenticate(self.buyer)
+        caches["default"].delete(favorites_cache_key(self.buyer.pk))
+
+    def favorited(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get(self.url).json()["results"]
+        favorite_queries = [query for query in queries if "listings_favorite" in query["sql"]]
+        return {car["id"] for car in results if car["is_favorited"]}, len(favorite_queries)
+
+    @override_settings(FAVORITES_SHARED_CACHE="default")
+    def test_shared_cache_keeps_favorites_until_a_toggle(self):
+        self.client.post(reverse("listings:toggle-favorite", args=[self.cars[0].pk]))
+        self.assertEqual(self.favorited(), ({self.cars[0].pk}, 1))
+        self.assertEqual(self.favorited(), ({self.cars[0].pk}, 0))
+
+        self.client.post(reverse("listings:toggle-favorite", args=[self.cars[0].pk]))
+        self.client.post(reverse("listings:toggle-favorite", args=[self.cars[1].pk]))
+        self.assertEqual(self.favorited(), ({self.cars[1].pk}, 1))
+
+    @override_settings(FAVORITES_SHARED_CACHE=None)
+    def test_without_a_shared_cache_favorites_are_loaded_once_per_request(self):
+        self.client.post(reverse("listings:toggle-favorite", args=[self.cars[0].pk]))
+        self.assertEqual(self.favorited(), ({self.cars[0].pk}, 1))
+        self.assertEqual(self.favorited(), ({self.cars[0].pk}, 1))
+        self.assertIsNone(caches["default"].get(favorites_cache_key(self.buyer.pk)))
+
+        # Nothing outlives the request, so any change shows up on the next one
+        Favorite.objects.filter(user=self.buyer).delete()
+        self.assertEqual(self.favorited(), (set(), 1))
+
+    def test_toggle_changes_the_detail_etag(self):
+        url = reverse("listings:car-detail", args=[self.cars[0].pk])
+        etag = self.client.get(url)["ETag"]
+        self.client.post(reverse("listings:toggle-favorite", args=[self.cars[0].pk]))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["is_favorited"])
+
+
+class FavoriteListQueryCountTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:favorite-list-create")
+
+    def setUp(self):
+        self.category = Category.objects.create(name="SUV", slug="suv")
+        self.buyer = self.create_buyer("buyer1")
+        self.client.force_authenticate(self.buyer)
+
+    def add_favorites(self, count, index):
+        dealer = self.create_dealer(f"dealer{index}")
+        for car in self.create_cars(dealer, count, self.category, [self.buyer]):
+            Favorite.objects.create(user=self.buyer, car=car)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()["results"]
+
+    def test_query_count_is_constant_in_favorite_count(self):
+        self.add_favorites(2, 1)
+        few_queries, results = self.count_queries()
+        self.assertEqual(len(results), 2)
+
+        for index in range(2, 5):
+            self.add_favorites(5, index)
+        many_queries, results = self.count_queries()
+        self.assertEqual(len(results), 17)
+        self.assertEqual(few_queries, many_queries)
+
+        car = results[0]["car"]
+        self.assertTrue(car["is_favorited"])
+        self.assertEqual((car["review_count"], car["dealer"]["car_count"]), (1, 5))
+
+
+class CarRatingAggregateTests(MarketplaceDataMixin, APITestCase):
+    def setUp(self):
+        self.dealer = self.create_dealer("dealer1")
+        self.cars = self.create_cars(self.dealer, 2, images=0)
+        self.buyers = [self.create_buyer(f"buyer{index}") for index in range(3)]
+
+    def assertRatings(self, car, rating_sum, histogram):
+        car.refresh_from_db()
+        counts = [getattr(car, f"rating_{rating}_count") for rating in range(1, 6)]
+        self.assertEqual((car.rating_sum, car.rating_count, counts), (rating_sum, sum(counts), histogram))
+        self.assertAlmostEqual(car.rating_average, rating_sum / car.rating_count if car.rating_count else 0.0)
+
+    def test_reviews_are_counted_through_create_edit_and_delete(self):
+        car = self.cars[0]
+        self.client.force_authenticate(self.buyers[0])
+        self.client.post(reverse("listings:car-reviews-create", args=[car.pk]), {"rating": 4})
+        review = Review.objects.create(car=car, user=self.buyers[1], rating=2)
+        self.assertRatings(car, 6, [0, 1, 0, 1, 0])
+
+        self.client.force_authenticate(self.buyers[1])
+        self.client.patch(reverse("listings:review-detail", args=[review.pk]), {"rating": 5})
+        self.assertRatings(car, 9, [0, 0, 0, 1, 1])
+
+        self.client.delete(reverse("listings:review-detail", args=[review.pk]))
+        self.assertRatings(car, 4, [0, 0, 0, 1, 0])
+
+        # Reviews cascading from a deleted user are uncounted too
+        self.buyers[0].delete()
+        self.assertRatings(car, 0, [0, 0, 0, 0, 0])
+
+    def test_cascaded_review_deletes_cost_the_same_for_any_number_of_reviews(self):
+        dealership = Dealership.objects.create(dealer=self.dealer, name="dealer1 Motors", published=True)
+        buyers = self.buyers + [self.create_buyer(f"buyer{index}") for index in range(3, 8)]
+        few, many = self.create_cars(self.dealer, 2, images=0)
+        for car, reviewers in ((few, buyers[:2]), (many, buyers)):
+            for reviewer in reviewers:
+                Review.objects.create(car=car, user=reviewer, rating=4)
+
+        costs = []
+        for car in (few, many):
+            with CaptureQueriesContext(connection) as queries:
+                Car.objects.get(pk=car.pk).delete()
+            costs.append(len(queries))
+        self.assertEqual(costs[0], costs[1])
+
+        # A deleted user's reviews are uncounted in one pass over their cars
+        first, second = self.cars
+        for car in self.cars:
+            Review.objects.create(car=car, user=buyers[0], rating=5)
+            Review.objects.create(car=car, user=buyers[1], rating=1)
+        with CaptureQueriesContext(connection) as queries:
+            buyers[0].delete()
+        self.assertLess(len([query for query in queries if "UPDATE" in query["sql"]]), 4)
+        for car in self.cars:
+            self.assertRatings(car, 1, [1, 0, 0, 0, 0])
+        dealership.refresh_from_db()
+        self.assertEqual((dealership.total_cars, dealership.average_rating), (2, 1.0))
+
+    def test_cars_can_be_ordered_by_rating(self):
+        Review.objects.create(car=self.cars[0], user=self.buyers[0], rating=3)
+        Review.objects.create(car=self.cars[1], user=self.buyers[0], rating=5)
+        Review.objects.create(car=self.cars[1], user=self.buyers[1], rating=4)
+
+        results = self.client.get(reverse("listings:car-list-create"), {"ordering": "-rating_average"}).json()["results"]
+        self.assertEqual(
+            [(car["id"], car["average_rating"], car["review_count"]) for car in results],
+            [(self.cars[1].pk, 4.5, 2), (self.cars[0].pk, 3.0, 1)],
+        )
+
+        Car.objects.update(rating_sum=0, rating_count=0, rating_average=0)
+        rebuild_car_ratings()
+        self.assertRatings(self.cars[1], 9, [0, 0, 0, 1, 1])
+
+
+@override_settings(CAR_DETAIL_REVIEWS=3)
+class CarReviewSummaryTests(MarketplaceDataMixin, APITestCase):
+    def setUp(self):
+        self.car = self.create_cars(self.create_dealer("dealer1"), 1, images=0)[0]
+        self.reviews = []
+        self.add_reviews(2)
+        self.client.force_authenticate(self.create_buyer("reader"))
+
+    def add_reviews(self, count):
+        start = len(self.reviews)
+        for index in range(start, start + count):
+            self.reviews.append(Review.objects.create(
+                car=self.car, user=self.create_buyer(f"buyer{index}"), rating=index % 5 + 1
+            ))
+
+    def get_detail(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse("listings:car-detail", args=[self.car.pk])).json()
+        return len(queries), data
+
+    def test_detail_embeds_a_bounded_summary(self):
+        self.get_detail()  # warms the reader's favorite set
+        few_queries, data = self.get_detail()
+        self.assertEqual(len(data["reviews"]), 2)
+
+        self.add_reviews(10)
+        many_queries, data = self.get_detail()
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual([review["id"] for review in data["reviews"]], [r.pk for r in self.reviews[:-4:-1]])
+        self.assertEqual(data["review_count"], 12)
+        self.assertEqual(data["rating_distribution"], {"1": 3, "2": 3, "3": 2, "4": 2, "5": 2})
+
+    def test_review_list_is_paged_by_cursor(self):
+        self.add_reviews(3)
+        url = reverse("listings:car-reviews-list", args=[self.car.pk])
+        seen = []
+        response = self.client.get(url, {"page_size": 2})
+        while True:
+            data = response.json()
+            seen += [review["id"] for review in data["results"]]
+            if not data["next"]:
+                break
+            response = self.client.get(data["next"])
+        self.assertEqual(seen, [review.pk for review in reversed(self.reviews)])
+
+
+class SparseFieldsetTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:car-list-create")
+
+    def setUp(self):
+        category = Category.objects.create(name="SUV", slug="suv")
+        self.cars = self.create_cars(self.create_dealer("dealer1"), 2, category, [self.create_buyer("buyer1")])
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return queries, response.json()
+
+    def test_fields_limit_the_payload_and_the_queries(self):
+        full_queries, _ = self.get(self.url)
+        queries, data = self.get(self.url, fields="id,title,price,primary_image")
+
+        self.assertEqual(set(data["results"][0]), {"id", "title", "price", "primary_image"})
+        self.assertLess(len(queries), len(full_queries))
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("listings_dealer", sql)
+        self.assertNotIn("listings_category", sql)
+
+    def test_unexpanded_relations_are_rendered_as_ids(self):
+        car = self.cars[0]
+        _, data = self.get(reverse("listings:car-detail", args=[car.pk]), expand="dealer")
+        self.assertEqual(data["category"], car.category_id)
+        self.assertEqual(data["dealer"]["id"], car.dealer_id)
+
+        _, data = self.get(
+            reverse("listings:car-detail", args=[car.pk]), fields="id,dealer,reviews", expand=""
+        )
+        self.assertEqual(data, {"id": car.pk, "dealer": car.dealer_id, "reviews": data["reviews"]})
+        self.assertEqual(len(data["reviews"]), 1)
+
+
+class ORJSONRendererTests(MarketplaceDataMixin, APITestCase):
+    def test_output_matches_json_renderer(self):
+        self.create_cars(self.create_dealer("dealer1"), 2)
+        data = self.client.get(reverse("listings:car-list-create")).data
+        data["extra"] = {
+            "price": Decimal("4500000.50"),
+            "at": datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+            1: "line\u2028break",
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parser_reads_json_bodies(self):
+        self.assertEqual(ORJSONParser().parse(io.BytesIO('{"q": "café"}'.encode())), {"q": "café"})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b"{bad"))
+
+
+class QueryBudgetTests(MarketplaceDataMixin, APITestCase):
+    """Read endpoints against their declared query_budget as the data grows"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name="SUV", slug="suv")
+        self.buyer = self.create_buyer("buyer0")
+        self.reviewers = [self.create_buyer(f"reviewer{index}") for index in range(3)]
+        self.dealers = []
+
+    def add_dealer(self, cars):
+        dealer = self.create_dealer(f"dealer{len(self.dealers)}")
+        Dealership.objects.create(dealer=dealer, name=f"{dealer.last_name} Motors", published=True)
+        for car in self.create_cars(dealer, cars, self.category, self.reviewers):
+            Favorite.objects.create(user=self.buyer, car=car)
+        self.dealers.append(dealer)
+        return dealer
+
+    def read_requests(self):
+        dealer, car = self.dealers[0], self.dealers[0].cars.first()
+        # The last dealer added has the most cars, which exposes N+1 queries
+        anonymous, buyer, owner = None, self.buyer, self.dealers[-1].user
+        return [
+            (anonymous, reverse("listings:category-list"), {}),
+            (anonymous, reverse("listings:car-list-create"), {}),
+            (buyer, reverse("listings:car-list-create"), {"pagination": "cursor"}),
+            (buyer, reverse("listings:car-detail", args=[car.pk]), {}),
+            (anonymous, reverse("listings:car-facets"), {}),
+            (anonymous, reverse("listings:car-search-suggestions"), {"q": "to"}),
+            (buyer, reverse("listings:car-reviews-list", args=[car.pk]), {}),
+            (buyer, reverse("listings:favorite-list-create"), {}),
+            (anonymous, reverse("listings:dealership-list"), {}),
+            (anonymous, reverse("listings:dealership-detail", args=[dealer.dealership.pk]), {}),
+            (anonymous, reverse("listings:dealership-stats"), {}),
+            (anonymous, reverse("listings:dealer-list"), {}),
+            (owner, reverse("listings:dealer-cars"), {}),
+            (owner, reverse("listings:dealer-car-detail", args=[self.dealers[-1].cars.first().pk]), {}),
+        ]
+
+    def assertWithinQueryBudget(self, response):
+        budget = get_query_budget(response.resolver_match)
+        self.assertIsNotNone(budget, f"{response.resolver_match.view_name} declares no query_budget")
+        self.assertLessEqual(
+            response.metrics.queries,
+            budget,
+            "\n".join(sql for sql, _ in response.metrics.sql),
+        )
+
+    def authenticate(self, user):
+        """Real token credentials; budgets include the token lookup of a cache miss"""
+        token_cache.clear()
+        if user is None:
+            self.client.credentials()
+        else:
+            self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0].key}")
+
+    def test_read_endpoints_stay_within_budget(self):
+        for cars in (1, 6):
+            for _ in range(2):
+                self.add_dealer(cars)
+            for user, url, params in self.read_requests():
+                self.authenticate(user)
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200, url)
+                self.assertWithinQueryBudget(response)
+
+    def test_timings_are_reported_and_aggregated_per_url_name(self):
+        self.add_dealer(2)
+        endpoint_stats.reset()
+        with override_settings(INSTRUMENTATION={**settings.INSTRUMENTATION, "HEADERS": True}):
+            response = self.client.get(reverse("listings:car-list-create"))
+
+        self.assertEqual(response["X-DB-Queries"], str(response.metrics.queries))
+        self.assertIn("serialize;dur=", response["Server-Timing"])
+        self.assertGreater(response.metrics.serializer_time, 0)
+        self.assertGreater(response.metrics.render_time, 0)
+        stats = endpoint_stats.snapshot()["listings:car-list-create"]
+        self.assertEqual((stats["requests"], stats["queries_max"]), (1, response.metrics.queries))
+
+
+class SeedMarketplaceTests(MarketplaceDataMixin, APITestCase):
+    def snapshot(self):
+        return list(
+            Car.objects.order_by("stock_number").values_list(
+                "stock_number", "title", "price", "dealer__user__username", "rating_sum", "rating_count"
+            )
+        )
+
+    def test_seeding_is_deterministic_consistent_and_removable(self):
+        counts = seed_marketplace(200, seed=7, batch_size=64)
+        self.assertEqual((counts["cars"], counts["dealers"], counts["buyers"]), (200, 5, 40))
+        self.assertEqual(Review.objects.count(), counts["reviews"])
+        first = self.snapshot()
+
+        # The precomputed aggregates match what the reviews add up to
+        stored = {
+            car.pk: {field: getattr(car, field) for field in RATING_FIELDS}
+            for car in Car.objects.all()
+        }
+        self.assertEqual(stored, compute_car_ratings(list(stored)))
+        dealership = Dealership.objects.order_by("-total_cars").first()
+        self.assertEqual(dealership.total_cars, dealership.dealer.cars.filter(published=True).count())
+
+        delete_seed_marketplace()
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Car.objects.exists())
+
+        seed_marketplace(200, seed=7, batch_size=64)
+        self.assertEqual(self.snapshot(), first)
+
+    @override_settings(FAVORITES_SHARED_CACHE="default")
+    def test_removal_refreshes_the_rows_that_rendered_the_seed(self):
+        seed_marketplace(50, seed=3, batch_size=64)
+        seeded_buyer = User.objects.filter(username__startswith=SEED_PREFIX, role="BUYER").first()
+        token = Token.objects.create(user=seeded_buyer)
+        token_cache.set(token.key, seeded_buyer)
+
+        dealer = self.create_dealer("dealer1")
+        dealership = Dealership.objects.create(dealer=dealer, name="dealer1 Motors", published=True)
+        car = self.create_cars(dealer, 1, reviewers=[seeded_buyer], images=0)[0]
+        buyer = self.create_buyer("buyer1")
+        Favorite.objects.create(user=buyer, car=Car.objects.exclude(pk=car.pk).first())
+        caches["default"].set(favorites_cache_key(buyer.pk), {0})
+        dealership.refresh_from_db()
+        self.assertEqual(dealership.average_rating, 1.0)
+
+        delete_seed_marketplace()
+        car.refresh_from_db()
+        dealership.refresh_from_db()
+        self.assertEqual((car.rating_count, car.rating_sum, dealership.average_rating), (0, 0, 0.0))
+        self.assertIsNone(token_cache.get(token.key))
+        self.assertIsNone(caches["default"].get(favorites_cache_key(buyer.pk)))
+        self.assertFalse(Favorite.objects.exists())
+
+
+class RequestProfilingTests(MarketplaceDataMixin, APITestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        self.settings_override = override_settings(
+            PROFILING={"ENABLED": True, "SAMPLE_RATE": 0.0, "OUTPUT_DIR": self.output_dir}
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.create_cars(self.create_dealer("dealer"), 3)
+
+    def test_staff_header_writes_pstats_collapsed_stacks_and_sql(self):
+        staff = self.create_buyer("staff")
+        staff.is_staff = True
+        staff.save()
+        self.client.force_authenticate(staff)
+        response = self.client.get(reverse("listings:car-list-create"), HTTP_X_PROFILE="1")
+
+        base = os.path.join(self.output_dir, "listings.car-list-create", response["X-Profile-Id"])
+        stats = pstats.Stats(f"{base}.prof")
+        self.assertTrue(any(name == "list" for _, _, name in stats.stats))
+        with open(f"{base}.collapsed") as f:
+            for line in f:
+                self.assertRegex(line, r"^\S.*;.* \d+$")
+        with open(f"{base}.json") as f:
+            report = json.load(f)
+        self.assertEqual((report["reason"], report["user"]), ("header", staff.pk))
+        self.assertEqual(len(report["sql"]), response.metrics.queries)
+
+    def test_header_is_ignored_for_other_users_and_sampling_follows_views(self):
+        self.client.force_authenticate(self.create_buyer("buyer"))
+        response = self.client.get(reverse("listings:car-list-create"), HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-Id", response)
+
+        self.client.force_authenticate(None)
+        with override_settings(PROFILING={
+            **settings.PROFILING, "SAMPLE_RATE": 1.0, "VIEWS": ["listings:dealership-list"],
+        }):
+            self.assertNotIn("X-Profile-Id", self.client.get(reverse("listings:car-list-create")))
+            response = self.client.get(reverse("listings:dealership-list"))
+        self.assertIn("X-Profile-Id", response)
+        self.assertEqual(os.listdir(self.output_dir), ["listings.dealership-list"])
+
+
+@override_settings(RESPONSE_CACHE={**settings.RESPONSE_CACHE, "ENABLED": True})
+class PrometheusMetricsTests(MarketplaceDataMixin, APITestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.create_cars(self.create_dealer("dealer"), 2)
+
+    def scrape(self, **headers):
+        response = self.client.get("/metrics", **headers)
+        return response, response.content.decode()
+
+    def write_snapshot(self, directory, name, snapshot):
+        with open(os.path.join(directory, name), "w") as f:
+            json.dump(snapshot, f)
+
+    def test_requests_are_exported_as_counters_and_histograms(self):
+        for _ in range(2):
+            self.client.get(reverse("listings:car-list-create"))
+        with override_settings(DEBUG=True):
+            response, text = self.scrape()
+
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        self.assertIn(
+            'leonexus_http_requests_total{view="listings:car-list-create",method="GET",status="200"} 2\n',
+            text,
+        )
+        self.assertIn(
+            'leonexus_http_request_duration_seconds_count{view="listings:car-list-create"} 2\n', text
+        )
+        self.assertIn('leonexus_db_queries_per_request_bucket{view="listings:car-list-create",le="+Inf"} 2\n', text)
+        self.assertIn(
+            'leonexus_response_cache_requests_total{view="CarListCreateView",outcome="hit"} 1\n', text
+        )
+
+    def test_snapshots_of_other_processes_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        buckets = [0] * (len(metrics.LATENCY_BUCKETS) + 1)
+        with open(os.path.join(directory, "1.json"), "w") as f:
+            json.dump({
+                "leonexus_http_requests_total": [[["listings:car-list-create", "GET", "200"], 5]],
+                "leonexus_login_duration_seconds": [[["success"], [1, *buckets, 0.001]]],
+            }, f)
+
+        with override_settings(METRICS={"MULTIPROCESS_DIR": directory, "TOKEN": "secret"}):
+            self.client.get(reverse("listings:car-list-create"))
+            response, _ = self.scrape()
+            self.assertEqual(response.status_code, 401)
+            _, text = self.scrape(HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertIn(f"{os.getpid()}.json", os.listdir(directory))
+        self.assertIn(
+            'leonexus_http_requests_total{view="listings:car-list-create",method="GET",status="200"} 6\n',
+            text,
+        )
+        self.assertIn('leonexus_login_duration_seconds_bucket{outcome="success",le="0.005"} 1\n', text)
+        self.assertIn('leonexus_login_duration_seconds_sum{outcome="success"} 0.001\n', text)
+
+    def test_endpoint_without_a_token_is_only_served_in_debug(self):
+        with override_settings(METRICS={"TOKEN": None}):
+            response, _ = self.scrape()
+            self.assertEqual(response.status_code, 404)
+            with override_settings(DEBUG=True):
+                response, _ = self.scrape()
+            self.assertEqual(response.status_code, 200)
+
+    def test_files_of_stopped_processes_are_folded_into_the_aggregate(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        gone = 2 ** 22 + 1
+        self.write_snapshot(directory, metrics.AGGREGATE_FILE, {
+            "leonexus_http_requests_total": [[["listings:car-list-create", "GET", "200"], 2]],
+        })
+        self.write_snapshot(directory, f"{gone}.json", {
+            "leonexus_http_requests_total": [[["listings:car-list-create", "GET", "200"], 2]],
+            "leonexus_db_pool_size": [[["default", str(gone)], 3]],
+        })
+
+        with override_settings(METRICS={"MULTIPROCESS_DIR": directory}):
+            first = metrics.registry.render()
+            self.assertNotIn(f"{gone}.json", os.listdir(directory))
+            second = metrics.registry.render()
+
+        for text in (first, second):
+            self.assertIn(
+                'leonexus_http_requests_total{view="listings:car-list-create",method="GET",status="200"} 4\n',
+                text,
+            )
+            self.assertNotIn(f'pid="{gone}"', text)
+
+    def test_file_left_under_a_reused_pid_is_folded_in_before_the_first_flush(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.write_snapshot(directory, f"{os.getpid()}.json", {
+            "leonexus_http_requests_total": [[["listings:car-list-create", "GET", "200"], 7]],
+        })
+        registry = metrics.Registry()
+        requests = registry.counter(
+            "leonexus_http_requests_total", "Requests", ("view", "method", "status")
+        )
+        requests.inc(view="listings:car-list-create", method="GET", status="200")
+
+        with override_settings(METRICS={"MULTIPROCESS_DIR": directory}):
+            registry.flush(force=True)
+            registry.flush(force=True)
+            samples = registry.collect()["leonexus_http_requests_total"]
+
+        self.assertEqual(samples, {("listings:car-list-create", "GET", "200"): 8})
+        with open(os.path.join(directory, metrics.AGGREGATE_FILE)) as f:
+            self.assertEqual(
+                json.load(f)["leonexus_http_requests_total"], [[["listings:car-list-create", "GET", "200"], 7]]
+            )
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_forked_workers_start_without_the_values_of_the_parent(self):
+        self.client.get(reverse("listings:car-list-create"))
+        self.assertTrue(metrics.http_requests.snapshot())
+
+        pid = os.fork()
+        if pid == 0:
+            # The child reports through its exit status only
+            os._exit(0 if metrics.http_requests.snapshot() == [] else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertTrue(metrics.http_requests.snapshot())
+
+    def test_pool_statistics_are_collected_and_stale_gauges_dropped(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        for pid in (os.getppid(), 2 ** 22 + 1):  # a live process and one that is gone
+            with open(os.path.join(directory, f"{pid}.json"), "w") as f:
+                json.dump({
+                    "leonexus_db_pool_size": [[["default", str(pid)], 3]],
+                    "leonexus_db_pool_timeouts_total": [[["default"], 1]],
+                }, f)
+        stats = {"pool_size": 4, "pool_max": 10, "pool_available": 1, "requests_waiting": 2,
+                 "requests_num": 50, "requests_queued": 5, "requests_wait_ms": 1500, "requests_errors": 1}
+        pooled = SimpleNamespace(
+            settings_dict={"OPTIONS": {"pool": {"max_size": 10}}},
+            pool=SimpleNamespace(pop_stats=lambda: stats),
+        )
+
+        with mock.patch("django.db.connections", {"default": pooled}), override_settings(
+            METRICS={"MULTIPROCESS_DIR": directory}
+        ):
+            text = metrics.registry.render()
+
+        self.assertIn(f'leonexus_db_pool_size{{alias="default",pid="{os.getpid()}"}} 4\n', text)
+        self.assertIn(f'leonexus_db_pool_size{{alias="default",pid="{os.getppid()}"}} 3\n', text)
+        self.assertNotIn(f'pid="{2 ** 22 + 1}"', text)
+        self.assertIn('leonexus_db_pool_timeouts_total{alias="default"} 3\n', text)
+        self.assertIn('leonexus_db_pool_wait_seconds_total{alias="default"} 1.5\n', text)
+
+
+class CarSearchTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:car-list-create")
+
+    def setUp(self):
+        self.dealer = self.create_dealer("dealer1")
+
+    def create_car(self, title, description="", **fields):
+        make, model = title.split(" ", 1)
+        return Car.objects.create(
+            dealer=self.dealer, title=title, make=make, model=model, location="Nairobi",
+            year=2022, price=fields.pop("price", 3_000_000), description=description,
+            published=True, **fields,
+        )
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [car["id"] for car in response.json()["results"]]
+
+    def indexed_ids(self):
+        if connection.vendor == "postgresql":
+            return set(Car.objects.filter(search_vector__isnull=False).values_list("pk", flat=True))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid FROM listings_car_fts")
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_every_term_must_match_as_a_word_prefix(self):
+        prado = self.create_car("Toyota Prado", "diesel, leather seats")
+        hilux = self.create_car("Toyota Hilux", "diesel pickup")
+        self.create_car("Honda Fit", "petrol hatchback")
+
+        self.assertEqual(set(self.search(search="toyota")), {prado.pk, hilux.pk})
+        self.assertEqual(self.search(search="toy diesel leath"), [prado.pk])
+        self.assertEqual(self.search(search="Prado!!"), [prado.pk])
+        self.assertEqual(self.search(search="landcruiser"), [])
+
+    def test_results_are_ranked_unless_an_ordering_is_given(self):
+        mention = self.create_car("Toyota Corolla", "swapped for a hilux", price=1_000_000)
+        exact = self.create_car("Toyota Hilux", "hilux double cab", price=5_000_000)
+
+        self.assertEqual(self.search(search="hilux"), [exact.pk, mention.pk])
+        self.assertEqual(self.search(search="hilux", ordering="price"), [mention.pk, exact.pk])
+
+    def test_signals_keep_the_index_in_step_with_the_cars(self):
+        car = self.create_car("Toyota Prado")
+        self.assertIn(car.pk, self.indexed_ids())
+
+        car.title, car.model = "Toyota Harrier", "Harrier"
+        car.save()
+        self.assertEqual(self.search(search="harrier"), [car.pk])
+        self.assertEqual(self.search(search="prado"), [])
+
+        car.delete()
+        self.assertNotIn(car.pk, self.indexed_ids())
+
+
+class KeysetPaginationTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:car-list-create")
+
+    def setUp(self):
+        self.dealer = self.create_dealer("dealer1")
+        self.cars = self.create_cars(self.dealer, 7, images=0)
+
+    def walk(self, first, get):
+        """Ids of every page following ``next`` from ``first``, then ``previous`` back"""
+        forward, backward = [], []
+        data = first
+        while True:
+            forward.append([car["id"] for car in data["results"]])
+            if not data["next"]:
+                break
+            data = get(data["next"])
+        while data["previous"]:
+            data = get(data["previous"])
+            backward.insert(0, [car["id"] for car in data["results"]])
+        return forward, backward
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_walk_forward_and_back_across_ties(self):
+        # Three runs of equal created_at, so only the id breaks the ties
+        instants = [datetime(2026, 1, day, tzinfo=dt_timezone.utc) for day in (3, 3, 3, 2, 2, 1, 1)]
+        for car, instant in zip(self.cars, instants):
+            Car.objects.filter(pk=car.pk).update(created_at=instant)
+        expected = [
+            car.pk for car, _ in sorted(zip(self.cars, instants), key=lambda pair: (pair[1], pair[0].pk), reverse=True)
+        ]
+
+        first = self.get(self.url, {"pagination": "cursor", "page_size": 2, "count": "exact"})
+        self.assertEqual(first["count"], 7)
+        self.assertIsNone(first["previous"])
+        forward, backward = self.walk(first, self.get)
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual([len(page) for page in forward], [2, 2, 2, 1])
+        self.assertEqual(backward, forward[:-1])
+
+    def test_nullable_sort_keys_keep_nulls_last_both_ways(self):
+        suv, van = Category.objects.create(name="SUV", slug="suv"), Category.objects.create(name="Van", slug="van")
+        for car, category in zip(self.cars, [van, None, suv, None, van, suv, None]):
+            Car.objects.filter(pk=car.pk).update(category=category)
+        cars = Car.objects.all()
+        expected = [
+            car.pk for car in sorted(cars, key=lambda car: (car.category_id is None, car.category_id or 0, car.pk))
+        ]
+
+        factory = APIRequestFactory()
+
+        def get(url):
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(Car.objects.order_by("category"), Request(factory.get(url)))
+            return paginator.get_paginated_response([{"id": car.pk} for car in page]).data
+
+        forward, backward = self.walk(get(f"{self.url}?page_size=3"), get)
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual(backward, forward[:-1])
+
+    def test_tampered_cursors_are_rejected(self):
+        first = self.get(self.url, {"pagination": "cursor", "page_size": 2})
+        cursor = parse_qs(urlsplit(first["next"]).query)["cursor"][0]
+        position = json.loads(base64.urlsafe_b64decode(cursor))
+
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        for tampered in [
+            cursor[:-4] + "!!!!",
+            encode({"p": position["p"][:1]}),
+            encode({"p": ["yesterday", position["p"][1]]}),
+            encode({"p": [position["p"][0], "last"]}),
+            encode([1, 2]),
+        ]:
+            with self.subTest(cursor=tampered):
+                response = self.client.get(self.url, {"cursor": tampered})
+                self.assertEqual(response.status_code, 404)
+
+
+class DealershipRollupTests(MarketplaceDataMixin, APITestCase):
+    def setUp(self):
+        self.dealerships = []
+        for name in ("dealer1", "dealer2"):
+            dealer = self.create_dealer(name)
+            self.dealerships.append(Dealership.objects.create(dealer=dealer, name=f"{name} Motors", published=True))
+        self.buyers = [self.create_buyer(f"buyer{index}") for index in range(2)]
+
+    def assertRollups(self, dealership, total_cars, locations_served, average_rating):
+        dealership.refresh_from_db()
+        self.assertEqual(
+            (dealership.total_cars, dealership.locations_served, dealership.average_rating),
+            (total_cars, locations_served, average_rating),
+        )
+        # The signal-maintained columns agree with a full recompute
+        self.assertEqual(
+            compute_rollups([dealership.dealer_id])[dealership.dealer_id],
+            (total_cars, locations_served, average_rating),
+        )
+
+    def test_rollups_follow_car_create_publish_delete_and_reassignment(self):
+        first, second = self.dealerships
+        self.create_cars(first.dealer, 2, reviewers=self.buyers, images=0)
+        # Reloaded from the database, as the views do, so the rating
+        # aggregates written by the review signals are current
+        prado, hilux = Car.objects.order_by("pk")
+        hilux.location = "Mombasa"
+        hilux.save()
+        self.assertRollups(first, 2, ["Mombasa", "Nairobi"], 1.5)
+
+        hilux.published = False
+        hilux.save()
+        self.assertRollups(first, 1, ["Nairobi"], 1.5)
+
+        Review.objects.filter(car=prado, rating=1).delete()
+        self.assertRollups(first, 1, ["Nairobi"], 2.0)
+
+        prado.refresh_from_db()
+        prado.dealer = second.dealer
+        prado.save()
+        self.assertRollups(first, 0, [], 0.0)
+        self.assertRollups(second, 1, ["Nairobi"], 2.0)
+
+        hilux.published = True
+        hilux.save()
+        self.assertRollups(first, 1, ["Mombasa"], 1.5)
+
+        prado.delete()
+        self.assertRollups(second, 0, [], 0.0)
+
+    def test_saves_that_leave_the_rolled_up_columns_alone_skip_the_refresh(self):
+        first, second = self.dealerships
+        car = Car.objects.get(pk=self.create_cars(first.dealer, 1, images=0)[0].pk)
+        car.price += 1
+        with CaptureQueriesContext(connection) as queries:
+            car.save()
+        self.assertFalse([query for query in queries if "listings_dealership" in query["sql"]])
+
+        # Later saves of the same instance compare against what the last one stored
+        car.dealer = second.dealer
+        car.save()
+        self.assertRollups(first, 0, [], 0.0)
+        self.assertRollups(second, 1, ["Nairobi"], 0.0)
+        car.dealer = first.dealer
+        car.published = False
+        car.save()
+        self.assertRollups(first, 0, [], 0.0)
+        self.assertRollups(second, 0, [], 0.0)
+        car.published = True
+        car.save()
+        self.assertRollups(first, 1, ["Nairobi"], 0.0)
+
+    def test_rebuild_repairs_rollups_written_around_the_signals(self):
+        first, second = self.dealerships
+        self.create_cars(first.dealer, 3, reviewers=self.buyers[:1], images=0)
+        Dealership.objects.update(total_cars=9, locations_served=["Kisumu"], average_rating=4.0)
+
+        self.assertEqual(rebuild_dealership_rollups(), 2)
+        self.assertRollups(first, 3, ["Nairobi"], 1.0)
+        self.assertRollups(second, 0, [], 0.0)
+
+
+class DealershipStatsTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:dealership-stats")
+
+    def setUp(self):
+        invalidate_dealership_stats()
+        self.dealer = self.create_dealer("dealer1")
+        self.dealership = Dealership.objects.create(
+            dealer=self.dealer, name="dealer1 Motors", specialties=["SUV", "Trucks"], published=True
+        )
+        self.buyer = self.create_buyer("buyer1")
+        # Authenticated, so the response cache does not hide the snapshot
+        self.client.force_authenticate(self.buyer)
+
+    def get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_snapshot_is_computed_once_and_then_served_from_cache(self):
+        self.create_cars(self.dealer, 2, reviewers=[self.buyer], images=0)
+        stats, queries = self.get()
+        self.assertEqual(stats, {
+            "total_dealerships": 1,
+            "verified_dealerships": 0,
+            "published_dealerships": 1,
+            "total_cars_listed": 2,
+            "average_rating": 1.0,
+            "specialties": ["SUV", "Trucks"],
+        })
+        self.assertEqual(queries, 3)
+        self.assertEqual(self.get(), (stats, 0))
+
+    def test_snapshot_is_dropped_when_dealerships_cars_or_reviews_change(self):
+        stats, _ = self.get()
+
+        other = Dealership.objects.create(
+            dealer=self.create_dealer("dealer2"), name="dealer2 Motors", specialties=["Vans"], is_verified=True
+        )
+        stats, _ = self.get()
+        self.assertEqual(
+            (stats["total_dealerships"], stats["verified_dealerships"], stats["specialties"]),
+            (2, 1, ["SUV", "Trucks", "Vans"]),
+        )
+
+        car = self.create_cars(self.dealer, 1, images=0)[0]
+        self.assertEqual(self.get()[0]["total_cars_listed"], 1)
+
+        Review.objects.create(car=car, user=self.buyer, rating=4)
+        self.assertEqual(self.get()[0]["average_rating"], 4.0)
+
+        # Reviews of unpublished cars count too, though no rollup changes
+        car.published = False
+        car.save()
+        self.assertEqual(self.get()[0]["total_cars_listed"], 0)
+        Review.objects.create(car=car, user=self.create_buyer("buyer2"), rating=2)
+        self.assertEqual(self.get()[0]["average_rating"], 3.0)
+
+        other.delete()
+        self.assertEqual(self.get()[0]["total_dealerships"], 1)
+
+
+class SuggestionIndexTests(MarketplaceDataMixin, APITestCase):
+    def setUp(self):
+        self.dealer = self.create_dealer("dealer1")
+        # The shared index may hold cars of earlier tests, rolled back without signals
+        suggestion_index.invalidate()
+        self.addCleanup(suggestion_index.invalidate)
+
+    def create_car(self, make, model, location="Nairobi", published=True):
+        return Car.objects.create(
+            dealer=self.dealer, title=f"{make} {model}", make=make, model=model, location=location,
+            year=2022, price=3_000_000, published=published,
+        )
+
+    def test_build_counts_published_cars_and_matches_every_word(self):
+        self.create_car("Toyota", "Land Cruiser")
+        self.create_car("Toyota", "Prado", "Mombasa")
+        self.create_car("Tata", "Xenon", "Nakuru")
+        self.create_car("Tesla", "Model 3", published=False)
+
+        index = PrefixIndex(max_age=300)
+        with CaptureQueriesContext(connection) as queries:
+            index.build()
+        self.assertEqual(len(queries), 3)
+
+        self.assertEqual(index.suggest("T"), {"make": ["Toyota", "Tata"], "model": [], "location": []})
+        self.assertEqual(index.suggest("cru")["model"], ["Land Cruiser"])
+        self.assertEqual(index.suggest("NA"), {"make": [], "model": [], "location": ["Nairobi", "Nakuru"]})
+        self.assertEqual(index.suggest("na", limit=1)["location"], ["Nairobi"])
+        self.assertEqual(index.suggest("tes")["make"], [])
+
+    def test_server_startup_builds_the_index_and_releases_the_connection(self):
+        self.create_car("Toyota", "Prado")
+        with mock.patch("listings.suggestions.connections") as connections:
+            warm_suggestion_index()
+            self.assertTrue(suggestion_index.is_built)
+            connections.close_all.assert_called_once_with()
+
+            suggestion_index.invalidate()
+            with mock.patch.object(suggestion_index, "build", side_effect=DatabaseError), \
+                    self.assertLogs("listings.suggestions", "WARNING"):
+                warm_suggestion_index()
+        self.assertFalse(suggestion_index.is_built)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(suggestion_index.suggest("pra")["model"], ["Prado"])
+        self.assertEqual(len(queries), 3)
+
+    def test_index_is_rebuilt_after_its_max_age(self):
+        index = PrefixIndex(max_age=300)
+        index.build()
+        Car.objects.bulk_create([Car(
+            dealer=self.dealer, title="Subaru Forester", make="Subaru", model="Forester",
+            location="Nairobi", year=2022, price=3_000_000, published=True,
+        )])
+        self.assertEqual(index.suggest("sub")["make"], [])
+
+        with mock.patch("listings.suggestions.time.monotonic", return_value=time.monotonic() + 301):
+            self.assertEqual(index.suggest("sub")["make"], ["Subaru"])
+
+    def test_signals_insert_move_and_remove_values(self):
+        car = self.create_car("Toyota", "Prado")
+        self.assertEqual(suggestion_index.suggest("prado")["model"], ["Prado"])
+        self.assertTrue(suggestion_index.is_built)
+
+        with CaptureQueriesContext(connection) as queries:
+            other = self.create_car("Subaru", "Forester")
+            self.assertEqual(suggestion_index.suggest("sub")["make"], ["Subaru"])
+        self.assertFalse([query for query in queries if "COUNT" in query["sql"]])
+
+        car.model = "Harrier"
+        car.save()
+        self.assertEqual(suggestion_index.suggest("prado")["model"], [])
+        self.assertEqual(suggestion_index.suggest("harr")["model"], ["Harrier"])
+
+        car.published = False
+        car.save()
+        self.assertEqual(suggestion_index.suggest("toy")["make"], [])
+
+        # Loaded from the database and deleted, as the views do
+        Car.objects.get(pk=other.pk).delete()
+        self.assertEqual(suggestion_index.suggest("sub")["make"], [])
+        self.assertEqual(suggestion_index.suggest("nai")["location"], [])
+
+        car.published = True
+        car.save()
+        self.assertEqual(suggestion_index.suggest("nai")["location"], ["Nairobi"])
+
+
+class TokenCacheTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:user-profile")
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        caches["local"].clear()
+        self.user = self.create_buyer("buyer1")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        token_queries = [query for query in queries if "authtoken_token" in query["sql"]]
+        return response.status_code, len(token_queries)
+
+    def cache_modes(self):
+        for shared in (None, "local"):
+            with self.subTest(shared_cache=shared), override_settings(
+                TOKEN_AUTH_CACHE={**settings.TOKEN_AUTH_CACHE, "SHARED_CACHE": shared}
+            ):
+                yield shared
+
+    def test_cached_users_leave_out_the_password_hash(self):
+        for shared in self.cache_modes():
+            token_cache.clear()
+            self.assertEqual(self.get(), (200, 1))
+            self.assertEqual(self.get(), (200, 0))
+
+            if shared:
+                values = caches[shared].get(TokenCache.cache_key(self.token.key))
+            else:
+                values = token_cache._entries[self.token.key][0]
+            self.assertIn(self.user.username, values)
+            self.assertNotIn(self.user.password, values)
+
+            user = token_cache.get(self.token.key)
+            self.assertEqual(user.get_deferred_fields(), {"password"})
+            self.assertTrue(user.check_password("pass12345"))
+
+    def test_logout_ends_the_cached_session(self):
+        for _ in self.cache_modes():
+            self.get()
+            response = self.client.post(reverse("listings:auth-logout"))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.get()[0], 401)
+            self.token = Token.objects.create(user=self.user)
+            self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_deleted_tokens_and_deactivated_users_are_dropped(self):
+        for _ in self.cache_modes():
+            self.get()
+            Token.objects.filter(user=self.user).delete()
+            self.assertIsNone(token_cache.get(self.token.key))
+            self.assertEqual(self.get()[0], 401)
+
+            self.token = Token.objects.create(user=self.user)
+            self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+            self.get()
+            self.user.is_active = False
+            self.user.save()
+            self.assertIsNone(token_cache.get(self.token.key))
+            self.assertEqual(self.get()[0], 401)
+
+            self.user.is_active = True
+            self.user.save()
+
+    def test_writes_from_a_cached_user_keep_newer_columns(self):
+        for _ in self.cache_modes():
+            self.get()
+            # Changed elsewhere, e.g. in another worker, after the user was cached
+            User.objects.filter(pk=self.user.pk).update(email="changed@example.com")
+            self.assertEqual(self.get(), (200, 0))
+
+            response = self.client.patch(self.url, {"first_name": "Renamed"})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.post(reverse("listings:dealer-create"), {
+                "first_name": "Dealer", "last_name": "One", "phone": "0700000000",
+            })
+            self.assertEqual(response.status_code, 201)
+
+            user = User.objects.get(pk=self.user.pk)
+            self.assertEqual(
+                (user.email, user.first_name, user.role), ("changed@example.com", "Renamed", "DEALER")
+            )
+            self.assertTrue(user.check_password("pass12345"))
+            Dealer.objects.filter(user=user).delete()
+            User.objects.filter(pk=user.pk).update(role="BUYER", email=self.user.email)
+
+
+class LoginLookupTests(MarketplaceDataMixin, APITestCase):
+    url = reverse("listings:auth-login")
+
+    def setUp(self):
+        self.dealer = self.create_dealer("dealer1")
+        Token.objects.create(user=self.dealer.user)
+
+    def login(self, username, password="pass12345"):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {"username": username, "password": password})
+        user_queries = [query for query in queries if "listings_user" in query["sql"]]
+        return response, len(user_queries)
+
+    def test_username_or_any_case_of_the_email_logs_in_with_one_query(self):
+        for name in ("dealer1", "Dealer1@Example.com"):
+            with self.subTest(name=name):
+                response, queries = self.login(name)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(queries, 1)
+                self.assertEqual(response.json()["dealer_profile"]["id"], self.dealer.pk)
+
+        self.assertEqual(self.login("dealer1", "wrong")[0].status_code, 400)
+
+    def test_usernames_that_look_like_emails_are_found_with_one_query(self):
+        User.objects.create_user(username="jane@mail.example", email="jane@example.com", password="pass12345")
+        response, queries = self.login("jane@mail.example")
+        self.assertEqual((response.status_code, queries), (200, 1))
+        self.assertEqual(response.json()["username"], "jane@mail.example")
+
+        # An email match wins over another account's username
+        User.objects.create_user(username="dealer1@example.com", email="other@example.com", password="pass12345")
+        self.assertEqual(self.login("dealer1@example.com")[0].json()["user_id"], self.dealer.user.pk)
+
+    def test_emails_shared_by_several_accounts_are_refused(self):
+        User.objects.create_user(username="twin", email="DEALER1@example.com", password="pass12345")
+        response, queries = self.login("dealer1@example.com")
+        self.assertEqual((response.status_code, queries), (400, 1))
+        self.assertIsNone(EmailOrUsernameModelBackend().get_login_user("dealer1@example.com"))
+        # Their usernames still work
+        self.assertEqual(self.login("twin")[0].status_code, 200)
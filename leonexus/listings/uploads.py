@@ -0,0 +1,289 @@
+"""
+Background upload pipeline for car images.
+
+Requests only copy uploaded files into a local staging directory and
+``bulk_create`` ``PENDING`` ``CarImage`` rows; once the transaction commits,
+a per-process thread pool pushes the files to the configured storage
+backend concurrently and marks each row ``READY`` (or ``FAILED`` after
+``MAX_ATTEMPTS``). ``process_pending_images`` picks up rows left behind by a
+restart or that failed for good.
+
+Options come from ``settings.CAR_IMAGE_UPLOADS``:
+
+``STORAGE``              dotted path of the backend class
+``STAGING_DIR``          where files wait for upload
+``WORKERS``              uploads running at once per process
+``MAX_ATTEMPTS``         tries per image before it is marked ``FAILED``
+``RETRY_DELAY``          seconds before the first retry, doubled after each try
+``EAGER``                upload inside the request instead of the pool
+``STAGED_FILE_MAX_AGE``  seconds before ``sweep_staged_files`` deletes a
+                         staged file no image refers to
+
+The upload is only queued once the transaction commits, so the files of a
+request that rolls back are left without a row. ``stage_car_images`` removes
+them if its own insert fails; rollbacks after that are caught by
+``sweep_staged_files``, run by ``process_pending_images``.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "STORAGE": "listings.uploads.CloudinaryImageStorage",
+    "STAGING_DIR": os.path.join(settings.MEDIA_ROOT, "staging"),
+    "WORKERS": 4,
+    "MAX_ATTEMPTS": 3,
+    "RETRY_DELAY": 1.0,
+    "EAGER": False,
+    "STAGED_FILE_MAX_AGE": 3600,
+}
+
+IMAGE_FOLDER = "car_images/"
+
+# Staged names looked up per query by sweep_staged_files
+SWEEP_BATCH_SIZE = 500
+
+
+def get_option(name):
+    return getattr(settings, "CAR_IMAGE_UPLOADS", {}).get(name, DEFAULTS[name])
+
+
+class CloudinaryImageStorage:
+    """Uploads to Cloudinary; the stored value is the returned resource"""
+
+    def upload(self, path):
+        import cloudinary.uploader
+
+        return cloudinary.uploader.upload_resource(path, folder=IMAGE_FOLDER)
+
+
+class LocalImageStorage:
+    """
+    Copies files under ``MEDIA_ROOT/car_images`` and stores the relative
+    path as the public id. A stand-in for tests and offline development.
+    """
+
+    def __init__(self, location=None):
+        self.location = location or os.path.join(settings.MEDIA_ROOT, IMAGE_FOLDER)
+
+    def upload(self, path):
+        os.makedirs(self.location, exist_ok=True)
+        name = os.path.basename(path)
+        shutil.copyfile(path, os.path.join(self.location, name))
+        return f"{IMAGE_FOLDER}{os.path.splitext(name)[0]}"
+
+
+def get_storage():
+    return import_string(get_option("STORAGE"))()
+
+
+def stage_file(uploaded_file):
+    """Copy an uploaded file into the staging directory; returns its name"""
+    staging_dir = get_option("STAGING_DIR")
+    os.makedirs(staging_dir, exist_ok=True)
+    extension = os.path.splitext(uploaded_file.name or "")[1].lower()
+    name = f"{uuid.uuid4().hex}{extension}"
+    with open(os.path.join(staging_dir, name), "wb") as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    return name
+
+
+def staged_path(name):
+    return os.path.join(get_option("STAGING_DIR"), name)
+
+
+def remove_staged_files(names):
+    for name in names:
+        try:
+            os.remove(staged_path(name))
+        except OSError:
+            pass
+
+
+def sweep_staged_files(max_age=None):
+    """
+    Delete staged files older than ``max_age`` seconds that no ``CarImage``
+    refers to, left by requests that rolled back after staging; returns how
+    many were deleted. Younger files may belong to a transaction that has
+    not committed yet.
+    """
+    from .models import CarImage
+
+    staging_dir = get_option("STAGING_DIR")
+    if max_age is None:
+        max_age = get_option("STAGED_FILE_MAX_AGE")
+    try:
+        names = os.listdir(staging_dir)
+    except FileNotFoundError:
+        return 0
+    cutoff = time.time() - max_age
+    stale = []
+    for name in names:
+        try:
+            if os.path.getmtime(os.path.join(staging_dir, name)) < cutoff:
+                stale.append(name)
+        except OSError:
+            continue
+
+    orphans = []
+    for offset in range(0, len(stale), SWEEP_BATCH_SIZE):
+        batch = stale[offset:offset + SWEEP_BATCH_SIZE]
+        referenced = set(
+            CarImage.objects.filter(staged_file__in=batch).values_list("staged_file", flat=True)
+        )
+        orphans.extend(name for name in batch if name not in referenced)
+    remove_staged_files(orphans)
+    return len(orphans)
+
+
+def stage_car_images(car, uploaded_files, start_order=0):
+    """
+    Stage ``uploaded_files`` as pending images of ``car`` and queue their
+    upload for when the current transaction commits.
+    """
+    from .models import CarImage
+
+    start = time.perf_counter()
+    names = []
+    try:
+        for uploaded_file in uploaded_files:
+            names.append(stage_file(uploaded_file))
+        images = CarImage.objects.bulk_create(
+            CarImage(
+                car=car,
+                order=start_order + index,
+                status=CarImage.STATUS_PENDING,
+                staged_file=name,
+            )
+            for index, name in enumerate(names)
+        )
+    except BaseException:
+        remove_staged_files(names)
+        raise
+    metrics.observe(metrics.image_stage_duration, time.perf_counter() - start)
+    image_ids = [image.pk for image in images]
+    transaction.on_commit(lambda: schedule(image_ids))
+    return images
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_option("WORKERS"), thread_name_prefix="car-image-upload"
+            )
+        return _executor
+
+
+def schedule(image_ids):
+    """Upload ``image_ids`` in the pool, or right away in eager mode"""
+    if get_option("EAGER"):
+        for image_id in image_ids:
+            process_image(image_id)
+        return []
+    executor = get_executor()
+    return [executor.submit(run_in_worker, image_id) for image_id in image_ids]
+
+
+def run_in_worker(image_id, statuses=None):
+    # Pool threads hold their own connection; drop it once the task is done
+    try:
+        return process_image(image_id, statuses)
+    except Exception:
+        logger.exception("Uploading car image %s crashed", image_id)
+    finally:
+        connection.close()
+
+
+def claim(image_id, statuses):
+    """Move one image to ``PROCESSING`` unless another worker got it first"""
+    from .models import CarImage
+
+    return CarImage.objects.filter(pk=image_id, status__in=statuses).update(
+        status=CarImage.STATUS_PROCESSING
+    )
+
+
+def process_image(image_id, statuses=None):
+    """
+    Upload one staged image with retries; returns its final status, or None
+    if it was not claimable.
+    """
+    from .models import Car, CarImage
+
+    close_old_connections()
+    if not claim(image_id, statuses or [CarImage.STATUS_PENDING]):
+        return None
+    image = CarImage.objects.only("pk", "staged_file").get(pk=image_id)
+    path = staged_path(image.staged_file)
+    storage = get_storage()
+    max_attempts = get_option("MAX_ATTEMPTS")
+    delay = get_option("RETRY_DELAY")
+
+    error = ""
+    for attempt in range(1, max_attempts + 1):
+        CarImage.objects.filter(pk=image_id).update(attempts=F("attempts") + 1)
+        start = time.perf_counter()
+        try:
+            stored = storage.upload(path)
+        except Exception as exc:
+            metrics.observe(metrics.image_upload_duration, time.perf_counter() - start, outcome="error")
+            logger.warning("Upload of car image %s failed (attempt %s): %s", image_id, attempt, exc)
+            error = str(exc) or type(exc).__name__
+            if attempt < max_attempts:
+                time.sleep(delay * 2 ** (attempt - 1))
+            continue
+        metrics.observe(metrics.image_upload_duration, time.perf_counter() - start, outcome="success")
+
+        image.image = stored
+        image.status = CarImage.STATUS_READY
+        image.staged_file = ""
+        image.error = ""
+        image.save(update_fields=["image", "status", "staged_file", "error"])
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        metrics.inc(metrics.image_uploads, status=CarImage.STATUS_READY)
+        return CarImage.STATUS_READY
+
+    # The staged file is kept so process_pending_images can try again
+    CarImage.objects.filter(pk=image_id).update(status=CarImage.STATUS_FAILED, error=error[:1000])
+    Car.objects.filter(images__pk=image_id).touch()
+    response_cache.bump("image")
+    metrics.inc(metrics.image_uploads, status=CarImage.STATUS_FAILED)
+    return CarImage.STATUS_FAILED
+
+
+def process_images(image_ids, statuses=None, workers=None):
+    """Upload ``image_ids`` concurrently and wait; ``{image_id: status}``"""
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers or get_option("WORKERS")) as executor:
+        futures = {
+            executor.submit(run_in_worker, image_id, statuses): image_id
+            for image_id in image_ids
+        }
+    for future, image_id in futures.items():
+        results[image_id] = future.result()
+    return results
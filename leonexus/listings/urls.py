@@ -35,6 +35,8 @@ urlpatterns = [
     path('dealers/cars/create/', views.DealerCarCreateView.as_view(), name='dealer-car-create'),
     path('dealers/cars/<int:pk>/', views.DealerCarDetailView.as_view(), name='dealer-car-detail'),
     path('dealers/cars/bulk-publish/', views.bulk_toggle_car_publish, name='bulk-toggle-car-publish'),
+    path('dealers/cars/import/', views.import_dealer_cars, name='dealer-car-import'),
+    path('dealers/cars/export/', views.DealerCarExportView.as_view(), name='dealer-car-export'),
     
     # Category URLs
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
@@ -42,6 +44,9 @@ urlpatterns = [
     
     # Car URLs - Main CRUD Operations
     path('cars/', views.CarListCreateView.as_view(), name='car-list-create'),
+    path('cars/suggestions/', views.search_suggestions, name='car-search-suggestions'),
+    path('cars/export/', views.CarExportView.as_view(), name='car-export'),
+    path('cars/facets/', views.CarFacetView.as_view(), name='car-facets'),
     path('cars/<int:pk>/', views.CarDetailView.as_view(), name='car-detail'),
     
     # Review URLs
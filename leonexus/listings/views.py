@@ -1,14 +1,29 @@
 from django.shortcuts import render, get_object_or_404
 from rest_framework import generics, status, permissions, filters, parsers
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Avg, Max
-from django.db import models
+from django.db.models import Q, Avg, Count, Max, Prefetch
+from django.db import models, transaction
+from django.utils import timezone
 from .models import User, Dealer, Category, Car, CarImage, Review, Favorite, Buyer, Dealership
+from .conditional import ConditionalGetMixin
+from .imports import FORMATS as IMPORT_FORMATS, import_cars
+from .exports import export_response
+from .facets import compute_facets
+from .fieldsets import SparseFieldsetMixin
+from .instrumentation import query_budget
+from .pagination import KeysetPagination, ListingPagination
+from .parsers import CSVStreamParser, NDJSONStreamParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .response_cache import CachedResponseMixin, response_cache
+from .rollups import refresh_dealership_rollups
+from .search import CarSearchFilter, RankedOrderingFilter
+from .stats import get_dealership_stats
+from .suggestions import suggestion_index
 from .serializers import (
     UserSerializer, UserProfileSerializer, DealerSerializer, 
     DealerCreateSerializer, CategorySerializer, CarListSerializer,
@@ -44,7 +59,11 @@ class CustomAuthToken(ObtainAuthToken):
                                            context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        token, created = Token.objects.get_or_create(user=user)
+        # EmailOrUsernameModelBackend already joined the token and profiles
+        if hasattr(user, 'auth_token'):
+            token = user.auth_token
+        else:
+            token, created = Token.objects.get_or_create(user=user)
         
         # Prepare response data
         response_data = {
@@ -86,6 +105,7 @@ class CustomLogoutView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
+        # The token's post_delete signal drops it from token_cache
         request.user.auth_token.delete()
         return Response(status=status.HTTP_200_OK)
 
@@ -110,11 +130,18 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user
+        # request.user can be a cached snapshot; a save from it would write
+        # back stale columns
+        return User.objects.get(pk=self.request.user.pk)
 
 # Dealer Views
 class DealerListView(generics.ListAPIView):
-    queryset = Dealer.objects.all()
+    query_budget = 2
+    queryset = Dealer.objects.select_related('user').annotate(
+        published_car_count=Count('cars', filter=Q(cars__published=True))
+    )
     serializer_class = DealerSerializer
     permission_classes = [AllowAny]
     filter_backends = [filters.SearchFilter]
@@ -128,7 +155,8 @@ class DealerCreateView(generics.CreateAPIView):
         # Only users with DEALER role can create dealer profiles
         if self.request.user.role != 'DEALER':
             self.request.user.role = 'DEALER'
-            self.request.user.save()
+            # Only the role: request.user can be a cached snapshot
+            self.request.user.save(update_fields=['role'])
         serializer.save(user=self.request.user)
 
 class DealerDetailView(generics.RetrieveUpdateAPIView):
@@ -152,7 +180,8 @@ class BuyerCreateView(generics.CreateAPIView):
         # Only users with BUYER role can create buyer profiles
         if self.request.user.role != 'BUYER':
             self.request.user.role = 'BUYER'
-            self.request.user.save()
+            # Only the role: request.user can be a cached snapshot
+            self.request.user.save(update_fields=['role'])
         serializer.save(user=self.request.user)
 
 class BuyerDetailView(generics.RetrieveUpdateAPIView):
@@ -164,8 +193,12 @@ class BuyerDetailView(generics.RetrieveUpdateAPIView):
         return get_object_or_404(Buyer, user=self.request.user)
 
 # Category Views
-class CategoryListView(generics.ListAPIView):
-    queryset = Category.objects.all()
+class CategoryListView(CachedResponseMixin, generics.ListAPIView):
+    query_budget = 2
+    cache_namespaces = ('category', 'car')
+    queryset = Category.objects.annotate(
+        published_car_count=Count('car', filter=Q(car__published=True))
+    )
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
 
@@ -175,21 +208,15 @@ class CategoryCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAdminUser]
 
 # Car Views - Main CRUD Operations
-class CarListCreateView(generics.ListCreateAPIView):
-    """
-    GET /cars/ → list all cars (for buyers)
-    POST /cars/ → create car (for dealers)
-    """
-    permission_classes = [IsDealerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+class CarFilterMixin:
+    """Filters, search and ordering shared by the car list and exports"""
+    filter_backends = [DjangoFilterBackend, CarSearchFilter, RankedOrderingFilter]
     filterset_fields = ['make', 'model', 'year', 'transmission', 'fuel_type', 'category']
     search_fields = ['title', 'make', 'model', 'location', 'description']
-    ordering_fields = ['price', 'year', 'created_at', 'mileage']
+    ordering_fields = ['price', 'year', 'created_at', 'mileage', 'rating_average', 'rating_count']
     ordering = ['-created_at']
 
-    def get_queryset(self):
-        queryset = Car.objects.filter(published=True)
-        
+    def filter_ranges(self, queryset):
         # Filter by price range
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
@@ -206,7 +233,27 @@ class CarListCreateView(generics.ListCreateAPIView):
         if max_year:
             queryset = queryset.filter(year__lte=max_year)
             
-        return queryset.select_related('dealer', 'category').prefetch_related('images', 'reviews', 'dealer__cars')
+        return queryset
+
+
+class CarListCreateView(CachedResponseMixin, ConditionalGetMixin, SparseFieldsetMixin, CarFilterMixin, generics.ListCreateAPIView):
+    """
+    GET /cars/ → list all cars (for buyers)
+    POST /cars/ → create car (for dealers)
+    """
+    query_budget = 8
+    cache_namespaces = ('car', 'image', 'review', 'category', 'dealer')
+    validate_favorites = True
+    validator_relations = ('dealer', 'category')
+    permission_classes = [IsDealerOrReadOnly]
+    pagination_class = ListingPagination
+
+    def get_queryset(self):
+        queryset = self.filter_ranges(Car.objects.filter(published=True))
+        return queryset.with_listing_annotations(self.fieldset)
+
+    def get_validator_queryset(self):
+        return self.filter_queryset(self.filter_ranges(Car.objects.filter(published=True)))
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -220,17 +267,21 @@ class CarListCreateView(generics.ListCreateAPIView):
             raise ValidationError({'error': 'You must create a dealer profile first'})
         serializer.save(dealer=self.request.user.dealer_profile)
 
-class CarDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CarDetailView(CachedResponseMixin, ConditionalGetMixin, SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     GET /cars/<id>/ → retrieve car (for buyers)
     PUT /cars/<id>/ → update car (for dealers)
     DELETE /cars/<id>/ → delete car (for dealers)
     """
+    query_budget = 8
+    cache_namespaces = ('car', 'image', 'review', 'category', 'dealer')
+    validate_favorites = True
+    validator_relations = ('dealer', 'category')
     queryset = Car.objects.all()
     permission_classes = [IsDealerOrReadOnly]
 
     def get_queryset(self):
-        return Car.objects.select_related('dealer', 'category').prefetch_related('images', 'reviews__user')
+        return Car.objects.with_detail_relations(self.fieldset)
 
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
@@ -248,18 +299,67 @@ class CarDetailView(generics.RetrieveUpdateDestroyAPIView):
         return obj
 
 # Dealer's Car Management Views
-class DealerCarListView(generics.ListAPIView):
+class DealerCarListView(SparseFieldsetMixin, generics.ListAPIView):
     """List all cars for authenticated dealer"""
+    query_budget = 5
     serializer_class = DealerCarListSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         if not hasattr(self.request.user, 'dealer_profile'):
             return Car.objects.none()
-        return Car.objects.filter(dealer=self.request.user.dealer_profile).select_related('category').prefetch_related('images')
+        queryset = Car.objects.filter(dealer=self.request.user.dealer_profile)
+        if self.fieldset.expands('category'):
+            queryset = queryset.with_category_counts()
+        if self.fieldset.includes('images'):
+            queryset = queryset.prefetch_related('images')
+        return queryset
+
+class CarExportView(CarFilterMixin, generics.GenericAPIView):
+    """
+    GET /cars/export/?format=csv|ndjson → stream the published catalog,
+    with the same filters as the car list
+    """
+    permission_classes = [AllowAny]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+    export_filename = 'cars'
+
+    def get_queryset(self):
+        return self.filter_ranges(Car.objects.filter(published=True))
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(request, queryset, request.accepted_renderer.format, self.export_filename)
+
+class CarFacetView(CarFilterMixin, generics.GenericAPIView):
+    """
+    GET /cars/facets/ → counts per make, model, fuel type, transmission,
+    category, year and price bucket for the current filters
+    """
+    query_budget = 1
+    permission_classes = [AllowAny]
+
+    def get_queryset(self):
+        return self.filter_ranges(Car.objects.filter(published=True))
+
+    def get(self, request, *args, **kwargs):
+        return Response(compute_facets(self.filter_queryset(self.get_queryset())))
+
+class DealerCarExportView(CarExportView):
+    """Stream every car of the authenticated dealer, published or not"""
+    permission_classes = [IsAuthenticated]
+    export_filename = 'inventory'
+
+    def get_queryset(self):
+        if not hasattr(self.request.user, 'dealer_profile'):
+            return Car.objects.none()
+        return self.filter_ranges(Car.objects.filter(dealer=self.request.user.dealer_profile))
 
 class DealerCarCreateView(generics.CreateAPIView):
     """Create a new car listing for authenticated dealer"""
+    # Category lookup, insert, search index (2), dealer and category touch
+    # (2), dealership rollups (4) and the images of the response
+    query_budget = 11
     serializer_class = CarCreateUpdateSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = [parsers.MultiPartParser, parsers.JSONParser]
@@ -274,6 +374,7 @@ class DealerCarCreateView(generics.CreateAPIView):
 
 class DealerCarDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a specific car for authenticated dealer"""
+    query_budget = 9
     serializer_class = CarDetailSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = [parsers.MultiPartParser, parsers.JSONParser]
@@ -281,7 +382,7 @@ class DealerCarDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         if not hasattr(self.request.user, 'dealer_profile'):
             return Car.objects.none()
-        return Car.objects.filter(dealer=self.request.user.dealer_profile).select_related('dealer', 'category').prefetch_related('images', 'reviews__user')
+        return Car.objects.filter(dealer=self.request.user.dealer_profile).select_related('dealer', 'category').prefetch_related('images').with_latest_reviews()
 
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
@@ -303,6 +404,10 @@ class DealerCarDetailView(generics.RetrieveUpdateDestroyAPIView):
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         
+        if getattr(instance, '_prefetched_objects_cache', None):
+            # Drop the prefetched images so newly staged ones are listed
+            instance._prefetched_objects_cache = {}
+        
         # Return the updated instance using the detail serializer
         detail_serializer = CarDetailSerializer(instance, context={'request': request})
         return Response(detail_serializer.data)
@@ -310,10 +415,13 @@ class DealerCarDetailView(generics.RetrieveUpdateDestroyAPIView):
 # Review Views
 class CarReviewListView(generics.ListAPIView):
     """
-    GET /cars/<car_id>/reviews/ → list reviews for a specific car
+    GET /cars/<car_id>/reviews/ → list reviews for a specific car, newest
+    first, paged by cursor
     """
+    query_budget = 2
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         car_id = self.kwargs['car_id']
@@ -323,6 +431,7 @@ class CarReviewCreateView(generics.CreateAPIView):
     """
     POST /cars/<car_id>/reviews/create/ → create review for a specific car
     """
+    query_budget = 8
     serializer_class = ReviewCreateSerializer
     permission_classes = [IsAuthenticated]
 
@@ -358,6 +467,7 @@ class CarReviewCreateView(generics.CreateAPIView):
 
 class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Update/Delete own reviews"""
+    query_budget = 7
     queryset = Review.objects.all()
     serializer_class = ReviewCreateSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
@@ -368,10 +478,14 @@ class FavoriteListCreateView(generics.ListCreateAPIView):
     GET /favorites/ → list user's favorites
     POST /favorites/ → add to favorites
     """
+    query_budget = 6
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user).select_related('car')
+        # Nested cars are rendered by CarListSerializer; load them the way the feed does
+        return Favorite.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('car', queryset=Car.objects.with_listing_annotations())
+        )
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -386,6 +500,7 @@ class FavoriteDetailView(generics.DestroyAPIView):
         return Favorite.objects.filter(user=self.request.user)
 
 # Additional API Views
+@query_budget(5)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def toggle_favorite(request, car_id):
@@ -418,6 +533,7 @@ def car_stats(request):
     }
     return Response(stats)
 
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def search_suggestions(request):
@@ -426,51 +542,50 @@ def search_suggestions(request):
     if len(query) < 2:
         return Response([])
     
-    suggestions = []
-    
-    # Make suggestions
-    makes = Car.objects.filter(
-        make__icontains=query, published=True
-    ).values_list('make', flat=True).distinct()[:5]
+    # Answered from the in-process prefix index, without touching the database
+    matches = suggestion_index.suggest(query)
     
-    # Model suggestions
-    models = Car.objects.filter(
-        model__icontains=query, published=True
-    ).values_list('model', flat=True).distinct()[:5]
-    
-    # Location suggestions
-    locations = Car.objects.filter(
-        location__icontains=query, published=True
-    ).values_list('location', flat=True).distinct()[:5]
-    
-    suggestions.extend([{'type': 'make', 'value': make} for make in makes])
-    suggestions.extend([{'type': 'model', 'value': model} for model in models])
-    suggestions.extend([{'type': 'location', 'value': location} for location in locations])
+    suggestions = []
+    suggestions.extend([{'type': 'make', 'value': make} for make in matches['make']])
+    suggestions.extend([{'type': 'model', 'value': model} for model in matches['model']])
+    suggestions.extend([{'type': 'location', 'value': location} for location in matches['location']])
     
     return Response(suggestions[:10])
 
 # Dealership Views
-class DealershipListView(generics.ListAPIView):
+class DealershipListView(CachedResponseMixin, ConditionalGetMixin, generics.ListAPIView):
     """List all published dealerships for public viewing"""
+    query_budget = 3
+    cache_namespaces = ('dealership', 'dealer')
+    validator_relations = ('dealer',)
     queryset = Dealership.objects.filter(published=True)
     serializer_class = DealershipSerializer
     permission_classes = [AllowAny]
+    pagination_class = ListingPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = {
+        'is_verified': ['exact'],
+        'total_cars': ['gte', 'lte'],
+        'average_rating': ['gte', 'lte'],
+    }
     search_fields = ['name', 'description', 'specialties']
     ordering_fields = ['name', 'created_at', 'total_cars', 'average_rating']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return Dealership.objects.filter(published=True).select_related('dealer__user').prefetch_related('dealer__cars')
+        return Dealership.objects.filter(published=True).select_related('dealer__user')
 
-class DealershipDetailView(generics.RetrieveAPIView):
+class DealershipDetailView(CachedResponseMixin, ConditionalGetMixin, generics.RetrieveAPIView):
     """Get specific dealership details"""
+    query_budget = 2
+    cache_namespaces = ('dealership', 'dealer')
+    validator_relations = ('dealer',)
     queryset = Dealership.objects.all()
     serializer_class = DealershipSerializer
     permission_classes = [AllowAny]
 
     def get_queryset(self):
-        return Dealership.objects.select_related('dealer__user').prefetch_related('dealer__cars')
+        return Dealership.objects.select_related('dealer__user')
 
 class DealershipCreateView(generics.CreateAPIView):
     """Create dealership profile for authenticated dealer"""
@@ -560,7 +675,17 @@ def bulk_toggle_car_publish(request):
         
         # Update cars
         published_status = action == 'publish'
-        updated_count = cars.update(published=published_status)
+        now = timezone.now()
+        with transaction.atomic():
+            category_ids = set(cars.exclude(category=None).values_list('category_id', flat=True))
+            updated_count = cars.update(published=published_status, updated_at=now)
+            # update() skips the save signals that keep these current, and
+            # the ETags of the dealer's and categories' car counts
+            refresh_dealership_rollups([dealer.id])
+            Dealer.objects.filter(pk=dealer.pk).update(updated_at=now)
+            Category.objects.filter(pk__in=category_ids).update(updated_at=now)
+        suggestion_index.invalidate()
+        response_cache.bump_on_commit('car')
         
         return Response({
             'message': f'{updated_count} cars {"published" if published_status else "unpublished"} successfully',
@@ -570,21 +695,37 @@ def bulk_toggle_car_publish(request):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([CSVStreamParser, NDJSONStreamParser, parsers.MultiPartParser])
+def import_dealer_cars(request):
+    """
+    Bulk create or update the dealer's cars from CSV or NDJSON, matched on
+    stock_number. Send the file as the request body (text/csv or
+    application/x-ndjson) or as a multipart "file" field.
+    """
+    if not hasattr(request.user, 'dealer_profile'):
+        return Response({'error': 'Dealer profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.content_type.startswith('multipart/'):
+        stream = request.FILES.get('file')
+        name = getattr(stream, 'name', '') or ''
+        import_format = request.data.get('format') or ('ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv')
+    else:
+        stream = request.data
+        import_format = 'csv' if request.content_type.startswith(CSVStreamParser.media_type) else 'ndjson'
+    
+    if not stream:
+        return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+    if import_format not in IMPORT_FORMATS:
+        return Response({'error': f'format must be one of {", ".join(IMPORT_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    report = import_cars(request.user.dealer_profile, stream, import_format)
+    return Response(report)
+
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def dealership_stats(request):
     """Get dealership statistics"""
-    stats = {
-        'total_dealerships': Dealership.objects.count(),
-        'verified_dealerships': Dealership.objects.filter(is_verified=True).count(),
-        'published_dealerships': Dealership.objects.filter(published=True).count(),
-        'total_cars_listed': sum(dealership.total_cars for dealership in Dealership.objects.all()),
-        'average_rating': Dealership.objects.aggregate(
-            avg_rating=Avg('dealer__cars__reviews__rating')
-        )['avg_rating'] or 0,
-        'specialties': list(set([
-            specialty for dealership in Dealership.objects.all() 
-            for specialty in dealership.specialties
-        ])),
-    }
-    return Response(stats)
+    return Response(get_dealership_stats())